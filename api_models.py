@@ -4,11 +4,17 @@ Pydantic 資料模型定義
 用於 API 請求和響應的資料驗證和序列化
 """
 
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError, validator
+from pydantic.error_wrappers import ErrorWrapper
 from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
+import base64
+import binascii
+import io
 import re
 
+import numpy as np
+
 # ==================== 通用模型 ====================
 
 class BaseResponse(BaseModel):
@@ -76,7 +82,7 @@ class MilvusSchemaInfo(BaseModel):
 class MilvusCollectionInfo(BaseModel):
     """Milvus 集合信息模型"""
     name: str = Field(..., description="集合名稱")
-    schema: MilvusSchemaInfo = Field(..., description="集合架構")
+    schema_info: MilvusSchemaInfo = Field(..., alias="schema", description="集合架構")
     num_entities: int = Field(..., description="實體數量")
     is_empty: bool = Field(..., description="是否為空")
     compaction_state: str = Field(..., description="壓縮狀態")
@@ -88,26 +94,97 @@ class MilvusDataResponse(BaseModel):
     returned_count: int = Field(..., description="返回記錄數")
     data: List[Dict[str, Any]] = Field(..., description="數據內容")
 
+def check_query_matrix(matrix: np.ndarray) -> np.ndarray:
+    """檢查查詢矩陣的形狀和數值，一維數組視為單個向量"""
+    if matrix.ndim == 1 and matrix.size:
+        matrix = matrix[None, :]
+    if matrix.ndim != 2 or matrix.shape[0] == 0 or matrix.shape[1] == 0:
+        raise ValueError('查詢向量不能為空，且必須是 (向量數, 維度) 的二維數組')
+    if not np.isfinite(matrix).all():
+        raise ValueError('查詢向量包含 NaN 或無窮大')
+    return np.ascontiguousarray(matrix, dtype=np.float32)
+
+def decode_query_vectors(vectors: Optional[List[Any]], vectors_b64: Optional[str], dim: Optional[int]) -> np.ndarray:
+    """將 JSON 數組或 base64 編碼的 float32 緩衝區轉換為 float32 矩陣"""
+    if (vectors is None) == (vectors_b64 is None):
+        raise ValueError('請提供 vectors 或 vectors_b64 其中之一')
+    
+    if vectors_b64 is not None:
+        if not dim:
+            raise ValueError('使用 vectors_b64 時必須指定 dim')
+        try:
+            raw = base64.b64decode(vectors_b64, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError('vectors_b64 不是有效的 base64 編碼')
+        if not raw or len(raw) % (4 * dim):
+            raise ValueError(f'緩衝區長度 {len(raw)} 不是 4 × dim ({4 * dim}) 的整數倍')
+        return check_query_matrix(np.frombuffer(raw, dtype='<f4').reshape(-1, dim))
+    
+    try:
+        matrix = np.asarray(vectors, dtype=np.float32)
+    except (ValueError, TypeError):
+        raise ValueError('查詢向量必須是維度一致的數值數組')
+    return check_query_matrix(matrix)
+
+def decode_npy(body: bytes) -> np.ndarray:
+    """解析 .npy 文件內容（不允許 pickle）"""
+    try:
+        matrix = np.load(io.BytesIO(body), allow_pickle=False)
+    except (ValueError, OSError, EOFError):
+        raise ValueError('請求內容不是有效的 .npy 文件')
+    if not isinstance(matrix, np.ndarray) or matrix.dtype.kind not in 'fiu':
+        raise ValueError('.npy 文件必須是數值數組')
+    return check_query_matrix(matrix.astype(np.float32, copy=False))
+
 class MilvusSearchRequest(BaseModel):
-    """Milvus 搜索請求模型"""
-    collection_name: str = Field(..., description="集合名稱")
-    vectors: List[List[float]] = Field(..., description="查詢向量")
+    """Milvus 搜索請求模型
+    
+    查詢向量可以用 JSON 數組（vectors）或 base64 編碼的 little-endian float32 緩衝區
+    （vectors_b64 + dim）提交，也可以通過 from_npy 從 .npy 請求體創建。
+    向量在構造時一次性轉換為 NumPy 矩陣並檢查形狀，之後通過 query_matrix 讀取。
+    """
+    collection_name: Optional[str] = Field(None, description="集合名稱（以路徑參數為準）")
+    vectors: Optional[List[Any]] = Field(None, description="查詢向量（JSON 數組）")
+    vectors_b64: Optional[str] = Field(None, description="base64 編碼的 float32 緩衝區，按行存放所有查詢向量")
+    dim: Optional[int] = Field(None, ge=1, le=32768, description="vectors_b64 中每個向量的維度")
     limit: int = Field(10, ge=1, le=1000, description="返回結果數量限制")
     search_params: Optional[Dict[str, Any]] = Field(None, description="搜索參數")
+    batch_size: Optional[int] = Field(None, ge=1, le=16384, description="每次發送給 Milvus 的查詢向量數")
+    layout: Optional[str] = Field(None, description="結果佈局：rows（默認）、columns 或 arrow")
     
-    @validator('vectors')
-    def validate_vectors(cls, v):
-        if not v or len(v) == 0:
-            raise ValueError('查詢向量不能為空')
-        
-        # 檢查所有向量維度是否一致
-        if len(v) > 1:
-            first_dim = len(v[0])
-            for i, vec in enumerate(v[1:], 1):
-                if len(vec) != first_dim:
-                    raise ValueError(f'向量 {i} 的維度與第一個向量不一致')
-        
+    @validator('layout')
+    def validate_layout(cls, v):
+        if v is not None and v not in ('rows', 'columns', 'arrow'):
+            raise ValueError('layout 必須是 rows、columns 或 arrow')
         return v
+    
+    _matrix: Any = PrivateAttr(None)
+    
+    def __init__(self, query_matrix: Optional[np.ndarray] = None, **data):
+        super().__init__(**data)
+        try:
+            if query_matrix is None:
+                query_matrix = decode_query_vectors(self.vectors, self.vectors_b64, self.dim)
+        except ValueError as e:
+            raise ValidationError([ErrorWrapper(e, loc='vectors')], type(self))
+        self._matrix = query_matrix
+        # 轉換後不再保留原始的 Python 列表和 base64 文本
+        self.vectors = None
+        self.vectors_b64 = None
+    
+    @classmethod
+    def from_npy(cls, body: bytes, **params) -> 'MilvusSearchRequest':
+        """從 .npy 請求體和查詢參數創建請求"""
+        try:
+            matrix = decode_npy(body)
+        except ValueError as e:
+            raise ValidationError([ErrorWrapper(e, loc='body')], cls)
+        return cls(query_matrix=matrix, **params)
+    
+    @property
+    def query_matrix(self) -> np.ndarray:
+        """(向量數, 維度) 的 float32 查詢矩陣"""
+        return self._matrix
 
 class MilvusSearchResponse(BaseModel):
     """Milvus 搜索響應模型"""
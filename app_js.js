@@ -9,25 +9,46 @@ const CONFIG = {
         MILVUS: {
             CONNECT: '/milvus/connect',
             COLLECTIONS: '/milvus/collections',
+            OVERVIEW: '/milvus/overview',
             COLLECTION_INFO: '/milvus/collection',
             COLLECTION_DATA: '/milvus/collection'
         },
         DUCKDB: {
             UPLOAD: '/duckdb/upload',
+            UPLOADS: '/duckdb/uploads',
             TABLES: '/duckdb/tables',
             TABLE_INFO: '/duckdb/table',
             TABLE_DATA: '/duckdb/table',
+            TABLE_ROWS: '/duckdb/table',
             QUERY: '/duckdb/query'
         },
         HEALTH: '/health'
     }
 };
 
+// 虛擬滾動表格配置
+const VIRTUAL_TABLE = {
+    ROW_HEIGHT: 40,              // 每行固定高度（像素）
+    HEADER_HEIGHT: 48,           // 表頭高度（像素）
+    VIEWPORT_HEIGHT: 600,        // 可視區域高度（像素）
+    PAGE_SIZE: 200,              // 每次請求的行數
+    MAX_CACHED_PAGES: 50,        // 最多緩存的頁數
+    MAX_SCROLL_HEIGHT: 10000000  // 滾動區域高度上限，超過時按比例縮放
+};
+
+// 超過此大小的文件使用分塊上傳，中途失敗的塊會從已接收的位置重試
+const CHUNKED_UPLOAD = {
+    THRESHOLD: 64 * 1024 * 1024,
+    MAX_RETRIES: 3
+};
+
 // 應用程序狀態
 const AppState = {
     currentView: 'milvus',
     milvusConnected: false,
     duckdbLoaded: false,
+    duckdbId: null,      // 當前上傳的數據庫 id，為空時使用服務端的當前數據庫
+    collectionOverview: {},  // 集合名 -> 概覽信息（架構、實體數、索引類型、載入狀態）
     loading: false
 };
 
@@ -168,6 +189,15 @@ async function makeRequest(url, options = {}) {
     }
 }
 
+// 為 DuckDB 請求附加數據庫 id
+function withDatabase(url) {
+    if (!AppState.duckdbId) {
+        return url;
+    }
+    const separator = url.includes('?') ? '&' : '?';
+    return `${url}${separator}db_id=${encodeURIComponent(AppState.duckdbId)}`;
+}
+
 // 檢查應用程序健康狀態
 async function checkApplicationHealth() {
     try {
@@ -271,16 +301,21 @@ async function loadCollections() {
     
     showLoading();
     try {
-        const result = await makeRequest(CONFIG.ENDPOINTS.MILVUS.COLLECTIONS);
+        // 概覽一次返回所有集合的架構和實體數，查看集合信息時無需再逐個請求
+        const result = await makeRequest(CONFIG.ENDPOINTS.MILVUS.OVERVIEW);
+        AppState.collectionOverview = {};
         
         if (Elements.collectionSelect) {
             Elements.collectionSelect.innerHTML = '<option value="">選擇一個集合</option>';
             
             if (result.collections && result.collections.length > 0) {
                 result.collections.forEach(collection => {
+                    AppState.collectionOverview[collection.name] = collection;
                     const option = document.createElement('option');
-                    option.value = collection;
-                    option.textContent = collection;
+                    option.value = collection.name;
+                    option.textContent = collection.error
+                        ? collection.name
+                        : `${collection.name} (${collection.num_entities} 條，${collection.index_type || '無索引'})`;
                     Elements.collectionSelect.appendChild(option);
                 });
                 showSuccess(`成功載入 ${result.collections.length} 個集合`);
@@ -306,7 +341,10 @@ async function viewCollectionInfo() {
 
     showLoading();
     try {
-        const result = await makeRequest(`${CONFIG.ENDPOINTS.MILVUS.COLLECTION_INFO}/${collectionName}/info`);
+        const cached = AppState.collectionOverview[collectionName];
+        const result = cached && !cached.error
+            ? { ...cached, schema: { description: cached.description, fields: cached.fields } }
+            : await makeRequest(`${CONFIG.ENDPOINTS.MILVUS.COLLECTION_INFO}/${collectionName}/info`);
         
         if (Elements.milvusData) {
             Elements.milvusData.innerHTML = `
@@ -321,6 +359,13 @@ async function viewCollectionInfo() {
                     <div class="info-item">
                         <strong>是否為空:</strong> ${result.is_empty ? '是' : '否'}
                     </div>
+                    ${result.load_state ? `
+                    <div class="info-item">
+                        <strong>索引類型:</strong> ${result.index_type || '無索引'}
+                    </div>
+                    <div class="info-item">
+                        <strong>載入狀態:</strong> ${result.load_state}
+                    </div>` : ''}
                 </div>
                 <h5>字段信息:</h5>
                 <div class="table-container">
@@ -411,24 +456,32 @@ async function uploadDuckDB() {
         return;
     }
 
-    const formData = new FormData();
-    formData.append('file', file);
-
     showLoading();
     try {
-        const response = await fetch(`${CONFIG.API_BASE}${CONFIG.ENDPOINTS.DUCKDB.UPLOAD}`, {
-            method: 'POST',
-            body: formData
-        });
-        
-        if (!response.ok) {
-            const error = await response.json();
-            throw new Error(error.detail || '上傳失敗');
+        let result;
+        if (file.size > CHUNKED_UPLOAD.THRESHOLD) {
+            result = await uploadInChunks(file);
+        } else {
+            const formData = new FormData();
+            formData.append('file', file);
+            
+            const response = await fetch(`${CONFIG.API_BASE}${CONFIG.ENDPOINTS.DUCKDB.UPLOAD}`, {
+                method: 'POST',
+                body: formData
+            });
+            
+            if (!response.ok) {
+                const error = await response.json();
+                throw new Error(error.detail || '上傳失敗');
+            }
+            result = await response.json();
         }
         
-        const result = await response.json();
         AppState.duckdbLoaded = true;
-        showSuccess(`文件上傳成功！包含 ${result.tables_count} 個表格`);
+        AppState.duckdbId = result.db_id || null;
+        showSuccess(result.deduplicated
+            ? `文件與已上傳的數據庫相同，已直接切換！包含 ${result.tables_count} 個表格`
+            : `文件上傳成功！包含 ${result.tables_count} 個表格`);
         
         // 自動載入表格列表
         setTimeout(loadTables, 1000);
@@ -441,6 +494,44 @@ async function uploadDuckDB() {
     }
 }
 
+// 分塊上傳大文件：創建會話後按服務器建議的塊大小依次 PUT，失敗時查詢已接收的位置後重試
+async function uploadInChunks(file) {
+    const uploads = CONFIG.ENDPOINTS.DUCKDB.UPLOADS;
+    const session = await makeRequest(uploads, {
+        method: 'POST',
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    const uploadUrl = `${CONFIG.API_BASE}${uploads}/${session.upload_id}`;
+    
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+        const end = Math.min(offset + session.chunk_size, file.size);
+        const response = await fetch(`${uploadUrl}?offset=${offset}`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: file.slice(offset, end)
+        }).catch(() => null);
+        
+        if (response && response.ok) {
+            offset = (await response.json()).received;
+            retries = 0;
+            continue;
+        }
+        if (response && response.status !== 409) {
+            const error = await response.json();
+            throw new Error(error.detail || '上傳失敗');
+        }
+        if (++retries > CHUNKED_UPLOAD.MAX_RETRIES) {
+            throw new Error('上傳中斷，請稍後重試');
+        }
+        // 連接中斷或偏移量不一致時以服務器已接收的位元組數為準
+        offset = (await makeRequest(`${uploads}/${session.upload_id}`)).received;
+    }
+    
+    return makeRequest(`${uploads}/${session.upload_id}/complete`, { method: 'POST' });
+}
+
 // 載入表格列表
 async function loadTables() {
     if (!AppState.duckdbLoaded) {
@@ -449,7 +540,7 @@ async function loadTables() {
     }
     
     try {
-        const result = await makeRequest(CONFIG.ENDPOINTS.DUCKDB.TABLES);
+        const result = await makeRequest(withDatabase(CONFIG.ENDPOINTS.DUCKDB.TABLES));
         
         if (Elements.tableSelect) {
             Elements.tableSelect.innerHTML = '<option value="">選擇一個表格</option>';
@@ -482,8 +573,10 @@ async function viewTableData() {
 
     showLoading();
     try {
-        const result = await makeRequest(`${CONFIG.ENDPOINTS.DUCKDB.TABLE_DATA}/${tableName}/data?limit=100`);
-        displayDuckDBResults(result.data, `表格數據：${tableName}`, result.total_count);
+        const firstPage = await makeRequest(withDatabase(
+            `${CONFIG.ENDPOINTS.DUCKDB.TABLE_ROWS}/${tableName}/rows?start=0&count=${VIRTUAL_TABLE.PAGE_SIZE}&include_extent=true`
+        ));
+        renderVirtualTable(tableName, firstPage);
         
     } catch (error) {
         showError(`獲取表格數據失敗：${error.message}`);
@@ -509,7 +602,7 @@ async function executeSQLQuery() {
     try {
         const result = await makeRequest(CONFIG.ENDPOINTS.DUCKDB.QUERY, {
             method: 'POST',
-            body: JSON.stringify({ query: sqlQuery })
+            body: JSON.stringify({ query: sqlQuery, db_id: AppState.duckdbId })
         });
         
         if (result.data) {
@@ -559,6 +652,7 @@ function displayDuckDBResults(data, title, totalCount = null) {
 
 // 清除結果
 function clearResults() {
+    activeVirtualTable = null;
     if (Elements.duckdbData) {
         Elements.duckdbData.innerHTML = '';
     }
@@ -589,20 +683,7 @@ function generateDataTable(data, title) {
     data.forEach(row => {
         tableHTML += '<tr>';
         columns.forEach(col => {
-            const value = row[col];
-            let displayValue;
-            
-            if (value === null || value === undefined) {
-                displayValue = '<span class="null-value">NULL</span>';
-            } else if (typeof value === 'object') {
-                displayValue = `<span class="json-value">${escapeHtml(JSON.stringify(value))}</span>`;
-            } else if (typeof value === 'string' && value.length > 100) {
-                displayValue = `<span class="long-text" title="${escapeHtml(value)}">${escapeHtml(value.substring(0, 100))}...</span>`;
-            } else {
-                displayValue = escapeHtml(String(value));
-            }
-            
-            tableHTML += `<td>${displayValue}</td>`;
+            tableHTML += `<td>${formatCellValue(row[col])}</td>`;
         });
         tableHTML += '</tr>';
     });
@@ -616,6 +697,181 @@ function generateDataTable(data, title) {
     return tableHTML;
 }
 
+// 格式化單元格內容
+function formatCellValue(value) {
+    if (value === null || value === undefined) {
+        return '<span class="null-value">NULL</span>';
+    } else if (typeof value === 'object') {
+        return `<span class="json-value">${escapeHtml(JSON.stringify(value))}</span>`;
+    } else if (typeof value === 'string' && value.length > 100) {
+        return `<span class="long-text" title="${escapeHtml(value)}">${escapeHtml(value.substring(0, 100))}...</span>`;
+    }
+    return escapeHtml(String(value));
+}
+
+// ==================== 虛擬滾動表格 ====================
+
+// 當前顯示的虛擬表格狀態
+let activeVirtualTable = null;
+
+// 渲染虛擬滾動表格，只請求可見範圍內的行
+function renderVirtualTable(tableName, firstPage) {
+    if (!Elements.duckdbData) return;
+    
+    const extent = firstPage.row_extent || 0;
+    if (extent === 0 || !firstPage.rows || firstPage.rows.length === 0) {
+        activeVirtualTable = null;
+        displayDuckDBResults([], `表格數據：${tableName}`);
+        return;
+    }
+    
+    // 行數過多時按比例縮放滾動區域，避免超過瀏覽器元素高度上限
+    const fullHeight = extent * VIRTUAL_TABLE.ROW_HEIGHT;
+    const scale = Math.max(1, fullHeight / VIRTUAL_TABLE.MAX_SCROLL_HEIGHT);
+    
+    Elements.duckdbData.innerHTML = `
+        <div class="data-summary">
+            <h4>表格數據：${escapeHtml(tableName)}</h4>
+            <p>共 ${extent} 行，滾動時按需載入</p>
+        </div>
+        <div class="table-container virtual-table-container" style="height: ${VIRTUAL_TABLE.VIEWPORT_HEIGHT}px">
+            <div class="virtual-table-spacer" style="height: ${fullHeight / scale}px"></div>
+            <div class="virtual-table-window">
+                <table class="data-table">
+                    <thead>
+                        <tr>
+                            ${firstPage.columns.map(col => `<th>${escapeHtml(col)}</th>`).join('')}
+                        </tr>
+                    </thead>
+                    <tbody></tbody>
+                </table>
+            </div>
+        </div>
+    `;
+    
+    const container = Elements.duckdbData.querySelector('.virtual-table-container');
+    const state = {
+        tableName,
+        columns: firstPage.columns,
+        extent,
+        scale,
+        container,
+        window: container.querySelector('.virtual-table-window'),
+        tbody: container.querySelector('tbody'),
+        pages: new Map(),
+        pending: new Set(),
+        renderScheduled: false
+    };
+    state.loadMissingPages = debounce(() => loadVisibleVirtualPages(state), 100);
+    
+    storeVirtualPage(state, 0, firstPage);
+    activeVirtualTable = state;
+    
+    container.addEventListener('scroll', () => scheduleVirtualRender(state));
+    renderVirtualRows(state);
+}
+
+// 計算當前可見的行位置範圍
+function visibleVirtualRange(state) {
+    const visibleCount = Math.floor(
+        (state.container.clientHeight - VIRTUAL_TABLE.HEADER_HEIGHT) / VIRTUAL_TABLE.ROW_HEIGHT
+    );
+    const maxFirst = Math.max(0, state.extent - visibleCount);
+    const first = Math.min(
+        Math.floor(state.container.scrollTop * state.scale / VIRTUAL_TABLE.ROW_HEIGHT),
+        maxFirst
+    );
+    return { first, last: Math.min(first + visibleCount, state.extent) };
+}
+
+// 每幀最多渲染一次
+function scheduleVirtualRender(state) {
+    if (state.renderScheduled) return;
+    state.renderScheduled = true;
+    requestAnimationFrame(() => {
+        state.renderScheduled = false;
+        renderVirtualRows(state);
+    });
+}
+
+// 渲染可見行，未載入的行先顯示佔位符
+function renderVirtualRows(state) {
+    if (activeVirtualTable !== state) return;
+    
+    const { first, last } = visibleVirtualRange(state);
+    let missing = false;
+    let rowsHTML = '';
+    
+    for (let position = first; position < last; position++) {
+        const page = state.pages.get(Math.floor(position / VIRTUAL_TABLE.PAGE_SIZE));
+        if (!page) {
+            missing = true;
+            rowsHTML += `<tr class="virtual-row-loading"><td colspan="${state.columns.length}">載入中...</td></tr>`;
+            continue;
+        }
+        
+        const row = page.get(position);
+        if (!row) {
+            // row_extent 是估計行數，可能略大於實際行數
+            rowsHTML += `<tr class="virtual-row-gap"><td colspan="${state.columns.length}">-</td></tr>`;
+            continue;
+        }
+        rowsHTML += `<tr>${row.map(value => `<td>${formatCellValue(value)}</td>`).join('')}</tr>`;
+    }
+    
+    // 內容窗口始終固定在可視區域頂部
+    state.window.style.top = `${state.container.scrollTop}px`;
+    state.tbody.innerHTML = rowsHTML;
+    
+    if (missing) {
+        state.loadMissingPages();
+    }
+}
+
+// 載入可見範圍內缺少的頁
+function loadVisibleVirtualPages(state) {
+    if (activeVirtualTable !== state) return;
+    
+    const { first, last } = visibleVirtualRange(state);
+    const firstPage = Math.floor(first / VIRTUAL_TABLE.PAGE_SIZE);
+    const lastPage = Math.floor(Math.max(first, last - 1) / VIRTUAL_TABLE.PAGE_SIZE);
+    
+    for (let pageIndex = firstPage; pageIndex <= lastPage; pageIndex++) {
+        if (!state.pages.has(pageIndex) && !state.pending.has(pageIndex)) {
+            loadVirtualPage(state, pageIndex);
+        }
+    }
+}
+
+// 請求指定頁的數據
+async function loadVirtualPage(state, pageIndex) {
+    state.pending.add(pageIndex);
+    try {
+        const start = pageIndex * VIRTUAL_TABLE.PAGE_SIZE;
+        const result = await makeRequest(withDatabase(
+            `${CONFIG.ENDPOINTS.DUCKDB.TABLE_ROWS}/${state.tableName}/rows?start=${start}&count=${VIRTUAL_TABLE.PAGE_SIZE}`
+        ));
+        storeVirtualPage(state, pageIndex, result);
+        scheduleVirtualRender(state);
+    } catch (error) {
+        showError(`載入表格數據失敗：${error.message}`);
+    } finally {
+        state.pending.delete(pageIndex);
+    }
+}
+
+// 緩存一頁數據，超過上限時淘汰最早載入的頁
+function storeVirtualPage(state, pageIndex, result) {
+    const rowsByPosition = new Map();
+    result.positions.forEach((position, i) => rowsByPosition.set(position, result.rows[i]));
+    
+    state.pages.delete(pageIndex);
+    state.pages.set(pageIndex, rowsByPosition);
+    while (state.pages.size > VIRTUAL_TABLE.MAX_CACHED_PAGES) {
+        state.pages.delete(state.pages.keys().next().value);
+    }
+}
+
 // HTML 轉義函數
 function escapeHtml(text) {
     const div = document.createElement('div');
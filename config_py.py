@@ -8,17 +8,78 @@ class Settings(BaseSettings):
     # Milvus 設置
     milvus_host: str = "localhost"
     milvus_port: int = 19530
+    milvus_max_loaded_collections: int = 8  # 最多同時保持載入的集合數
+    milvus_load_memory_budget: int = 0  # 已載入集合的估計內存上限（位元組），0 表示不限制
+    milvus_load_state_ttl: float = 10.0  # 已載入的集合多少秒後重新向服務器確認載入狀態
+    milvus_export_batch_size: int = 1000  # 集合導出時每批讀取的實體數
+    snapshot_max_running_jobs: int = 2  # 同時運行的 Milvus 到 DuckDB 快照任務上限
+    milvus_search_batch_size: int = 256  # 每次發送給 Milvus 的查詢向量數
+    milvus_search_parallelism: int = 4  # 一個搜索請求同時執行的批次數
+    benchmark_report_dir: str = "./reports"  # 搜索參數基準測試報告目錄
+    pymilvus_preload: bool = True  # 啟動後在後台預先導入 pymilvus；不使用 Milvus 時可關閉
+    milvus_pool_size: int = 2  # 每個命名連接的 gRPC 通道數，搜索批次輪流使用
+    milvus_async_search: bool = True  # 使用 pymilvus 的異步搜索，一個線程同時保持多個批次在途
+    milvus_health_interval: float = 30.0  # 連接健康檢查間隔（秒），0 表示不檢查
+    milvus_reconnect_backoff: float = 1.0  # 連接失敗後首次重連的等待秒數，之後每次翻倍
+    milvus_reconnect_backoff_max: float = 60.0  # 重連等待的上限（秒）
+    milvus_overview_ttl: float = 30.0  # 集合概覽的緩存秒數，過期後返回舊結果並在後台刷新
+    milvus_overview_concurrency: int = 4  # 生成概覽時同時讀取的集合數
     
     # 服務器設置
     host: str = "0.0.0.0"
     port: int = 8000
     debug: bool = True
+    workers: int = 1  # 生產模式下的 worker 進程數，0 表示使用 CPU 核心數
+    state_db_path: str = "./uploads/state.sqlite3"  # 多個 worker 共享的目錄和會話狀態
     
     # 文件上傳設置
     max_file_size: int = 104857600  # 100MB
     upload_dir: str = "./uploads"
     temp_dir: str = "./temp"
-    
+    duckdb_catalog_path: str = "./uploads/catalog.json"  # 已註冊數據庫的目錄文件
+    upload_chunk_size: int = 8388608  # 8MB，上傳時每次寫入磁碟的塊大小
+    upload_session_ttl: int = 86400  # 分塊上傳會話無更新多少秒後刪除
+    data_dirs: List[str] = []  # 允許原地查詢的服務器本地數據目錄，留空表示禁用
+
+    # DuckDB 連接池設置
+    duckdb_pool_size: int = 8  # 每個數據庫文件同時可用的 cursor 數量
+    duckdb_threads: int = 0  # 0 表示使用 DuckDB 默認值
+    duckdb_memory_limit: str = ""  # 例如 "4GB"，留空使用 DuckDB 默認值
+    duckdb_pool_timeout: float = 30.0  # 等待可用 cursor 的秒數
+    duckdb_read_only: bool = False  # 以只讀方式打開數據庫，多個 worker 進程才能同時打開同一文件
+
+    # 數據庫執行器設置
+    duckdb_executor_workers: int = 8
+    milvus_executor_workers: int = 4
+    executor_queue_size: int = 64  # 每個執行器最多排隊的任務數
+
+    # 查詢時限設置
+    query_timeout: float = 60.0  # SQL 查詢的默認時限（秒），0 表示不限制
+    query_timeout_max: float = 600.0  # 請求可指定的最大時限（秒），0 表示不限制
+
+    # 異步 SQL 任務設置
+    sql_job_max_running: int = 2  # 同時運行的任務數，其餘任務排隊
+    sql_job_max_pending: int = 32  # 最多排隊的任務數
+    sql_job_timeout: float = 0  # 任務的默認時限（秒），0 表示不限制
+    sql_job_ttl: int = 3600  # 結束的任務及其結果文件保留的秒數
+    sql_job_max_inline_rows: int = 10000  # 不能寫入 Parquet 的結果（SHOW、多條語句等）最多保存的行數
+
+    # 流式輸出設置
+    stream_batch_size: int = 10000  # 每批從 DuckDB 讀取的行數
+
+    # DuckDB 向量搜索設置
+    vector_search_block_rows: int = 65536  # 每塊讀取的行數，內存佔用約為 塊行數 × 維度 × 4 × 線程數
+    vector_search_threads: int = 0  # 計算線程數，0 表示使用 CPU 核心數
+
+    # 查詢結果緩存設置
+    query_cache_enabled: bool = True
+    query_cache_memory_bytes: int = 67108864  # 64MB，超出後按 LRU 溢出到磁碟
+    query_cache_disk_bytes: int = 536870912  # 512MB
+
+    # 列分析設置
+    profile_sample_rows: int = 100000  # sampled 模式的樣本行數，行數不超過此值的表直接完整分析
+    profile_histogram_bins: int = 20  # 直方圖的默認分箱數
+
     # 日誌設置
     log_level: str = "INFO"
     log_file: str = "./logs/app.log"
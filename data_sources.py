@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+服務器本地數據文件的原地查詢
+DATA_DIRS 中的 Parquet、CSV 和 DuckDB 文件無需上傳複製即可註冊為數據庫：
+Parquet 和 CSV 通過 read_parquet / read_csv_auto 暴露為視圖，DuckDB 文件以 READ_ONLY 方式
+ATTACH，其中的表同樣以視圖暴露。視圖保存在上傳目錄下的一個小型 DuckDB 文件中，
+源文件只讀不寫，移除數據庫時只刪除該視圖文件。
+
+Parquet 文件的元數據（行數、行組數、列）按文件路徑、大小和修改時間緩存，瀏覽目錄時不必重複讀取文件尾。
+"""
+
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+
+import db_registry
+import duckdb_pool
+import metadata_cache
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+# 擴展名到文件格式
+FILE_FORMATS = {
+    ".parquet": "parquet",
+    ".csv": "csv",
+    ".duckdb": "duckdb",
+    ".db": "duckdb",
+}
+
+# 視圖讀取文件使用的表函數
+READERS = {
+    "parquet": "read_parquet",
+    "csv": "read_csv_auto",
+}
+
+
+class PathNotAllowedError(Exception):
+    """路徑不在 DATA_DIRS 允許的目錄中"""
+
+
+def _allowed_roots() -> List[str]:
+    return [os.path.realpath(directory) for directory in settings.data_dirs]
+
+
+def resolve_allowed_path(path: str) -> str:
+    """解析符號鏈接後的絕對路徑，必須位於某個允許的目錄之內"""
+    roots = _allowed_roots()
+    if not roots:
+        raise PathNotAllowedError("服務器未配置 DATA_DIRS，不能訪問本地文件")
+    real_path = os.path.realpath(path)
+    for root in roots:
+        if os.path.commonpath([real_path, root]) == root:
+            if not os.path.exists(real_path):
+                raise FileNotFoundError(f"路徑不存在: {path}")
+            return real_path
+    raise PathNotAllowedError(f"路徑不在允許的數據目錄中: {path}")
+
+
+def file_format(path: str) -> Optional[str]:
+    return FILE_FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _identifier(name: str) -> str:
+    """將文件名轉換為合法的視圖名或別名"""
+    name = re.sub(r"\W", "_", name).strip("_") or "data"
+    return f"_{name}" if name[0].isdigit() else name
+
+
+class ParquetMetadataCache:
+    """按 (路徑, 大小, 修改時間) 緩存的 Parquet 文件元數據"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, path: str) -> Dict[str, Any]:
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        source = _sql_string(path)
+        row_groups = conn.execute(
+            f"SELECT DISTINCT row_group_id, row_group_num_rows FROM parquet_metadata({source})"
+        ).fetchall()
+        columns = conn.execute(f"DESCRIBE SELECT * FROM read_parquet({source})").fetchall()
+        entry = {
+            "num_rows": sum(num_rows for _, num_rows in row_groups),
+            "num_row_groups": len(row_groups),
+            "columns": [{"name": column[0], "type": column[1]} for column in columns],
+        }
+
+        with self._lock:
+            # 同一文件只保留最新版本的元數據
+            for stale in [k for k in self._entries if k[0] == path]:
+                del self._entries[stale]
+            self._entries[key] = entry
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+parquet_metadata_cache = ParquetMetadataCache()
+
+
+def _scratch_cursor():
+    # 讀取文件元數據使用內存數據庫，不打開任何已註冊的數據庫
+    return duckdb_pool.get_pool(":memory:").cursor()
+
+
+def list_directory(directory: Optional[str] = None) -> Dict[str, Any]:
+    """列出允許的目錄；指定 directory 時列出其中的子目錄和支持的數據文件"""
+    if directory is None:
+        return {"directories": [root for root in _allowed_roots() if os.path.isdir(root)], "files": []}
+
+    directory = resolve_allowed_path(directory)
+    if not os.path.isdir(directory):
+        raise ValueError(f"不是目錄: {directory}")
+
+    directories = []
+    files = []
+    with _scratch_cursor() as conn:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                directories.append(path)
+                continue
+            fmt = file_format(path)
+            if fmt is None:
+                continue
+            try:
+                path = resolve_allowed_path(path)
+            except PathNotAllowedError:
+                continue
+            item: Dict[str, Any] = {"path": path, "format": fmt, "size": os.path.getsize(path)}
+            if fmt == "parquet":
+                try:
+                    item.update(parquet_metadata_cache.get(conn, path))
+                except Exception as e:
+                    item["error"] = str(e)
+            files.append(item)
+    return {"directory": directory, "directories": directories, "files": files}
+
+
+def collect_files(path: str) -> List[Tuple[str, str]]:
+    """返回要暴露的 (文件路徑, 格式) 列表；目錄只取第一層中支持的文件"""
+    if os.path.isfile(path):
+        fmt = file_format(path)
+        if fmt is None:
+            supported = ", ".join(FILE_FORMATS)
+            raise ValueError(f"不支持的文件格式，可選: {supported}")
+        return [(path, fmt)]
+
+    files = []
+    for name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, name)
+        fmt = file_format(file_path)
+        if fmt is None or not os.path.isfile(file_path):
+            continue
+        try:
+            files.append((resolve_allowed_path(file_path), fmt))
+        except PathNotAllowedError:
+            logger.warning(f"跳過指向允許目錄之外的文件: {file_path}")
+    if not files:
+        raise ValueError(f"目錄中沒有 Parquet、CSV 或 DuckDB 文件: {path}")
+    return files
+
+
+def attach_statements(attachments: Dict[str, str]) -> List[str]:
+    return [f"ATTACH {_sql_string(path)} AS {alias} (READ_ONLY)" for alias, path in attachments.items()]
+
+
+def build_views(views_path: str, files: List[Tuple[str, str]], prefix_attached: bool) -> Dict[str, Any]:
+    """在 views_path 中創建視圖，返回需要登記到註冊表的 attachments 和視圖列表
+
+    prefix_attached 為 True 時，附加數據庫中的表以 "別名_表名" 命名，避免多個文件的同名表衝突。
+    """
+    used = set()
+
+    def unique(name: str) -> str:
+        candidate, suffix = name, 2
+        while candidate.lower() in used:
+            candidate = f"{name}_{suffix}"
+            suffix += 1
+        used.add(candidate.lower())
+        return candidate
+
+    attachments = {
+        unique(f"src_{_identifier(os.path.splitext(os.path.basename(path))[0])}"): path
+        for path, fmt in files if fmt == "duckdb"
+    }
+    duckdb_pool.set_init_statements(views_path, attach_statements(attachments))
+
+    views = []
+    # 視圖文件是新建的，用單獨的讀寫連接寫入後關閉，之後由連接池（可能是只讀的）打開
+    with duckdb_pool.writable_connection(views_path) as conn:
+        for path, fmt in files:
+            if fmt == "duckdb":
+                continue
+            name = unique(_identifier(os.path.splitext(os.path.basename(path))[0]))
+            conn.execute(f'CREATE VIEW "{name}" AS SELECT * FROM {READERS[fmt]}({_sql_string(path)})')
+            views.append({"name": name, "path": path, "format": fmt})
+
+        for alias, path in attachments.items():
+            tables = conn.execute(
+                "SELECT schema_name, table_name FROM duckdb_tables() WHERE database_name = ? "
+                "UNION ALL SELECT schema_name, view_name FROM duckdb_views() "
+                "WHERE database_name = ? AND NOT internal",
+                [alias, alias]
+            ).fetchall()
+            for schema_name, table_name in tables:
+                base = f"{alias[len('src_'):]}_{table_name}" if prefix_attached else table_name
+                name = unique(_identifier(base))
+                try:
+                    conn.execute(f'CREATE VIEW "{name}" AS SELECT * FROM {alias}."{schema_name}"."{table_name}"')
+                except duckdb.Error as e:
+                    # 附加數據庫中無法綁定的視圖（例如引用了其他未附加的數據庫）不影響其餘的表
+                    used.discard(name.lower())
+                    logger.warning(f"跳過 {path} 中的 {schema_name}.{table_name}: {str(e)}")
+                    continue
+                views.append({"name": name, "path": path, "format": "duckdb"})
+        conn.execute("CHECKPOINT")
+
+    return {"attachments": attachments, "views": views}
+
+
+def restore(entry: Dict[str, Any]):
+    """為本地數據源登記 ATTACH 語句和緩存依賴，需在打開其連接池之前調用"""
+    attachments = entry.get("attachments") or {}
+    duckdb_pool.set_init_statements(entry["path"], attach_statements(attachments))
+    metadata_cache.metadata_cache.set_dependencies(
+        entry["path"], sorted({view["path"] for view in entry.get("views", [])} | set(attachments.values()))
+    )
+
+
+def register_source(path: str, name: Optional[str] = None) -> Dict[str, Any]:
+    """將允許目錄中的文件或目錄註冊為數據庫並設為當前數據庫"""
+    source = resolve_allowed_path(path)
+    files = collect_files(source)
+    db_id = db_registry.registry.new_id()
+    name = name or os.path.basename(source)
+    os.makedirs(settings.upload_dir, exist_ok=True)
+    views_path = os.path.join(settings.upload_dir, f"{db_id}_{_identifier(name)}.views.duckdb")
+
+    try:
+        built = build_views(views_path, files, prefix_attached=os.path.isdir(source))
+    except Exception:
+        duckdb_pool.close_pool(views_path)
+        forget(views_path)
+        for stale in (views_path, f"{views_path}.wal"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        raise
+
+    # 只有視圖文件由本服務管理，移除數據庫時源文件不受影響
+    entry = db_registry.registry.register(db_id, name, views_path, managed=True, source=source, **built)
+    restore(entry)
+    logger.info(f"已註冊本地數據源 {source} (id: {db_id})，包含 {len(built['views'])} 個視圖")
+    return entry
+
+
+def forget(path: str):
+    """移除數據庫後清除登記的 ATTACH 語句和緩存依賴"""
+    duckdb_pool.set_init_statements(path, [])
+    metadata_cache.metadata_cache.set_dependencies(path, [])
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+數據庫執行器
+將阻塞的 DuckDB 和 pymilvus 調用移出 asyncio 事件循環，
+分別使用有界的專用線程池執行，並記錄隊列深度與飽和度
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(Exception):
+    """執行器隊列已滿"""
+
+
+class BoundedExecutor:
+    """帶有隊列上限和使用統計的線程池"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, prepare: Optional[Callable[[], None]] = None):
+        self.name = name
+        # 每個任務運行前在工作線程中調用，例如同步共享的連接狀態
+        self.prepare = prepare
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"{name}-worker"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在線程池中執行阻塞函數並等待結果"""
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturatedError(f"{self.name} 執行器繁忙，請稍後重試")
+            self._queued += 1
+
+        submitted_at = time.perf_counter()
+
+        def task():
+            wait = time.perf_counter() - submitted_at
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                if self.prepare is not None:
+                    self.prepare()
+                return func(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        future = self._executor.submit(task)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        # 尚未開始便被取消的任務不會進入 task()，需要在這裡歸還隊列名額
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回執行器使用情況"""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "saturation": round(self._running / self.max_workers, 3),
+                "avg_wait_ms": round(self._total_wait / started * 1000, 3) if started else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+    def shutdown(self):
+        """關閉線程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+duckdb_executor = BoundedExecutor(
+    "duckdb",
+    max_workers=settings.duckdb_executor_workers,
+    max_queue=settings.executor_queue_size,
+)
+milvus_executor = BoundedExecutor(
+    "milvus",
+    max_workers=settings.milvus_executor_workers,
+    max_queue=settings.executor_queue_size,
+)
+
+
+async def run_duckdb(func: Callable, *args, **kwargs) -> Any:
+    """在 DuckDB 線程池中執行"""
+    return await duckdb_executor.run(functools.partial(func, *args, **kwargs))
+
+
+async def run_milvus(func: Callable, *args, **kwargs) -> Any:
+    """在 Milvus 線程池中執行"""
+    return await milvus_executor.run(functools.partial(func, *args, **kwargs))
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    """返回所有執行器的使用情況"""
+    return {
+        "duckdb": duckdb_executor.stats(),
+        "milvus": milvus_executor.stats(),
+    }
+
+
+def shutdown():
+    """關閉所有執行器"""
+    duckdb_executor.shutdown()
+    milvus_executor.shutdown()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+DuckDB 數據庫註冊表
+為每個打開的數據庫文件分配 id，多個數據庫可以同時使用。
+目錄和當前數據庫保存在共享狀態存儲中，服務重啟後無需重新上傳即可繼續使用，
+多個 worker 進程也看到同一份目錄。每次訪問先比較存儲的版本號，
+其他進程修改過目錄時重新讀取，並通知監聽器哪些數據庫被新增或移除。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import shared_state
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+DATABASES = "databases"
+SESSION = "session"
+CURRENT_KEY = "current_db_id"
+
+Listener = Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], None]
+
+
+class NoDatabaseError(Exception):
+    """尚未上傳或註冊任何數據庫"""
+
+
+class DatabaseNotFoundError(Exception):
+    """數據庫 id 不存在或文件已丟失"""
+
+
+class DatabaseRegistry:
+    """已註冊數據庫的目錄，未指定 db_id 的請求使用當前數據庫"""
+
+    def __init__(self, store: shared_state.SharedStore, catalog_path: str):
+        self.store = store
+        # 舊版本的 JSON 目錄文件，共享存儲為空時導入一次
+        self.catalog_path = catalog_path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._current_id: Optional[str] = None
+        self._version: Optional[Tuple[int, ...]] = None
+        self._listeners: List[Listener] = []
+
+    def add_listener(self, listener: Listener):
+        """登記回調 listener(新增的條目, 移除的條目)，在發現其他進程修改了目錄時調用"""
+        self._listeners.append(listener)
+
+    def _refresh(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        version = self.store.versions(DATABASES, SESSION)
+        with self._lock:
+            if version == self._version:
+                return [], []
+        entries = self.store.items(DATABASES)
+        current_id = self.store.get(SESSION, CURRENT_KEY)
+        with self._lock:
+            added = [entry for db_id, entry in entries.items() if db_id not in self._entries]
+            removed = [entry for db_id, entry in self._entries.items() if db_id not in entries]
+            self._entries = entries
+            self._current_id = current_id
+            self._version = version
+        return added, removed
+
+    def _notify(self, added: List[Dict[str, Any]], removed: List[Dict[str, Any]]):
+        if not (added or removed):
+            return
+        for listener in self._listeners:
+            try:
+                listener([dict(entry) for entry in added], [dict(entry) for entry in removed])
+            except Exception as e:
+                logger.warning(f"處理數據庫目錄變化失敗: {str(e)}")
+
+    def _sync(self):
+        self._notify(*self._refresh())
+
+    def _modify(self, change: Callable[[], Any]) -> Any:
+        """在寫事務中先同步其他進程的修改，再執行 change；本進程的修改不觸發監聽器"""
+        with self.store.transaction():
+            added, removed = self._refresh()
+            result = change()
+            with self._lock:
+                self._version = self.store.versions(DATABASES, SESSION)
+        self._notify(added, removed)
+        return result
+
+    def _set_current(self, db_id: Optional[str]):
+        if db_id is None:
+            self.store.delete(SESSION, CURRENT_KEY)
+        else:
+            self.store.put(SESSION, CURRENT_KEY, db_id)
+        with self._lock:
+            self._current_id = db_id
+
+    def _migrate(self):
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                catalog = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取數據庫目錄失敗: {str(e)}")
+            return
+        for entry in catalog.get("databases", []):
+            self.store.put(DATABASES, entry["db_id"], entry)
+        if catalog.get("current_id"):
+            self.store.put(SESSION, CURRENT_KEY, catalog["current_id"])
+        os.replace(self.catalog_path, f"{self.catalog_path}.migrated")
+        logger.info(f"已將 {self.catalog_path} 中的數據庫目錄導入共享狀態存儲")
+
+    def load(self):
+        """從共享存儲恢復註冊表，移除文件已不存在的條目"""
+        with self.store.transaction():
+            if not self.store.items(DATABASES) and os.path.exists(self.catalog_path):
+                self._migrate()
+            entries = self.store.items(DATABASES)
+            for db_id, entry in list(entries.items()):
+                if not os.path.exists(entry.get("path", "")):
+                    logger.warning(f"數據庫 {db_id} 的文件已不存在，從目錄中移除")
+                    self.store.delete(DATABASES, db_id)
+                    del entries[db_id]
+            current_id = self.store.get(SESSION, CURRENT_KEY)
+            if current_id not in entries:
+                latest = max(entries.values(), key=lambda entry: entry["created_at"])["db_id"] if entries else None
+                if latest != current_id:
+                    if latest is None:
+                        self.store.delete(SESSION, CURRENT_KEY)
+                    else:
+                        self.store.put(SESSION, CURRENT_KEY, latest)
+        self._sync()
+        logger.info(f"已從目錄恢復 {len(self._entries)} 個數據庫")
+
+    def _latest_id(self, exclude: Optional[str] = None) -> Optional[str]:
+        entries = [entry for entry in self._entries.values() if entry["db_id"] != exclude]
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: entry["created_at"])["db_id"]
+
+    @property
+    def current_id(self) -> Optional[str]:
+        self._sync()
+        with self._lock:
+            return self._current_id
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex[:12]
+
+    def register(self, db_id: str, name: str, path: str, managed: bool = True, **extra) -> Dict[str, Any]:
+        """註冊數據庫並設為當前數據庫；managed 表示文件由本服務保存，移除時一併刪除"""
+        entry = {
+            "db_id": db_id,
+            "name": name,
+            "path": path,
+            "managed": managed,
+            "size": os.path.getsize(path),
+            "created_at": time.time(),
+            **extra,
+        }
+
+        def _register():
+            self.store.put(DATABASES, db_id, entry)
+            with self._lock:
+                self._entries[db_id] = entry
+            self._set_current(db_id)
+
+        self._modify(_register)
+        return dict(entry)
+
+    def get(self, db_id: str) -> Dict[str, Any]:
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(db_id)
+        if entry is None:
+            raise DatabaseNotFoundError(f"數據庫 '{db_id}' 不存在")
+        return dict(entry)
+
+    def resolve(self, db_id: Optional[str] = None) -> Dict[str, Any]:
+        """按 id 查找數據庫，未指定時返回當前數據庫"""
+        if db_id is None:
+            db_id = self.current_id
+            if db_id is None:
+                raise NoDatabaseError("請先上傳 DuckDB 文件")
+        entry = self.get(db_id)
+        if not os.path.exists(entry["path"]):
+            raise DatabaseNotFoundError(f"數據庫 '{db_id}' 的文件已不存在")
+        return entry
+
+    def select(self, db_id: str) -> Dict[str, Any]:
+        """設置當前數據庫"""
+        def _select():
+            with self._lock:
+                entry = self._entries.get(db_id)
+            if entry is None:
+                raise DatabaseNotFoundError(f"數據庫 '{db_id}' 不存在")
+            self._set_current(db_id)
+            return dict(entry)
+
+        return self._modify(_select)
+
+    def remove(self, db_id: str) -> Dict[str, Any]:
+        """從目錄中移除數據庫並返回其條目（由調用方關閉連接和刪除文件）"""
+        def _remove():
+            with self._lock:
+                entry = self._entries.get(db_id)
+            if entry is None:
+                raise DatabaseNotFoundError(f"數據庫 '{db_id}' 不存在")
+            self.store.delete(DATABASES, db_id)
+            if self._current_id == db_id:
+                self._set_current(self._latest_id(exclude=db_id))
+            with self._lock:
+                self._entries.pop(db_id, None)
+            return entry
+
+        return self._modify(_remove)
+
+    def find(self, **criteria) -> Optional[Dict[str, Any]]:
+        """返回第一個所有字段都匹配的條目"""
+        self._sync()
+        with self._lock:
+            for entry in self._entries.values():
+                if all(entry.get(key) == value for key, value in criteria.items()):
+                    return dict(entry)
+        return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        self._sync()
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry["created_at"])
+            return [{**entry, "current": entry["db_id"] == self._current_id} for entry in entries]
+
+
+registry = DatabaseRegistry(shared_state.store, settings.duckdb_catalog_path)
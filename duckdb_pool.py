@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+DuckDB 連接池
+每個數據庫文件保持一個長期打開的數據庫句柄，並為每個請求分配獨立的 cursor，
+避免每次請求重新打開文件而丟失 DuckDB 的緩衝池和目錄緩存
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import duckdb
+
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """等待可用連接超時"""
+
+
+class DuckDBConnectionPool:
+    """單個 DuckDB 數據庫文件的連接池"""
+
+    def __init__(
+        self,
+        path: str,
+        pool_size: int = 8,
+        threads: int = 0,
+        memory_limit: str = "",
+        acquire_timeout: float = 30.0,
+        init_statements: Optional[List[str]] = None,
+        read_only: bool = False,
+    ):
+        self.path = path
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+
+        config: Dict[str, Any] = {}
+        if threads:
+            config["threads"] = threads
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+
+        # 長期持有的數據庫句柄，所有 cursor 共享同一個緩衝池
+        self._database = duckdb.connect(path, read_only=read_only, config=config)
+        # ATTACH 等設置作用於整個數據庫實例，所有 cursor 都可見
+        for statement in init_statements or []:
+            self._database.execute(statement)
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._total_acquired = 0
+        self._closed = False
+
+    @contextmanager
+    def cursor(self):
+        """獲取一個請求專用的 cursor，使用完畢後自動歸還"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeoutError(f"等待 DuckDB 連接超時 ({self.acquire_timeout} 秒)")
+
+        try:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError(f"連接池已關閉: {self.path}")
+                cur = self._database.cursor()
+                self._in_use += 1
+                self._total_acquired += 1
+
+            try:
+                yield cur
+            finally:
+                try:
+                    cur.close()
+                finally:
+                    with self._lock:
+                        self._in_use -= 1
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回連接池使用情況"""
+        with self._lock:
+            return {
+                "path": self.path,
+                "pool_size": self.pool_size,
+                "in_use": self._in_use,
+                "total_acquired": self._total_acquired,
+                "closed": self._closed,
+            }
+
+    def close(self):
+        """關閉數據庫句柄"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._database.close()
+
+
+# 按文件路徑索引的連接池
+_pools: Dict[str, DuckDBConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+# 創建連接池時在數據庫句柄上執行的語句，按文件路徑登記
+_init_statements: Dict[str, List[str]] = {}
+
+
+def set_init_statements(path: str, statements: List[str]):
+    """登記打開數據庫後需要執行的語句（例如 ATTACH），需在連接池創建前調用"""
+    with _pools_lock:
+        if statements:
+            _init_statements[path] = list(statements)
+        else:
+            _init_statements.pop(path, None)
+
+
+def get_pool(path: str) -> DuckDBConnectionPool:
+    """獲取（必要時創建）指定數據庫文件的連接池"""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = DuckDBConnectionPool(
+                path,
+                pool_size=settings.duckdb_pool_size,
+                threads=settings.duckdb_threads,
+                memory_limit=settings.duckdb_memory_limit,
+                acquire_timeout=settings.duckdb_pool_timeout,
+                init_statements=_init_statements.get(path),
+                # 內存數據庫不能以只讀方式打開
+                read_only=settings.duckdb_read_only and path != ":memory:",
+            )
+            _pools[path] = pool
+            logger.info(f"已為 {path} 創建 DuckDB 連接池 (大小: {pool.pool_size})")
+        return pool
+
+
+@contextmanager
+def writable_connection(path: str):
+    """在連接池之外以讀寫方式打開數據庫，用於創建新的數據庫文件；文件不能已被連接池打開"""
+    conn = duckdb.connect(path)
+    try:
+        with _pools_lock:
+            statements = list(_init_statements.get(path, []))
+        for statement in statements:
+            conn.execute(statement)
+        yield conn
+    finally:
+        conn.close()
+
+
+def close_pool(path: str):
+    """關閉並移除指定數據庫文件的連接池"""
+    with _pools_lock:
+        pool = _pools.pop(path, None)
+    if pool is not None:
+        pool.close()
+        logger.info(f"已關閉 DuckDB 連接池: {path}")
+
+
+def close_all():
+    """關閉所有連接池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def open_pools() -> List[DuckDBConnectionPool]:
+    """返回所有已打開的連接池"""
+    with _pools_lock:
+        return list(_pools.values())
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """返回所有連接池的使用情況"""
+    return {pool.path: pool.stats() for pool in open_pools()}
@@ -1,15 +1,37 @@
 # Milvus 配置
 MILVUS_HOST=localhost
 MILVUS_PORT=19530
+MILVUS_MAX_LOADED_COLLECTIONS=8
+MILVUS_LOAD_MEMORY_BUDGET=0
+MILVUS_LOAD_STATE_TTL=10
+MILVUS_EXPORT_BATCH_SIZE=1000
+MILVUS_SEARCH_BATCH_SIZE=256
+MILVUS_SEARCH_PARALLELISM=4
+SNAPSHOT_MAX_RUNNING_JOBS=2
+BENCHMARK_REPORT_DIR=./reports
+PYMILVUS_PRELOAD=True
+MILVUS_POOL_SIZE=2
+MILVUS_ASYNC_SEARCH=True
+MILVUS_HEALTH_INTERVAL=30
+MILVUS_RECONNECT_BACKOFF=1
+MILVUS_RECONNECT_BACKOFF_MAX=60
+MILVUS_OVERVIEW_TTL=30
+MILVUS_OVERVIEW_CONCURRENCY=4
 
 # 服務器配置
 HOST=0.0.0.0
 PORT=8000
 DEBUG=True
+WORKERS=1
+STATE_DB_PATH=./uploads/state.sqlite3
 
 # 文件上傳配置
 MAX_FILE_SIZE=104857600
 UPLOAD_DIR=./uploads
+DUCKDB_CATALOG_PATH=./uploads/catalog.json
+UPLOAD_CHUNK_SIZE=8388608
+UPLOAD_SESSION_TTL=86400
+DATA_DIRS=[]
 
 # 日誌配置
 LOG_LEVEL=INFO
@@ -18,6 +40,45 @@ LOG_FILE=./logs/app.log
 # 數據庫配置
 TEMP_DIR=./temp
 
+# DuckDB 連接池配置
+DUCKDB_POOL_SIZE=8
+DUCKDB_THREADS=0
+DUCKDB_MEMORY_LIMIT=
+DUCKDB_POOL_TIMEOUT=30
+DUCKDB_READ_ONLY=False
+
+# 數據庫執行器配置
+DUCKDB_EXECUTOR_WORKERS=8
+MILVUS_EXECUTOR_WORKERS=4
+EXECUTOR_QUEUE_SIZE=64
+
+# 查詢時限配置
+QUERY_TIMEOUT=60
+QUERY_TIMEOUT_MAX=600
+
+# 異步 SQL 任務配置
+SQL_JOB_MAX_RUNNING=2
+SQL_JOB_MAX_PENDING=32
+SQL_JOB_TIMEOUT=0
+SQL_JOB_TTL=3600
+SQL_JOB_MAX_INLINE_ROWS=10000
+
+# 流式輸出配置
+STREAM_BATCH_SIZE=10000
+
+# DuckDB 向量搜索配置
+VECTOR_SEARCH_BLOCK_ROWS=65536
+VECTOR_SEARCH_THREADS=0
+
+# 查詢結果緩存配置
+QUERY_CACHE_ENABLED=True
+QUERY_CACHE_MEMORY_BYTES=67108864
+QUERY_CACHE_DISK_BYTES=536870912
+
+# 列分析配置
+PROFILE_SAMPLE_ROWS=100000
+PROFILE_HISTOGRAM_BINS=20
+
 # CORS 配置
 CORS_ORIGINS=["http://localhost:3000", "http://localhost:8080", "http://127.0.0.1:8000"]
 
@@ -1,22 +1,60 @@
 # main.py
-from fastapi import FastAPI, HTTPException, UploadFile, File, Query
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Dict, Any, Optional
-import duckdb
+import asyncio
 import os
 import tempfile
 import shutil
 from pathlib import Path
 import json
 import logging
+import uuid
+
+from config_py import settings
+import duckdb_pool
+import db_executor
+import result_stream
+import pagination
+import metadata_cache
+import query_cache
+import milvus_manager
+from milvus_manager import (
+    collection_manager, milvus_connections, load_pymilvus,
+    CollectionNotFoundError, ConnectionNotFoundError, ConnectionUnavailableError,
+)
+import milvus_export
+import milvus_overview
+import snapshot_jobs
+import vector_search
+import search_benchmark
+import search_results
+import db_registry
+import upload_pipeline
+import data_sources
+import query_control
+import sql_jobs
+import table_profile
+import metrics
+from api_models import MilvusSearchRequest
 
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 啟動各階段的耗時（秒），通過 /health 報告
+startup_timings: Dict[str, float] = {"import": round(time.perf_counter() - _import_started, 3)}
+
+# 服務開始接受請求後再導入 pymilvus，避免與啟動搶佔 CPU
+PYMILVUS_PRELOAD_DELAY = 0.5
+
 # 創建 FastAPI 應用
 app = FastAPI(
     title="資料庫集合檢視器",
@@ -33,275 +71,965 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局變量
-milvus_client = None
-current_duckdb_path = None
+# 記錄每個端點的請求數、錯誤數、響應大小和延遲直方圖
+app.add_middleware(metrics.MetricsMiddleware)
+
+# 全局變量（每個 worker 進程各自的臨時目錄；數據庫目錄和連接參數保存在共享狀態中）
 temp_dir = tempfile.mkdtemp()
 
+# 每次 Milvus 操作前按其他 worker 設置的連接參數同步本進程的連接列表
+db_executor.milvus_executor.prepare = milvus_connections.sync
+
+# Milvus 健康檢查循環兩次檢查之間的最短和最長間隔（秒）
+MILVUS_CHECK_MIN_SLEEP = 0.5
+MILVUS_CHECK_MAX_SLEEP = 30.0
+milvus_health_task: Optional[asyncio.Task] = None
+
 # Pydantic 模型
 class MilvusConnectionRequest(BaseModel):
     host: str = "localhost"
     port: int = 19530
+    name: str = milvus_manager.DEFAULT_CONNECTION  # 連接名稱，可同時保持多個連接
+    db_name: Optional[str] = None  # Milvus 數據庫，默認為服務器的 default 數據庫
 
 class SQLQueryRequest(BaseModel):
     query: str
+    stream: Optional[str] = None  # "ndjson"、"json"、"arrow" 或 "parquet"，設置後以流式方式返回結果
+    cache: bool = True  # 是否使用查詢結果緩存（僅對只讀語句生效）
+    db_id: Optional[str] = None  # 數據庫 id，默認使用當前數據庫
+    timeout: Optional[float] = Field(None, ge=0)  # 查詢時限（秒），默認使用 QUERY_TIMEOUT，0 表示使用上限
 
-class MilvusSearchRequest(BaseModel):
-    collection_name: str
+class SQLJobRequest(BaseModel):
+    query: str
+    db_id: Optional[str] = None  # 數據庫 id，默認使用當前數據庫
+    timeout: Optional[float] = Field(None, ge=0)  # 任務時限（秒），默認使用 SQL_JOB_TIMEOUT，0 表示不限制
+
+class SnapshotRequest(BaseModel):
+    table_name: Optional[str] = None  # 目標表名，默認與集合同名
+    batch_size: Optional[int] = None
+    restart: bool = False  # 忽略已保存的進度，重新複製整個集合
+    db_id: Optional[str] = None  # 目標數據庫 id，默認使用當前數據庫
+    connection: Optional[str] = None  # Milvus 連接名稱，默認為 default
+
+class BenchmarkRequest(BaseModel):
+    nprobe: List[int] = [1, 4, 16, 64]  # IVF 索引的 nprobe 取值
+    ef: List[int] = []  # HNSW 索引的 ef 取值
+    k: int = 10
+    num_queries: int = 100
+    concurrency: int = 1
+    metric_type: str = "L2"
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0)  # 文件的總位元組數
+
+class LocalSourceRequest(BaseModel):
+    path: str  # DATA_DIRS 中的文件或目錄
+    name: Optional[str] = None  # 顯示名稱，默認為文件或目錄名
+
+class DuckDBSearchRequest(BaseModel):
+    vector_column: str
     vectors: List[List[float]]
     limit: int = 10
-    search_params: Optional[Dict] = None
+    metric_type: str = "L2"  # "L2"、"IP" 或 "COSINE"
+    output_fields: Optional[List[str]] = None  # 默認返回除向量列以外的所有列
+    filter: Optional[str] = None  # 可選的 SQL WHERE 條件
+    db_id: Optional[str] = None  # 數據庫 id，默認使用當前數據庫
+
+def streaming_response(stream, fmt: str, filename: str = "result") -> StreamingResponse:
+    """將結果流（DuckDB 查詢結果或 Milvus 集合導出）包裝為 HTTP 流式響應"""
+    headers = {}
+    if fmt in result_stream.BINARY_FORMATS:
+        extension = "arrows" if fmt == "arrow" else "parquet"
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return StreamingResponse(
+        stream.iter_bytes(fmt),
+        media_type=result_stream.STREAM_MEDIA_TYPES[fmt],
+        headers=headers,
+        background=BackgroundTask(stream.close)
+    )
+
+def invalidate_database_caches(path: str):
+    """數據庫文件被修改後清除相關的元數據和查詢結果緩存"""
+    metadata_cache.metadata_cache.invalidate(path)
+    query_cache.query_cache.purge_path(path)
+
+def on_catalog_change(added: List[Dict[str, Any]], removed: List[Dict[str, Any]]):
+    """其他 worker 進程註冊或移除了數據庫：恢復本地數據源的設置，關閉已移除數據庫的連接池"""
+    for entry in added:
+        if entry.get("source"):
+            data_sources.restore(entry)
+    for entry in removed:
+        duckdb_pool.close_pool(entry["path"])
+        invalidate_database_caches(entry["path"])
+        data_sources.forget(entry["path"])
+
+db_registry.registry.add_listener(on_catalog_change)
+
+def check_writable(read_only: bool):
+    """只讀模式（多個 worker 進程共享數據庫文件）下拒絕寫入語句"""
+    if settings.duckdb_read_only and not read_only:
+        raise HTTPException(
+            status_code=409,
+            detail="數據庫以只讀方式打開（多進程模式），只能執行只讀查詢；寫入請在單進程模式下進行"
+        )
+
+def in_thread(func, *args):
+    """在默認線程池中調用訪問共享狀態存儲的函數
+    
+    共享狀態是 SQLite 文件，其他 worker 寫入時最多等待 10 秒，不能在事件循環中直接調用。
+    """
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+async def resolve_database_path(db_id: Optional[str]) -> str:
+    """按 id 查找數據庫文件路徑，未指定時使用當前數據庫"""
+    try:
+        return (await in_thread(db_registry.registry.resolve, db_id))["path"]
+    except db_registry.NoDatabaseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except db_registry.DatabaseNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def resolve_stream_format(request: Request, explicit: Optional[str]) -> Optional[str]:
+    """根據顯式參數或 Accept 頭確定流式格式，並檢查是否受支持"""
+    fmt = explicit or result_stream.negotiate_format(request.headers.get("accept"))
+    if not fmt:
+        return None
+    if fmt not in result_stream.STREAM_MEDIA_TYPES:
+        supported = ", ".join(result_stream.STREAM_MEDIA_TYPES)
+        raise HTTPException(status_code=400, detail=f"不支持的流式格式: {fmt}，可選: {supported}")
+    if fmt in result_stream.BINARY_FORMATS and not result_stream.arrow_available():
+        raise HTTPException(status_code=501, detail="服務器未安裝 pyarrow，無法輸出 Arrow 或 Parquet 格式")
+    return fmt
 
 # ==================== Milvus 相關端點 ====================
 
 @app.post("/milvus/connect")
 async def connect_milvus(connection: MilvusConnectionRequest):
-    """連接到 Milvus 服務器"""
-    global milvus_client
+    """連接到 Milvus 服務器；已有同名連接時先建立新連接再替換，進行中的請求繼續使用舊連接完成"""
     try:
-        from pymilvus import connections, utility
+        def _connect():
+            return milvus_connections.connect(connection.name, connection.host, connection.port, connection.db_name)
         
-        # 斷開現有連接
-        try:
-            connections.disconnect("default")
-        except:
-            pass
-        
-        # 建立新連接
-        connections.connect(
-            alias="default",
-            host=connection.host,
-            port=str(connection.port)
-        )
-        
-        # 測試連接
-        collections = utility.list_collections()
-        logger.info(f"成功連接到 Milvus，找到 {len(collections)} 個集合")
+        collections = await db_executor.run_milvus(_connect)
+        logger.info(f"成功連接到 Milvus ({connection.name})，找到 {len(collections)} 個集合")
+        # 在後台預先生成集合概覽，首頁打開時無需等待
+        milvus_overview.overview_cache.refresh(connection.name)
         
         return {
             "status": "success",
             "message": f"成功連接到 Milvus ({connection.host}:{connection.port})",
+            "name": connection.name,
             "collections_count": len(collections)
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"連接 Milvus 失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"連接失敗: {str(e)}")
 
+@app.get("/milvus/connections")
+async def list_milvus_connections():
+    """列出命名連接的參數，以及本進程中各連接的健康狀態"""
+    try:
+        return {"connections": await db_executor.run_milvus(milvus_connections.list)}
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.delete("/milvus/connections/{name}")
+async def remove_milvus_connection(name: str):
+    """移除命名連接，各 worker 在下一次 Milvus 操作前斷開（進行中的請求繼續完成）"""
+    try:
+        await db_executor.run_milvus(milvus_connections.remove, name)
+        return {"status": "success", "message": f"已移除 Milvus 連接 {name}"}
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @app.get("/milvus/collections")
-async def get_collections():
+async def get_collections(
+    connection: Optional[str] = Query(None, description="Milvus 連接名稱，默認為 default")
+):
     """獲取所有集合列表"""
     try:
-        from pymilvus import utility
-        collections = utility.list_collections()
+        def _list_collections():
+            pool = milvus_connections.pool(connection)
+            return load_pymilvus().utility.list_collections(using=pool.primary)
+        
+        collections = await db_executor.run_milvus(_list_collections)
         return {"collections": collections}
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"獲取集合列表失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"獲取集合列表失敗: {str(e)}")
 
+@app.get("/milvus/overview")
+async def get_milvus_overview(
+    connection: Optional[str] = Query(None, description="Milvus 連接名稱，默認為 default"),
+    refresh: bool = Query(False, description="忽略緩存，等待重新生成")
+):
+    """一次返回所有集合的架構、實體數、索引類型和載入狀態（不載入集合）
+    
+    結果緩存 MILVUS_OVERVIEW_TTL 秒，過期後返回舊結果（stale 為 true）並在後台刷新。
+    """
+    try:
+        return await milvus_overview.overview_cache.get(connection, refresh)
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"獲取集合概覽失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"獲取集合概覽失敗: {str(e)}")
+
 @app.get("/milvus/collection/{collection_name}/info")
-async def get_collection_info(collection_name: str):
+async def get_collection_info(
+    collection_name: str,
+    connection: Optional[str] = Query(None, description="Milvus 連接名稱，默認為 default")
+):
     """獲取指定集合的詳細信息"""
     try:
-        from pymilvus import Collection, utility
-        
-        # 檢查集合是否存在
-        if not utility.has_collection(collection_name):
-            raise HTTPException(status_code=404, detail=f"集合 '{collection_name}' 不存在")
-        
-        collection = Collection(collection_name)
-        
-        # 獲取集合統計信息
-        collection.load()
-        stats = collection.get_compaction_state()
-        
-        info = {
-            "name": collection_name,
-            "schema": {
-                "description": collection.description,
-                "fields": []
-            },
-            "num_entities": collection.num_entities,
-            "is_empty": collection.is_empty,
-            "compaction_state": stats.state.name if hasattr(stats, 'state') else str(stats)
-        }
-        
-        # 獲取字段信息
-        for field in collection.schema.fields:
-            field_info = {
-                "name": field.name,
-                "type": str(field.dtype),
-                "is_primary": field.is_primary,
-                "auto_id": field.auto_id,
+        def _collection_info():
+            # 架構信息來自緩存的句柄，查看信息不需要載入集合
+            entry = collection_manager.get(collection_name, connection)
+            collection = entry.collection
+            
+            # 獲取集合統計信息
+            stats = collection.get_compaction_state()
+            num_entities = collection.num_entities
+            
+            return {
+                "name": collection_name,
+                "schema": {
+                    "description": entry.description,
+                    "fields": entry.fields
+                },
+                "num_entities": num_entities,
+                "is_empty": num_entities == 0,
+                "loaded": entry.loaded,
+                "compaction_state": stats.state.name if hasattr(stats, 'state') else str(stats)
             }
-            if hasattr(field, 'dim'):
-                field_info["dimension"] = field.dim
-            info["schema"]["fields"].append(field_info)
         
-        return info
+        return await db_executor.run_milvus(_collection_info)
         
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"獲取集合信息失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"獲取集合信息失敗: {str(e)}")
 
 @app.get("/milvus/collection/{collection_name}/data")
-async def get_collection_data(collection_name: str, limit: int = Query(100, ge=1, le=1000)):
+async def get_collection_data(
+    collection_name: str,
+    limit: int = Query(100, ge=1, le=1000),
+    connection: Optional[str] = Query(None, description="Milvus 連接名稱，默認為 default")
+):
     """獲取集合中的數據"""
     try:
-        from pymilvus import Collection, utility
-        
-        if not utility.has_collection(collection_name):
-            raise HTTPException(status_code=404, detail=f"集合 '{collection_name}' 不存在")
-        
-        collection = Collection(collection_name)
-        collection.load()
-        
-        # 獲取所有字段名
-        field_names = [field.name for field in collection.schema.fields]
+        def _collection_data():
+            with collection_manager.lease(collection_name, connection) as entry:
+                collection = entry.collection
+                
+                # 查詢數據
+                results = collection.query(
+                    expr="",  # 空表達式表示查詢所有數據
+                    output_fields=entry.field_names,
+                    limit=limit
+                )
+                
+                return {
+                    "collection_name": collection_name,
+                    "total_count": collection.num_entities,
+                    "returned_count": len(results),
+                    "data": results
+                }
         
-        # 查詢數據
-        results = collection.query(
-            expr="",  # 空表達式表示查詢所有數據
-            output_fields=field_names,
-            limit=limit
-        )
-        
-        return {
-            "collection_name": collection_name,
-            "total_count": collection.num_entities,
-            "returned_count": len(results),
-            "data": results
-        }
+        return await db_executor.run_milvus(_collection_data)
         
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"獲取集合數據失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"獲取集合數據失敗: {str(e)}")
 
-@app.post("/milvus/collection/{collection_name}/search")
-async def search_collection(collection_name: str, search_request: MilvusSearchRequest):
-    """在集合中搜索相似向量"""
+@app.get("/milvus/collection/{collection_name}/export")
+async def export_collection(
+    request: Request,
+    collection_name: str,
+    format: Optional[str] = Query(None, description="導出格式：ndjson、arrow 或 parquet，默認根據 Accept 頭或使用 ndjson"),
+    batch_size: Optional[int] = Query(None, ge=1, le=16384, description="每批從 Milvus 讀取的實體數"),
+    expr: Optional[str] = Query(None, description="可選的過濾表達式"),
+    connection: Optional[str] = Query(None, description="Milvus 連接名稱，默認為 default")
+):
+    """流式導出整個集合"""
+    fmt = resolve_stream_format(request, format) or "ndjson"
+    if fmt not in milvus_export.EXPORT_FORMATS:
+        supported = ", ".join(milvus_export.EXPORT_FORMATS)
+        raise HTTPException(status_code=400, detail=f"不支持的導出格式: {fmt}，可選: {supported}")
+    
     try:
-        from pymilvus import Collection, utility
+        export_stream = await milvus_export.open_export(
+            collection_name, batch_size or settings.milvus_export_batch_size, expr, connection
+        )
+        return streaming_response(export_stream, fmt, filename=collection_name)
         
-        if not utility.has_collection(collection_name):
-            raise HTTPException(status_code=404, detail=f"集合 '{collection_name}' 不存在")
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"導出集合失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"導出集合失敗: {str(e)}")
+
+@app.post("/milvus/collection/{collection_name}/snapshot")
+async def snapshot_collection(collection_name: str, snapshot_request: SnapshotRequest):
+    """在後台將集合複製到當前 DuckDB 文件的表中，未完成的快照會自動續傳"""
+    db_path = await resolve_database_path(snapshot_request.db_id)
+    check_writable(read_only=False)
+    if not result_stream.arrow_available():
+        raise HTTPException(status_code=501, detail="服務器未安裝 pyarrow，無法創建快照")
+    
+    batch_size = snapshot_request.batch_size or settings.milvus_export_batch_size
+    if not 1 <= batch_size <= 16384:
+        raise HTTPException(status_code=400, detail="batch_size 必須在 1 到 16384 之間")
+    
+    try:
+        job = await snapshot_jobs.snapshot_manager.start(
+            db_path,
+            collection_name,
+            snapshot_request.table_name or collection_name,
+            batch_size,
+            snapshot_request.restart,
+            on_commit=invalidate_database_caches,
+            connection=snapshot_request.connection
+        )
+        logger.info(f"已啟動集合 {collection_name} 的快照任務 {job.job_id}")
+        return job.to_dict()
         
-        collection = Collection(collection_name)
-        collection.load()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except snapshot_jobs.SnapshotConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"啟動快照任務失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"啟動快照任務失敗: {str(e)}")
+
+@app.get("/milvus/snapshots")
+async def list_snapshots(
+    db_id: Optional[str] = Query(None, description="數據庫 id，默認使用當前數據庫")
+):
+    """列出快照任務，以及指定（默認為當前）DuckDB 文件中保存的快照進度"""
+    saved = []
+    db_path = None
+    if db_id is not None or await in_thread(lambda: db_registry.registry.current_id) is not None:
+        db_path = await resolve_database_path(db_id)
+    if db_path:
+        try:
+            def _saved():
+                with duckdb_pool.get_pool(db_path).cursor() as conn:
+                    return snapshot_jobs.saved_snapshots(conn)
+            
+            saved = await db_executor.run_duckdb(_saved)
+        except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            logger.error(f"讀取快照進度失敗: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"讀取快照進度失敗: {str(e)}")
+    
+    return {
+        "jobs": snapshot_jobs.snapshot_manager.list_jobs(),
+        "saved": saved
+    }
+
+@app.get("/milvus/snapshots/{job_id}")
+async def get_snapshot(job_id: str):
+    """獲取快照任務的進度"""
+    try:
+        return snapshot_jobs.snapshot_manager.get(job_id).to_dict()
+    except snapshot_jobs.SnapshotJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.delete("/milvus/snapshots/{job_id}")
+async def cancel_snapshot(job_id: str):
+    """在當前批次提交後停止快照任務，之後可重新啟動續傳"""
+    try:
+        job = snapshot_jobs.snapshot_manager.get(job_id)
+    except snapshot_jobs.SnapshotJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    job.cancel()
+    return job.to_dict()
+
+@app.post("/milvus/collection/{collection_name}/benchmark")
+async def benchmark_collection(
+    collection_name: str,
+    benchmark_request: BenchmarkRequest,
+    connection: Optional[str] = Query(None, description="Milvus 連接名稱，默認為 default")
+):
+    """掃描搜索參數，測量延遲、QPS 和相對精確搜索的 recall@k，並寫入報告文件"""
+    if not 1 <= benchmark_request.k <= 16384:
+        raise HTTPException(status_code=400, detail="k 必須在 1 到 16384 之間")
+    if not 1 <= benchmark_request.num_queries <= 10000:
+        raise HTTPException(status_code=400, detail="num_queries 必須在 1 到 10000 之間")
+    if not 1 <= benchmark_request.concurrency <= 64:
+        raise HTTPException(status_code=400, detail="concurrency 必須在 1 到 64 之間")
+    
+    try:
+        def _benchmark():
+            with collection_manager.lease(collection_name, connection) as entry:
+                if not entry.vector_field:
+                    raise HTTPException(status_code=400, detail="集合中沒有找到向量字段")
+                
+                report = search_benchmark.run_benchmark(
+                    entry.collection,
+                    lambda: search_benchmark.milvus_vector_blocks(entry, settings.milvus_export_batch_size),
+                    entry.vector_field,
+                    search_benchmark.sweep_params(benchmark_request.nprobe, benchmark_request.ef),
+                    k=benchmark_request.k,
+                    num_queries=benchmark_request.num_queries,
+                    metric_type=benchmark_request.metric_type,
+                    concurrency=benchmark_request.concurrency
+                )
+            report["collection"] = collection_name
+            report["report_file"] = search_benchmark.write_report(report, collection_name)
+            return report
         
-        # 找到向量字段
-        vector_field = None
-        for field in collection.schema.fields:
-            if field.dtype.name in ['FLOAT_VECTOR', 'BINARY_VECTOR']:
-                vector_field = field.name
-                break
+        return await db_executor.run_milvus(_benchmark)
         
-        if not vector_field:
-            raise HTTPException(status_code=400, detail="集合中沒有找到向量字段")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"基準測試失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"基準測試失敗: {str(e)}")
+
+# .npy 請求體的 Content-Type
+NPY_MEDIA_TYPES = ("application/x-npy", "application/octet-stream")
+
+async def parse_search_request(request: Request) -> MilvusSearchRequest:
+    """解析 JSON 或 .npy 請求體；.npy 請求的其他參數通過查詢字符串傳遞"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    body = await request.body()
+    try:
+        if content_type in NPY_MEDIA_TYPES:
+            params = dict(request.query_params)
+            if "search_params" in params:
+                params["search_params"] = json.loads(params["search_params"])
+            return MilvusSearchRequest.from_npy(body, **params)
+        return MilvusSearchRequest.parse_raw(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"請求格式錯誤: {str(e)}")
+
+@app.post(
+    "/milvus/collection/{collection_name}/search",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": MilvusSearchRequest.schema()},
+                "application/x-npy": {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    },
+)
+async def search_collection(
+    collection_name: str,
+    request: Request,
+    connection: Optional[str] = Query(None, description="Milvus 連接名稱，默認為 default")
+):
+    """在集合中搜索相似向量
+    
+    請求體可以是 JSON（vectors 或 vectors_b64 + dim），也可以是 .npy 文件
+    （Content-Type: application/x-npy，limit、batch_size、search_params、layout 通過查詢字符串傳遞）。
+    查詢向量按 batch_size 分批發送給 Milvus，各批輪流使用連接的各個通道並行執行，按原順序合併。
+    layout 為 columns 時每個查詢返回 ids、distances 和字段的平行數組；
+    為 arrow（或 Accept 為 Arrow 流）時返回 Arrow IPC 流。
+    """
+    search_request = await parse_search_request(request)
+    matrix = search_request.query_matrix
+    batch_size = search_request.batch_size or settings.milvus_search_batch_size
+    
+    layout = search_request.layout
+    if layout is None:
+        layout = "arrow" if result_stream.negotiate_format(request.headers.get("accept")) == "arrow" else "rows"
+    if layout == "arrow" and not result_stream.arrow_available():
+        raise HTTPException(status_code=501, detail="服務器未安裝 pyarrow，無法輸出 Arrow 格式")
+    
+    entry = None
+    try:
+        def _prepare():
+            # 租約保持到所有批次完成，期間其他請求的載入不會釋放這個集合
+            entry = collection_manager.ensure_loaded(collection_name, connection, lease=True)
+            if not entry.vector_field:
+                collection_manager.release_lease(entry)
+                raise HTTPException(status_code=400, detail="集合中沒有找到向量字段")
+            return entry
         
-        # 執行搜索
-        search_params = search_request.search_params or {"metric_type": "L2", "params": {"nprobe": 10}}
+        entry = await db_executor.run_milvus(_prepare)
+        search_kwargs = {
+            "anns_field": entry.vector_field,
+            "param": search_request.search_params or {"metric_type": "L2", "params": {"nprobe": 10}},
+            "limit": search_request.limit,
+            "output_fields": entry.output_fields,
+        }
         
-        results = collection.search(
-            data=search_request.vectors,
-            anns_field=vector_field,
-            param=search_params,
-            limit=search_request.limit,
-            output_fields=[field.name for field in collection.schema.fields if not field.dtype.name.endswith('_VECTOR')]
-        )
+        if settings.milvus_async_search:
+            # 異步調用：一個執行器線程保持所有批次在途
+            def _search_all():
+                return [
+                    search_results.format_results(results, layout, entry, start)
+                    for start, results in entry.search_batches(
+                        matrix, batch_size, settings.milvus_search_parallelism, **search_kwargs
+                    )
+                ]
+            
+            batches = await db_executor.run_milvus(_search_all)
+        else:
+            def _search_batch(start):
+                results = entry.handle(entry.pool.next_alias()).search(
+                    data=matrix[start:start + batch_size], **search_kwargs
+                )
+                return search_results.format_results(results, layout, entry, start)
+            
+            # 限制同時在途的批次數，避免一個大請求佔滿執行器隊列
+            semaphore = asyncio.Semaphore(settings.milvus_search_parallelism)
+            
+            async def _run_batch(start):
+                async with semaphore:
+                    return await db_executor.run_milvus(_search_batch, start)
+            
+            batches = await asyncio.gather(*(
+                _run_batch(start) for start in range(0, len(matrix), batch_size)
+            ))
         
-        # 格式化結果
-        formatted_results = []
-        for hits in results:
-            hit_results = []
-            for hit in hits:
-                hit_data = {
-                    "id": hit.id,
-                    "distance": hit.distance,
-                    "entity": hit.entity._row_data if hasattr(hit.entity, '_row_data') else {}
-                }
-                hit_results.append(hit_data)
-            formatted_results.append(hit_results)
+        if layout == "arrow":
+            content = await db_executor.run_milvus(search_results.arrow_ipc_bytes, batches)
+            return Response(
+                content=content,
+                media_type=result_stream.STREAM_MEDIA_TYPES["arrow"],
+                headers={"Content-Disposition": f'attachment; filename="{collection_name}_search.arrows"'}
+            )
         
         return {
             "collection_name": collection_name,
-            "search_results": formatted_results
+            "layout": layout,
+            "search_results": [hits for batch in batches for hits in batch]
         }
         
+    except HTTPException:
+        raise
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"搜索失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"搜索失敗: {str(e)}")
+    finally:
+        if entry is not None:
+            collection_manager.release_lease(entry)
 
 # ==================== DuckDB 相關端點 ====================
 
-@app.post("/duckdb/upload")
-async def upload_duckdb_file(file: UploadFile = File(...)):
-    """上傳 DuckDB 文件"""
-    global current_duckdb_path
-    
-    if not file.filename.endswith(('.db', '.duckdb')):
+def check_database_filename(filename: Optional[str]) -> str:
+    """檢查上傳文件的擴展名，返回不含目錄的文件名"""
+    if not filename or not filename.endswith(('.db', '.duckdb')):
         raise HTTPException(status_code=400, detail="只支持 .db 或 .duckdb 文件格式")
-    
+    return os.path.basename(filename)
+
+def upload_fingerprint(path: str) -> List[int]:
+    """登記時的文件大小、修改時間和寫入代數，用於判斷文件之後是否被修改"""
+    return list(metadata_cache.metadata_cache.fingerprint(path)[1:])
+
+def is_unmodified(entry: Dict[str, Any]) -> bool:
+    """已登記的數據庫文件自上傳後未被修改，內容仍與記錄的哈希一致"""
+    path = entry["path"]
+    wal_path = f"{path}.wal"
     try:
-        # 保存文件到臨時目錄
-        file_path = os.path.join(temp_dir, file.filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 測試文件是否有效
-        conn = duckdb.connect(file_path)
-        tables = conn.execute("SHOW TABLES").fetchall()
-        conn.close()
-        
-        current_duckdb_path = file_path
-        logger.info(f"成功上傳 DuckDB 文件: {file.filename}，包含 {len(tables)} 個表")
+        # 打開的數據庫總有 .wal 文件，非空時說明有尚未檢查點的寫入
+        if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+            return False
+        return upload_fingerprint(path) == entry.get("fingerprint")
+    except OSError:
+        return False
+
+async def register_upload(tmp_path: str, filename: str, digest: str) -> Dict[str, Any]:
+    """登記已完整寫入臨時文件的上傳
+    
+    內容與一個未被修改過的已有數據庫相同時刪除臨時文件，直接復用其 id 和連接池。
+    """
+    existing = await in_thread(lambda: db_registry.registry.find(sha256=digest))
+    if existing is not None and is_unmodified(existing):
+        def _reuse():
+            os.remove(tmp_path)
+            with duckdb_pool.get_pool(existing["path"]).cursor() as conn:
+                return metadata_cache.list_tables(conn, existing["path"])
         
+        tables = await db_executor.run_duckdb(_reuse)
+        await in_thread(db_registry.registry.select, existing["db_id"])
+        logger.info(f"上傳的文件 {filename} 與數據庫 {existing['db_id']} 內容相同，直接復用")
         return {
             "status": "success",
-            "message": f"成功上傳文件: {file.filename}",
+            "message": f"文件內容與已上傳的 {existing['name']} 相同，已切換到該數據庫",
             "tables_count": len(tables),
-            "filename": file.filename
+            "filename": filename,
+            "db_id": existing["db_id"],
+            "deduplicated": True
+        }
+    
+    # 文件名帶上數據庫 id 以免同名文件互相覆蓋
+    db_id = db_registry.registry.new_id()
+    file_path = os.path.join(settings.upload_dir, f"{db_id}_{filename}")
+    
+    def _open():
+        os.replace(tmp_path, file_path)
+        try:
+            with duckdb_pool.get_pool(file_path).cursor() as conn:
+                tables = metadata_cache.list_tables(conn, file_path)
+        except Exception:
+            duckdb_pool.close_pool(file_path)
+            os.remove(file_path)
+            raise
+        return tables, upload_fingerprint(file_path)
+    
+    try:
+        tables, fingerprint = await db_executor.run_duckdb(_open)
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"無法打開 DuckDB 文件: {str(e)}")
+    await in_thread(lambda: db_registry.registry.register(
+        db_id, filename, file_path, sha256=digest, fingerprint=fingerprint
+    ))
+    logger.info(f"成功上傳 DuckDB 文件: {filename} (id: {db_id})，包含 {len(tables)} 個表")
+    
+    return {
+        "status": "success",
+        "message": f"成功上傳文件: {filename}",
+        "tables_count": len(tables),
+        "filename": filename,
+        "db_id": db_id,
+        "deduplicated": False
+    }
+
+def discard_temp_file(path: str):
+    """刪除登記失敗後遺留的臨時文件（成功時已被移走或刪除）"""
+    if os.path.exists(path):
+        os.remove(path)
+
+def upload_error(e: Exception) -> HTTPException:
+    """將上傳管道的異常轉換為 HTTP 錯誤"""
+    if isinstance(e, upload_pipeline.UploadTooLargeError):
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, (upload_pipeline.InvalidDatabaseFileError, upload_pipeline.InvalidUploadRequestError)):
+        return HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, upload_pipeline.UploadSessionNotFoundError):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, upload_pipeline.UploadConflictError):
+        return HTTPException(status_code=409, detail={"message": str(e), "received": e.received})
+    if isinstance(e, (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError)):
+        return HTTPException(status_code=503, detail=str(e))
+    logger.error(f"上傳文件失敗: {str(e)}")
+    return HTTPException(status_code=500, detail=f"上傳文件失敗: {str(e)}")
+
+@app.post(
+    "/duckdb/upload",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
+async def upload_duckdb_file(request: Request):
+    """上傳 DuckDB 文件，註冊為新的數據庫並設為當前數據庫
+    
+    請求體按 Content-Length 預先檢查大小，超過 max_file_size 時不讀取直接返回 413。
+    multipart 請求體邊接收邊解析，文件內容直接寫入上傳目錄並同時計算 SHA-256，
+    超過上限或文件頭無效時立即中止（沒有 Content-Length 的請求同樣如此）。
+    與未修改過的已有數據庫內容相同時直接復用。大文件請使用 /duckdb/uploads 分塊上傳。
+    """
+    content_length = request.headers.get("content-length")
+    if (
+        content_length and content_length.isdigit()
+        and int(content_length) > settings.max_file_size + upload_pipeline.MULTIPART_OVERHEAD
+    ):
+        raise HTTPException(
+            status_code=413,
+            detail=f"文件大小超過上限 {upload_pipeline.format_size(settings.max_file_size)}"
+        )
+    
+    tmp_path = upload_pipeline.upload_sessions.temp_path(f"{uuid.uuid4().hex}.upload")
+    try:
+        receiver = upload_pipeline.MultipartFileReceiver(request.headers.get("content-type", ""))
+        filename, _, digest = await receiver.receive(
+            request.stream(), tmp_path, settings.max_file_size, check_database_filename
+        )
+        return await register_upload(tmp_path, filename, digest)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise upload_error(e)
+    finally:
+        discard_temp_file(tmp_path)
+
+@app.post("/duckdb/uploads")
+async def create_upload_session(session_request: UploadSessionRequest):
+    """創建分塊上傳會話，之後用 PUT /duckdb/uploads/{upload_id}?offset=N 依次上傳各塊"""
+    filename = check_database_filename(session_request.filename)
+    try:
+        # 會話操作只涉及文件讀寫，放到默認線程池，不佔用 DuckDB 執行器
+        session = await asyncio.get_running_loop().run_in_executor(
+            None, upload_pipeline.upload_sessions.create, filename, session_request.size, settings.max_file_size
+        )
+    except Exception as e:
+        raise upload_error(e)
+    return {**session, "chunk_size": settings.upload_chunk_size}
+
+@app.put(
+    "/duckdb/uploads/{upload_id}",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
         }
+    },
+)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="本塊在文件中的起始位置，必須等於已接收的位元組數")
+):
+    """追加一塊數據；請求體直接流式寫入磁碟，偏移量不一致時返回 409 和已接收的位元組數"""
+    try:
+        return await upload_pipeline.upload_sessions.append(upload_id, offset, request.stream())
+    except Exception as e:
+        raise upload_error(e)
+
+@app.get("/duckdb/uploads/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """查詢上傳會話，received 為續傳時應使用的偏移量"""
+    try:
+        return upload_pipeline.upload_sessions.get(upload_id)
+    except Exception as e:
+        raise upload_error(e)
+
+@app.post("/duckdb/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """結束分塊上傳並註冊數據庫"""
+    try:
+        session, part_path, digest = await asyncio.get_running_loop().run_in_executor(
+            None, upload_pipeline.upload_sessions.complete, upload_id
+        )
+    except Exception as e:
+        raise upload_error(e)
+    
+    try:
+        return await register_upload(part_path, session["filename"], digest)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise upload_error(e)
+    finally:
+        discard_temp_file(part_path)
+
+@app.delete("/duckdb/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """取消分塊上傳並刪除已接收的數據"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, upload_pipeline.upload_sessions.abort, upload_id)
+    except Exception as e:
+        raise upload_error(e)
+    return {"status": "success", "message": "已取消上傳", "upload_id": upload_id}
+
+def local_source_error(e: Exception) -> HTTPException:
+    """將本地數據源的異常轉換為 HTTP 錯誤"""
+    if isinstance(e, data_sources.PathNotAllowedError):
+        return HTTPException(status_code=403, detail=str(e))
+    if isinstance(e, FileNotFoundError):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=400, detail=str(e))
+    if isinstance(e, (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError)):
+        return HTTPException(status_code=503, detail=str(e))
+    logger.error(f"訪問本地數據失敗: {str(e)}")
+    return HTTPException(status_code=500, detail=f"訪問本地數據失敗: {str(e)}")
+
+@app.get("/duckdb/local/files")
+async def list_local_files(
+    directory: Optional[str] = Query(None, description="要瀏覽的目錄，默認列出 DATA_DIRS")
+):
+    """瀏覽允許原地查詢的本地數據目錄，Parquet 文件附帶緩存的行數和列信息"""
+    try:
+        return await db_executor.run_duckdb(data_sources.list_directory, directory)
+    except Exception as e:
+        raise local_source_error(e)
+
+@app.post("/duckdb/local")
+async def register_local_source(source_request: LocalSourceRequest):
+    """將本地的 Parquet、CSV、DuckDB 文件或包含它們的目錄註冊為數據庫，原地查詢而不複製
+    
+    Parquet 和 CSV 暴露為視圖，DuckDB 文件以只讀方式附加，新數據庫設為當前數據庫。
+    """
+    try:
+        entry = await db_executor.run_duckdb(
+            data_sources.register_source, source_request.path, source_request.name
+        )
+    except Exception as e:
+        raise local_source_error(e)
+    
+    return {
+        "status": "success",
+        "message": f"已註冊本地數據: {entry['source']}",
+        "tables_count": len(entry["views"]),
+        "tables": [view["name"] for view in entry["views"]],
+        "filename": entry["name"],
+        "db_id": entry["db_id"]
+    }
+
+@app.get("/duckdb/databases")
+async def list_databases():
+    """列出已註冊的數據庫"""
+    def _list():
+        return {
+            "databases": db_registry.registry.list(),
+            "current_id": db_registry.registry.current_id
+        }
+    
+    return await in_thread(_list)
+
+@app.post("/duckdb/databases/{db_id}/select")
+async def select_database(db_id: str):
+    """設置未指定 db_id 的請求所使用的當前數據庫"""
+    try:
+        entry = await in_thread(db_registry.registry.select, db_id)
+    except db_registry.DatabaseNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success", "message": f"當前數據庫: {entry['name']}", "db_id": db_id}
+
+@app.delete("/duckdb/databases/{db_id}")
+async def remove_database(db_id: str):
+    """移除數據庫，關閉其連接池；由本服務保存的文件會被刪除（本地數據源只刪除視圖文件，源文件保留）"""
+    try:
+        entry = await in_thread(db_registry.registry.remove, db_id)
+    except db_registry.DatabaseNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    try:
+        def _close():
+            duckdb_pool.close_pool(entry["path"])
+            invalidate_database_caches(entry["path"])
+            data_sources.forget(entry["path"])
+            if entry.get("managed"):
+                for path in (entry["path"], f"{entry['path']}.wal"):
+                    if os.path.exists(path):
+                        os.remove(path)
         
+        await db_executor.run_duckdb(_close)
     except Exception as e:
-        logger.error(f"上傳文件失敗: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"上傳文件失敗: {str(e)}")
+        logger.warning(f"清理數據庫 {db_id} 失敗: {str(e)}")
+    
+    return {"status": "success", "message": f"已移除數據庫: {entry['name']}", "db_id": db_id}
 
 @app.get("/duckdb/tables")
-async def get_tables():
+async def get_tables(
+    db_id: Optional[str] = Query(None, description="數據庫 id，默認使用當前數據庫")
+):
     """獲取 DuckDB 中的所有表"""
-    if not current_duckdb_path or not os.path.exists(current_duckdb_path):
-        raise HTTPException(status_code=400, detail="請先上傳 DuckDB 文件")
+    db_path = await resolve_database_path(db_id)
     
     try:
-        conn = duckdb.connect(current_duckdb_path)
-        tables = conn.execute("SHOW TABLES").fetchall()
-        table_names = [table[0] for table in tables]
-        conn.close()
+        def _list_tables():
+            with duckdb_pool.get_pool(db_path).cursor() as conn:
+                return metadata_cache.list_tables(conn, db_path)
+        
+        table_names = await db_executor.run_duckdb(_list_tables)
         
         return {"tables": table_names}
         
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"獲取表列表失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"獲取表列表失敗: {str(e)}")
 
 @app.get("/duckdb/table/{table_name}/info")
-async def get_table_info(table_name: str):
+async def get_table_info(
+    table_name: str,
+    exact: bool = Query(False, description="是否計算精確行數，否則使用 DuckDB 的估計值"),
+    db_id: Optional[str] = Query(None, description="數據庫 id，默認使用當前數據庫")
+):
     """獲取表的結構信息"""
-    if not current_duckdb_path or not os.path.exists(current_duckdb_path):
-        raise HTTPException(status_code=400, detail="請先上傳 DuckDB 文件")
+    db_path = await resolve_database_path(db_id)
     
     try:
-        conn = duckdb.connect(current_duckdb_path)
-        
-        # 獲取表結構
-        schema_info = conn.execute(f"DESCRIBE {table_name}").fetchall()
+        def _table_info():
+            with duckdb_pool.get_pool(db_path).cursor() as conn:
+                # 獲取表結構
+                schema_info = metadata_cache.describe_table(conn, db_path, table_name)
+                
+                # 獲取行數
+                row_count = metadata_cache.row_count(conn, db_path, table_name, exact)
+            return schema_info, row_count
         
-        # 獲取行數
-        row_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-        
-        conn.close()
+        schema_info, (row_count, row_count_exact) = await db_executor.run_duckdb(_table_info)
         
         columns = []
         for col in schema_info:
@@ -316,33 +1044,63 @@ async def get_table_info(table_name: str):
         return {
             "table_name": table_name,
             "row_count": row_count,
+            "row_count_exact": row_count_exact,
             "columns": columns
         }
         
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"獲取表信息失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"獲取表信息失敗: {str(e)}")
 
 @app.get("/duckdb/table/{table_name}/data")
-async def get_table_data(table_name: str, limit: int = Query(100, ge=1, le=10000)):
+async def get_table_data(
+    request: Request,
+    table_name: str,
+    limit: Optional[int] = Query(None, ge=1, description="返回行數，非流式模式默認 100，最多 10000"),
+    stream: Optional[str] = Query(None, description="流式輸出格式：ndjson、json、arrow 或 parquet"),
+    cursor: Optional[str] = Query(None, description="上一頁返回的 next_cursor"),
+    offset: Optional[int] = Query(None, ge=0, description="沒有 cursor 時使用的行偏移量"),
+    exact: bool = Query(False, description="是否計算精確總行數，否則使用 DuckDB 的估計值"),
+    db_id: Optional[str] = Query(None, description="數據庫 id，默認使用當前數據庫")
+):
     """獲取表中的數據"""
-    if not current_duckdb_path or not os.path.exists(current_duckdb_path):
-        raise HTTPException(status_code=400, detail="請先上傳 DuckDB 文件")
+    db_path = await resolve_database_path(db_id)
+    
+    stream = resolve_stream_format(request, stream)
+    if stream:
+        # 流式模式不限制行數，除非明確指定 limit
+        query = f"SELECT * FROM {table_name}"
+        if limit:
+            query += f" LIMIT {limit}"
+        try:
+            rows_stream = await result_stream.open_stream(
+                db_path, query, settings.stream_batch_size
+            )
+            return streaming_response(rows_stream, stream, filename=table_name)
+        except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            logger.error(f"獲取表數據失敗: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"獲取表數據失敗: {str(e)}")
+    
+    limit = limit or 100
+    if limit > 10000:
+        raise HTTPException(status_code=422, detail="非流式模式下 limit 不能超過 10000")
     
     try:
-        conn = duckdb.connect(current_duckdb_path)
-        
-        # 獲取數據
-        query = f"SELECT * FROM {table_name} LIMIT {limit}"
-        results = conn.execute(query).fetchall()
-        
-        # 獲取列名
-        columns = [desc[0] for desc in conn.description]
+        def _table_data():
+            with duckdb_pool.get_pool(db_path).cursor() as conn:
+                # 獲取數據
+                page = pagination.fetch_page(conn, table_name, limit, cursor=cursor, offset=offset)
+                
+                # 獲取總行數
+                total_count = metadata_cache.row_count(conn, db_path, table_name, exact)
+            return page, total_count
         
-        # 獲取總行數
-        total_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-        
-        conn.close()
+        page, (total_count, total_count_exact) = await db_executor.run_duckdb(_table_data)
+        results, columns = page["rows"], page["columns"]
         
         # 轉換為字典列表
         data = []
@@ -355,40 +1113,266 @@ async def get_table_data(table_name: str, limit: int = Query(100, ge=1, le=10000
         return {
             "table_name": table_name,
             "total_count": total_count,
+            "total_count_exact": total_count_exact,
             "returned_count": len(data),
-            "data": data
+            "data": data,
+            "next_cursor": page["next_cursor"],
+            "offset": page["offset"]
         }
         
+    except pagination.InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"獲取表數據失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"獲取表數據失敗: {str(e)}")
 
-@app.post("/duckdb/query")
-async def execute_sql_query(query_request: SQLQueryRequest):
-    """執行自定義 SQL 查詢"""
-    if not current_duckdb_path or not os.path.exists(current_duckdb_path):
-        raise HTTPException(status_code=400, detail="請先上傳 DuckDB 文件")
+@app.get("/duckdb/table/{table_name}/rows")
+async def get_table_rows(
+    table_name: str,
+    start: int = Query(0, ge=0, description="起始行位置"),
+    count: int = Query(100, ge=1, le=10000, description="讀取行數"),
+    include_extent: bool = Query(False, description="是否同時返回可滾動的行位置總數"),
+    db_id: Optional[str] = Query(None, description="數據庫 id，默認使用當前數據庫")
+):
+    """按行位置讀取表格的一段數據，供前端虛擬滾動使用"""
+    db_path = await resolve_database_path(db_id)
+    
+    try:
+        def _table_rows():
+            with duckdb_pool.get_pool(db_path).cursor() as conn:
+                rows_range = pagination.fetch_range(conn, table_name, start, count)
+                if include_extent:
+                    # 使用緩存的估計行數，避免每次打開表格都掃描整張表
+                    rows_range["row_extent"], _ = metadata_cache.row_count(conn, db_path, table_name, False)
+            return rows_range
+        
+        rows_range = await db_executor.run_duckdb(_table_rows)
+        
+        return {
+            "table_name": table_name,
+            "start": start,
+            "columns": rows_range["columns"],
+            "rows": [list(row) for row in rows_range["rows"]],
+            "positions": rows_range["positions"],
+            "row_extent": rows_range.get("row_extent")
+        }
+        
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"獲取表數據範圍失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"獲取表數據範圍失敗: {str(e)}")
+
+@app.post("/duckdb/table/{table_name}/search")
+async def search_table(table_name: str, search_request: DuckDBSearchRequest):
+    """在表格的數組列上執行精確向量搜索（L2、IP 或 COSINE）"""
+    db_path = await resolve_database_path(search_request.db_id)
+    if not result_stream.arrow_available():
+        raise HTTPException(status_code=501, detail="服務器未安裝 pyarrow，無法執行向量搜索")
+    if not 1 <= search_request.limit <= 16384:
+        raise HTTPException(status_code=400, detail="limit 必須在 1 到 16384 之間")
     
     try:
-        conn = duckdb.connect(current_duckdb_path)
+        def _search():
+            with duckdb_pool.get_pool(db_path).cursor() as conn:
+                schema_info = metadata_cache.describe_table(conn, db_path, table_name)
+                return vector_search.search_table(
+                    conn,
+                    table_name,
+                    search_request.vector_column,
+                    search_request.vectors,
+                    search_request.limit,
+                    metric_type=search_request.metric_type,
+                    output_fields=search_request.output_fields,
+                    filter_expr=search_request.filter,
+                    columns=[col[0] for col in schema_info]
+                )
         
-        # 執行查詢
-        result = conn.execute(query_request.query)
+        result = await db_executor.run_duckdb(_search)
         
-        # 檢查是否有結果
+        return {
+            "table_name": table_name,
+            "vector_column": search_request.vector_column,
+            **result
+        }
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"向量搜索失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"向量搜索失敗: {str(e)}")
+
+@app.get("/duckdb/table/{table_name}/profile")
+async def profile_table(
+    request: Request,
+    table_name: str,
+    mode: str = Query("sampled", description="sampled：在樣本上近似計算；exact：掃描整張表精確計算"),
+    bins: Optional[int] = Query(None, ge=1, le=200, description="直方圖分箱數，默認 PROFILE_HISTOGRAM_BINS"),
+    sample_rows: Optional[int] = Query(None, ge=1, description="sampled 模式的樣本行數，默認 PROFILE_SAMPLE_ROWS"),
+    columns: Optional[str] = Query(None, description="只分析這些列，以逗號分隔"),
+    timeout: Optional[float] = Query(None, ge=0, description="時限（秒），默認 QUERY_TIMEOUT"),
+    db_id: Optional[str] = Query(None, description="數據庫 id，默認使用當前數據庫")
+):
+    """列分析：每列的統計值、去重數、分位數和直方圖
+
+    結果按數據庫文件指紋緩存，表被修改後自動失效。
+    """
+    db_path = await resolve_database_path(db_id)
+    if mode not in table_profile.PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的分析模式: {mode}，可選: {', '.join(table_profile.PROFILE_MODES)}")
+    bins = bins or settings.profile_histogram_bins
+    sample_rows = sample_rows or settings.profile_sample_rows
+    selected = [name.strip() for name in columns.split(",") if name.strip()] if columns else None
+    cache_name = f"{table_name}|{mode}|{bins}|{sample_rows}|{','.join(selected or [])}"
+    handle = query_control.QueryHandle(query_control.effective_timeout(timeout))
+
+    try:
+        def _profile():
+            started = time.perf_counter()
+            loaded = []
+
+            with duckdb_pool.get_pool(db_path).cursor() as conn:
+                handle.attach(conn)
+                try:
+                    row_count, row_count_exact = metadata_cache.row_count(conn, db_path, table_name, mode == "exact")
+
+                    def _load():
+                        loaded.append(True)
+                        return table_profile.profile_table(
+                            conn, table_name, mode, bins, sample_rows, row_count, selected
+                        )
+
+                    profile = metadata_cache.metadata_cache.get_or_load(db_path, "profile", cache_name, _load)
+                finally:
+                    handle.detach()
+
+            return profile, row_count, row_count_exact, not loaded, time.perf_counter() - started
+
+        profile, row_count, row_count_exact, cached, elapsed = await query_control.run(
+            handle, _profile, request=request
+        )
+
+        return {
+            "table_name": table_name,
+            "mode": mode,
+            "row_count": row_count,
+            "row_count_exact": row_count_exact,
+            "sample_rows": sample_rows if profile["sampled"] else None,
+            **profile,
+            "elapsed_seconds": round(elapsed, 3),
+            "cached": cached
+        }
+
+    except query_control.QueryInterruptedError as e:
+        raise query_interrupted_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"列分析失敗: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"列分析失敗: {str(e)}")
+
+def query_interrupted_error(e: query_control.QueryInterruptedError) -> HTTPException:
+    """超時返回 504；客戶端已斷開時響應不會被讀取，使用 499 便於在日誌中區分"""
+    if e.reason == query_control.TIMEOUT:
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=499, detail=str(e))
+
+@app.post("/duckdb/query")
+async def execute_sql_query(request: Request, query_request: SQLQueryRequest):
+    """執行自定義 SQL 查詢
+    
+    查詢超過時限（請求的 timeout 或 QUERY_TIMEOUT）或客戶端斷開時調用 interrupt() 中斷，
+    DuckDB 停止執行並歸還連接池名額。
+    """
+    db_path = await resolve_database_path(query_request.db_id)
+    
+    # 寫入語句執行後需要使元數據緩存失效
+    read_only = metadata_cache.is_read_only_statement(query_request.query)
+    check_writable(read_only)
+    handle = query_control.QueryHandle(query_control.effective_timeout(query_request.timeout))
+    
+    stream = resolve_stream_format(request, query_request.stream)
+    if stream:
         try:
-            rows = result.fetchall()
-            columns = [desc[0] for desc in result.description] if result.description else []
-        except:
-            # 對於 INSERT, UPDATE, DELETE 等語句
-            conn.close()
+            rows_stream = await result_stream.open_stream(
+                db_path, query_request.query, settings.stream_batch_size, handle, request
+            )
+        except query_control.QueryInterruptedError as e:
+            raise query_interrupted_error(e)
+        except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            logger.error(f"執行查詢失敗: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"執行查詢失敗: {str(e)}")
+        finally:
+            if not read_only:
+                invalidate_database_caches(db_path)
+        
+        if not rows_stream.columns:
+            # 沒有結果集的語句無需流式輸出
+            rows_stream.close()
             return {
                 "message": "查詢執行成功",
                 "data": [],
-                "affected_rows": result.rowcount if hasattr(result, 'rowcount') else 0
+                "affected_rows": 0
             }
+        return streaming_response(rows_stream, stream)
+    
+    use_cache = (
+        settings.query_cache_enabled and query_request.cache and read_only
+        and query_cache.is_cacheable(query_request.query)
+    )
+    
+    try:
+        def _execute():
+            cache_key = None
+            if use_cache:
+                fingerprint = metadata_cache.metadata_cache.fingerprint(db_path)
+                cache_key = query_cache.make_key(query_request.query, fingerprint)
+                cached = query_cache.query_cache.get(cache_key)
+                if cached is not None:
+                    return cached[0], cached[1], None, True
+            
+            with duckdb_pool.get_pool(db_path).cursor() as conn:
+                handle.attach(conn)
+                try:
+                    # 執行查詢
+                    try:
+                        result = conn.execute(query_request.query)
+                    finally:
+                        if not read_only:
+                            invalidate_database_caches(db_path)
+                    
+                    # 檢查是否有結果
+                    try:
+                        rows = result.fetchall()
+                        columns = [desc[0] for desc in result.description] if result.description else []
+                    except:
+                        if handle.reason is not None:
+                            raise
+                        # 對於 INSERT, UPDATE, DELETE 等語句
+                        return None, [], result.rowcount if hasattr(result, 'rowcount') else 0, False
+                finally:
+                    handle.detach()
+            
+            if cache_key is not None:
+                query_cache.query_cache.put(cache_key, (rows, columns))
+            return rows, columns, None, False
         
-        conn.close()
+        rows, columns, affected_rows, cached = await query_control.run(handle, _execute, request=request)
+        
+        if rows is None:
+            return {
+                "message": "查詢執行成功",
+                "data": [],
+                "affected_rows": affected_rows
+            }
         
         # 轉換為字典列表
         data = []
@@ -401,13 +1385,86 @@ async def execute_sql_query(query_request: SQLQueryRequest):
         return {
             "query": query_request.query,
             "returned_count": len(data),
-            "data": data
+            "data": data,
+            "cached": cached
         }
         
+    except query_control.QueryInterruptedError as e:
+        raise query_interrupted_error(e)
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"執行查詢失敗: {str(e)}")
         raise HTTPException(status_code=500, detail=f"執行查詢失敗: {str(e)}")
 
+@app.post("/duckdb/jobs")
+async def submit_sql_job(job_request: SQLJobRequest):
+    """提交後台 SQL 任務，立即返回任務 id；結果完成後通過 /duckdb/jobs/{job_id}/results 分頁讀取"""
+    db_path = await resolve_database_path(job_request.db_id)
+    check_writable(metadata_cache.is_read_only_statement(job_request.query))
+    timeout = settings.sql_job_timeout if job_request.timeout is None else job_request.timeout
+    try:
+        job = await sql_jobs.sql_job_manager.submit(
+            db_path, job_request.query, timeout or None, invalidate_database_caches
+        )
+    except db_executor.ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+@app.get("/duckdb/jobs")
+async def list_sql_jobs():
+    """列出未過期的 SQL 任務"""
+    return {"jobs": await sql_jobs.sql_job_manager.list_jobs()}
+
+@app.get("/duckdb/jobs/{job_id}")
+async def get_sql_job(job_id: str):
+    """查詢任務狀態和進度"""
+    try:
+        return (await sql_jobs.sql_job_manager.get(job_id)).to_dict()
+    except sql_jobs.SQLJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/duckdb/jobs/{job_id}/results")
+async def get_sql_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """分頁讀取已完成任務的結果"""
+    try:
+        job = await sql_jobs.sql_job_manager.get(job_id)
+        return await db_executor.run_duckdb(job.read_page, offset, limit)
+    except sql_jobs.SQLJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except sql_jobs.SQLJobNotReadyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (duckdb_pool.PoolTimeoutError, db_executor.ExecutorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/duckdb/jobs/{job_id}/download")
+async def download_sql_job_results(job_id: str):
+    """下載已完成任務的完整結果（Parquet）"""
+    try:
+        job = await sql_jobs.sql_job_manager.get(job_id)
+    except sql_jobs.SQLJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if job.status != "completed" or job.result_path is None:
+        raise HTTPException(status_code=409, detail=f"任務 {job_id} 沒有可下載的 Parquet 結果")
+    return FileResponse(
+        job.result_path,
+        media_type=result_stream.STREAM_MEDIA_TYPES["parquet"],
+        filename=f"{job_id}.parquet"
+    )
+
+@app.delete("/duckdb/jobs/{job_id}")
+async def delete_sql_job(job_id: str):
+    """取消未結束的任務，或刪除已結束任務的結果"""
+    try:
+        job = await sql_jobs.sql_job_manager.remove(job_id)
+    except sql_jobs.SQLJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return job.to_dict()
+
 # ==================== 通用端點 ====================
 
 @app.get("/")
@@ -418,23 +1475,155 @@ async def serve_frontend():
 @app.get("/health")
 async def health_check():
     """健康檢查端點"""
+    def _health():
+        return {
+            "status": "healthy",
+            "milvus_connected": bool(milvus_connections.list()),
+            "duckdb_loaded": db_registry.registry.current_id is not None,
+            "duckdb_databases": len(db_registry.registry.list()),
+            "pymilvus_loaded": milvus_manager.pymilvus_import_seconds is not None,
+            "startup_timings": startup_timings,
+            "temp_dir": temp_dir
+        }
+    
+    return await in_thread(_health)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """獲取元數據緩存和查詢結果緩存的命中統計"""
+    return {
+        "metadata": metadata_cache.metadata_cache.stats(),
+        "parquet_metadata": data_sources.parquet_metadata_cache.stats(),
+        "query_results": query_cache.query_cache.stats(),
+        "milvus_collections": collection_manager.stats(),
+        "milvus_overview": milvus_overview.overview_cache.stats()
+    }
+
+@app.get("/executors/stats")
+async def get_executor_stats():
+    """獲取數據庫執行器和連接池的使用情況"""
+    return {
+        "executors": db_executor.executor_stats(),
+        "duckdb_pools": duckdb_pool.pool_stats(),
+        "queries": query_control.query_stats.stats()
+    }
+
+def collect_stats() -> Dict[str, Any]:
+    """彙總請求指標、系統資源和各組件狀態（包含文件系統遍歷，需在線程中調用）"""
     return {
-        "status": "healthy",
-        "milvus_connected": milvus_client is not None,
-        "duckdb_loaded": current_duckdb_path is not None,
-        "temp_dir": temp_dir
+        "api_usage": metrics.request_metrics.usage_stats().dict(),
+        "endpoints": [
+            {"method": method, "route": route, **endpoint.to_dict()}
+            for method, route, endpoint in metrics.request_metrics.snapshot()
+        ],
+        "system": metrics.system_stats(settings.upload_dir, [settings.temp_dir, temp_dir]).dict(),
+        "executors": db_executor.executor_stats(),
+        "duckdb_pools": duckdb_pool.pool_stats(),
+        "duckdb_memory": metrics.duckdb_memory_usage(),
+        "queries": query_control.query_stats.stats(),
+        "milvus_connections": milvus_connections.list(),
+        "uptime_seconds": round(time.time() - metrics.request_metrics.started_at, 1)
     }
 
+@app.get("/stats")
+async def get_stats():
+    """以 JSON 返回 API 使用統計、各端點延遲、系統資源和 DuckDB 內存使用"""
+    return await asyncio.get_running_loop().run_in_executor(None, collect_stats)
+
+def render_metrics() -> str:
+    writer = metrics.PrometheusWriter()
+    metrics.write_request_metrics(writer)
+    metrics.write_component_metrics(
+        writer,
+        db_executor.executor_stats(),
+        duckdb_pool.pool_stats(),
+        query_control.query_stats.stats(),
+        metrics.duckdb_memory_usage(),
+        milvus_connections.list(),
+    )
+    return writer.render()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指標"""
+    content = await asyncio.get_running_loop().run_in_executor(None, render_metrics)
+    return Response(content, media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def startup_event():
+    """從目錄恢復已註冊的數據庫，清理過期的上傳會話，並預先打開當前數據庫的連接池"""
+    started = time.perf_counter()
+    # 恢復目錄時所有條目都作為新增條目通知 on_catalog_change，本地數據源隨之恢復
+    await in_thread(db_registry.registry.load)
+    try:
+        await db_executor.run_duckdb(upload_pipeline.upload_sessions.cleanup_expired)
+        await db_executor.run_duckdb(sql_jobs.sql_job_manager.cleanup_orphans)
+    except Exception as e:
+        logger.warning(f"清理上傳會話或遺留的任務結果失敗: {str(e)}")
+    current_id = await in_thread(lambda: db_registry.registry.current_id)
+    if current_id is not None:
+        try:
+            path = (await in_thread(db_registry.registry.get, current_id))["path"]
+            await db_executor.run_duckdb(duckdb_pool.get_pool, path)
+        except Exception as e:
+            logger.warning(f"預先打開數據庫 {current_id} 失敗: {str(e)}")
+    
+    startup_timings["startup"] = round(time.perf_counter() - started, 3)
+    # 由 start.py 啟動時可以算出從執行啟動腳本到可以處理請求的總時間
+    launched_at = os.environ.get("DB_VIEWER_LAUNCHED_AT")
+    if launched_at:
+        startup_timings["since_launch"] = round(time.time() - float(launched_at), 3)
+    logger.info(f"啟動完成: {startup_timings}")
+    
+    if settings.pymilvus_preload:
+        asyncio.get_running_loop().create_task(preload_pymilvus())
+    global milvus_health_task
+    milvus_health_task = asyncio.get_running_loop().create_task(milvus_health_loop())
+
+async def preload_pymilvus():
+    """在後台線程中導入 pymilvus，之後的 Milvus 請求無需等待導入"""
+    await asyncio.sleep(PYMILVUS_PRELOAD_DELAY)
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, load_pymilvus)
+        startup_timings["pymilvus_import"] = round(milvus_manager.pymilvus_import_seconds, 3)
+    except ImportError:
+        logger.warning("未安裝 pymilvus，Milvus 相關功能不可用")
+
+async def milvus_health_loop():
+    """定期探測各 Milvus 連接，失敗的連接在退避時間過後重建；沒有連接時不導入 pymilvus"""
+    while True:
+        delay = milvus_connections.next_check_in()
+        if delay is None:
+            delay = MILVUS_CHECK_MAX_SLEEP
+        await asyncio.sleep(min(max(delay, MILVUS_CHECK_MIN_SLEEP), MILVUS_CHECK_MAX_SLEEP))
+        try:
+            await db_executor.run_milvus(milvus_connections.check)
+        except db_executor.ExecutorSaturatedError:
+            pass
+        except Exception as e:
+            logger.warning(f"Milvus 健康檢查失敗: {str(e)}")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """應用關閉時清理資源"""
     try:
-        # 斷開 Milvus 連接
-        if milvus_client:
-            from pymilvus import connections
-            connections.disconnect("default")
+        # 停止健康檢查並斷開本進程的 Milvus 連接
+        if milvus_health_task is not None:
+            milvus_health_task.cancel()
+        await milvus_overview.overview_cache.shutdown()
+        milvus_connections.close()
+        
+        # 停止快照任務（已提交的進度保留在數據庫中）
+        await snapshot_jobs.snapshot_manager.shutdown()
+        await sql_jobs.sql_job_manager.shutdown()
+        
+        # 停止數據庫執行器並關閉所有 DuckDB 連接池
+        db_executor.shutdown()
+        vector_search.shutdown()
+        duckdb_pool.close_all()
+        query_cache.query_cache.clear()
         
-        # 清理臨時文件
+        # 清理臨時文件（上傳的數據庫保存在上傳目錄，不會被刪除）
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
             
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+DuckDB 元數據緩存
+緩存表格列表、表結構和行數，以數據庫文件的路徑、大小、修改時間和寫入代數作為鍵，
+文件變化或通過本服務寫入後自動失效。數據庫中的視圖讀取外部文件（Parquet、CSV、
+附加的數據庫）時，這些文件登記為依賴，其大小和修改時間同樣計入指紋。
+"""
+
+import os
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sql_text
+
+# 只讀語句的主關鍵字
+READ_ONLY_KEYWORDS = {"SELECT", "SHOW", "DESCRIBE", "SUMMARIZE", "FROM", "VALUES", "TABLE"}
+
+Fingerprint = Tuple[str, int, int, int, int]
+
+
+def statement_keyword(tokens: List[sql_text.Token]) -> str:
+    """一條語句的主關鍵字（大寫）
+
+    跳過開頭的括號；WITH 語句返回 CTE 列表之後的關鍵字（WITH ... INSERT 是寫入語句），
+    EXPLAIN [ANALYZE] 返回被解釋語句的關鍵字。字符串、帶引號的標識符和註釋不參與判斷。
+    """
+    index = 0
+    while index < len(tokens) and tokens[index].text == "(":
+        index += 1
+    if index >= len(tokens) or tokens[index].kind != sql_text.WORD:
+        return ""
+    keyword = tokens[index].text.upper()
+    rest = tokens[index + 1:]
+    if keyword == "EXPLAIN":
+        if rest and sql_text.is_keyword(rest[0], "ANALYZE", "ANALYSE"):
+            rest = rest[1:]
+        return statement_keyword(rest)
+    if keyword != "WITH":
+        return keyword
+
+    # 頂層緊跟在右括號之後的詞：列名列表之後是 AS，CTE 主體之後是逗號或主語句的關鍵字
+    depth = 0
+    previous = None
+    for token in rest:
+        if token.kind == sql_text.SYMBOL and token.text == "(":
+            depth += 1
+        elif token.kind == sql_text.SYMBOL and token.text == ")":
+            depth -= 1
+        elif (
+            depth == 0 and token.kind == sql_text.WORD and previous is not None
+            and previous.text == ")" and not sql_text.is_keyword(token, "AS")
+        ):
+            return token.text.upper()
+        previous = token
+    return ""
+
+
+def is_read_only_statement(sql: str) -> bool:
+    """判斷 SQL 是否為不會修改數據庫的只讀語句，多條語句時每一條都必須是只讀的"""
+    statements = sql_text.split_statements(sql_text.significant_tokens(sql))
+    return bool(statements) and all(statement_keyword(tokens) in READ_ONLY_KEYWORDS for tokens in statements)
+
+
+class MetadataCache:
+    """按文件指紋緩存的元數據"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations: Dict[str, int] = {}
+        self._fingerprints: Dict[str, Fingerprint] = {}
+        self._dependencies: Dict[str, List[str]] = {}
+        self._entries: Dict[Tuple[Fingerprint, str, str], Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def set_dependencies(self, path: str, files: List[str]):
+        """登記數據庫中的視圖所讀取的外部文件"""
+        with self._lock:
+            if files:
+                self._dependencies[path] = list(files)
+            else:
+                self._dependencies.pop(path, None)
+            self._drop_path(path)
+
+    def _dependencies_signature(self, path: str) -> int:
+        with self._lock:
+            files = self._dependencies.get(path)
+        if not files:
+            return 0
+        stats = []
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+                stats.append((file_path, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                stats.append((file_path, -1, -1))
+        return zlib.crc32(repr(stats).encode("utf-8"))
+
+    def fingerprint(self, path: str) -> Fingerprint:
+        """文件指紋：路徑、大小、修改時間、寫入代數和依賴文件的簽名"""
+        stat = os.stat(path)
+        with self._lock:
+            generation = self._generations.get(path, 0)
+        return (path, stat.st_size, stat.st_mtime_ns, generation, self._dependencies_signature(path))
+
+    def invalidate(self, path: str):
+        """使指定文件的所有緩存失效"""
+        with self._lock:
+            self._generations[path] = self._generations.get(path, 0) + 1
+            self._drop_path(path)
+
+    def _drop_path(self, path: str):
+        stale = [key for key in self._entries if key[0][0] == path]
+        for key in stale:
+            del self._entries[key]
+        self._fingerprints.pop(path, None)
+
+    def get_or_load(self, path: str, kind: str, name: str, loader: Callable[[], Any]) -> Any:
+        """讀取緩存，未命中時調用 loader 並保存結果"""
+        fingerprint = self.fingerprint(path)
+        key = (fingerprint, kind, name)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = loader()
+
+        with self._lock:
+            # 文件已變化時丟棄舊指紋下的條目
+            if self._fingerprints.get(path) != fingerprint:
+                self._drop_path(path)
+                self._fingerprints[path] = fingerprint
+            self._entries[key] = value
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中統計"""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+metadata_cache = MetadataCache()
+
+
+def list_tables(conn, path: str) -> List[str]:
+    """獲取表格列表"""
+    def _load():
+        return [row[0] for row in conn.execute("SHOW TABLES").fetchall()]
+    return metadata_cache.get_or_load(path, "tables", "", _load)
+
+
+def describe_table(conn, path: str, table_name: str) -> List[tuple]:
+    """獲取表結構"""
+    def _load():
+        return conn.execute(f"DESCRIBE {table_name}").fetchall()
+    return metadata_cache.get_or_load(path, "describe", table_name, _load)
+
+
+def _estimated_count(conn, table_name: str) -> Optional[int]:
+    schema_name, _, name = table_name.rpartition(".")
+    query = "SELECT estimated_size FROM duckdb_tables() WHERE table_name = ?"
+    params = [name]
+    if schema_name:
+        query += " AND schema_name = ?"
+        params.append(schema_name)
+    row = conn.execute(query, params).fetchone()
+    return row[0] if row else None
+
+
+def row_count(conn, path: str, table_name: str, exact: bool = False) -> Tuple[int, bool]:
+    """獲取行數，返回 (行數, 是否精確)
+
+    非精確模式使用 duckdb_tables() 的估計值，視圖沒有估計值時回退到 COUNT(*)。
+    """
+    if not exact:
+        estimated = metadata_cache.get_or_load(
+            path, "estimated_count", table_name, lambda: _estimated_count(conn, table_name)
+        )
+        if estimated is not None:
+            return estimated, False
+
+    def _load():
+        return conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    return metadata_cache.get_or_load(path, "count", table_name, _load), True
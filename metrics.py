@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+請求指標
+ASGI 中間件按路由模板記錄每個端點的請求數、狀態碼、錯誤數、發送位元組數和延遲直方圖，
+以及正在處理的請求數。流式響應的延遲計算到最後一個數據塊發出為止。
+
+/stats 以 JSON 返回 APIUsageStats、SystemStats 和各端點明細；/metrics 以 Prometheus
+文本格式輸出同樣的數據，並附帶 DuckDB 內存、連接池、執行器和查詢計數等指標。
+"""
+
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+
+import duckdb_pool
+from api_models import APIUsageStats, SystemStats
+
+try:
+    import psutil
+except ImportError:  # psutil 為可選依賴，未安裝時 CPU 和內存使用率為空
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# 延遲直方圖的桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 沒有匹配到路由的請求（靜態文件、404 等）歸入同一個標籤，避免標籤數量無限增長
+UNMATCHED_ROUTE = "other"
+
+SIZE_UNITS = {
+    "bytes": 1, "b": 1,
+    "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3, "tb": 1000 ** 4,
+    "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3, "tib": 1024 ** 4,
+}
+
+
+class EndpointMetrics:
+    """單個端點（方法 + 路由模板）的累計指標"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.statuses: Dict[int, int] = {}
+        self.bytes_sent = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, status: int, seconds: float, bytes_sent: int):
+        self.count += 1
+        if status >= 400:
+            self.errors += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_sent += bytes_sent
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "bytes_sent": self.bytes_sent,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+
+class RequestMetrics:
+    """所有端點的請求指標"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[Tuple[str, str], EndpointMetrics] = {}
+        self.in_flight = 0
+        self.started_at = time.time()
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float, bytes_sent: int):
+        with self._lock:
+            self.in_flight -= 1
+            endpoint = self._endpoints.get((method, route))
+            if endpoint is None:
+                endpoint = self._endpoints[(method, route)] = EndpointMetrics()
+            endpoint.observe(status, seconds, bytes_sent)
+
+    def snapshot(self) -> List[Tuple[str, str, EndpointMetrics]]:
+        """各端點指標的副本，按請求數降序"""
+        with self._lock:
+            items = []
+            for (method, route), endpoint in self._endpoints.items():
+                copy = EndpointMetrics()
+                copy.__dict__.update({**endpoint.__dict__, "statuses": dict(endpoint.statuses),
+                                      "buckets": list(endpoint.buckets)})
+                items.append((method, route, copy))
+        return sorted(items, key=lambda item: item[2].count, reverse=True)
+
+    def usage_stats(self, top: int = 10) -> APIUsageStats:
+        endpoints = self.snapshot()
+        total = sum(endpoint.count for _, _, endpoint in endpoints)
+        failed = sum(endpoint.errors for _, _, endpoint in endpoints)
+        total_seconds = sum(endpoint.total_seconds for _, _, endpoint in endpoints)
+        return APIUsageStats(
+            total_requests=total,
+            successful_requests=total - failed,
+            failed_requests=failed,
+            avg_response_time=round(total_seconds / total, 6) if total else 0.0,
+            most_used_endpoints={f"{method} {route}": endpoint.count for method, route, endpoint in endpoints[:top]},
+        )
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """記錄請求指標的 ASGI 中間件（不緩衝響應，流式輸出不受影響）"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Optional[Dict[Any, str]] = None
+
+    def _route_path(self, scope) -> str:
+        # 路由匹配後 scope 中帶有 endpoint，通過它找回路由模板，例如 /duckdb/table/{table_name}/data
+        if self._routes is None:
+            router = scope.get("router")
+            routes = getattr(router, "routes", [])
+            self._routes = {route.endpoint: route.path for route in routes if hasattr(route, "endpoint")}
+        return self._routes.get(scope.get("endpoint"), UNMATCHED_ROUTE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        bytes_sent = 0
+
+        async def send_wrapper(message):
+            nonlocal status, bytes_sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                bytes_sent += len(message.get("body", b""))
+            await send(message)
+
+        request_metrics.request_started()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_metrics.request_finished(
+                scope["method"], self._route_path(scope), status, time.perf_counter() - started, bytes_sent
+            )
+
+
+def parse_size(text: str) -> Optional[int]:
+    """解析 DuckDB 輸出的大小字符串，例如 "262KB"、"5.0GiB"、"0 bytes" """
+    match = re.match(r"^\s*([\d.]+)\s*([A-Za-z]+)\s*$", text or "")
+    if not match or match.group(2).lower() not in SIZE_UNITS:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def duckdb_memory(conn) -> Dict[str, Dict[str, Optional[int]]]:
+    """DuckDB 實例的內存使用：新版本使用 duckdb_memory() 按組件統計，
+    不支持時回退到 PRAGMA database_size 的整體內存使用和上限"""
+    try:
+        rows = conn.execute(
+            "SELECT tag, memory_usage_bytes, temporary_storage_bytes FROM duckdb_memory()"
+        ).fetchall()
+        return {tag: {"memory_bytes": memory, "temporary_bytes": temporary} for tag, memory, temporary in rows}
+    except duckdb.CatalogException:
+        pass
+    result = conn.execute("PRAGMA database_size")
+    columns = [desc[0] for desc in result.description]
+    row = dict(zip(columns, result.fetchone()))
+    return {
+        "TOTAL": {
+            "memory_bytes": parse_size(row.get("memory_usage")),
+            "memory_limit_bytes": parse_size(row.get("memory_limit")),
+        }
+    }
+
+
+def duckdb_memory_usage() -> Dict[str, Dict[str, Dict[str, Optional[int]]]]:
+    """所有已打開數據庫的內存使用；連接已全部佔用的數據庫本次跳過，不等待連接"""
+    usage = {}
+    for pool in duckdb_pool.open_pools():
+        stats = pool.stats()
+        if stats["closed"] or stats["in_use"] >= stats["pool_size"]:
+            continue
+        try:
+            with pool.cursor() as conn:
+                usage[pool.path] = duckdb_memory(conn)
+        except Exception as e:
+            logger.warning(f"讀取 {pool.path} 的內存使用失敗: {str(e)}")
+    return usage
+
+
+def _directory_stats(directory: str) -> Tuple[int, int]:
+    """目錄中的文件數和總大小"""
+    count = 0
+    size = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+                count += 1
+            except OSError:
+                pass
+    return count, size
+
+
+def system_stats(upload_dir: str, temp_dirs: List[str]) -> SystemStats:
+    """系統資源和文件統計；未安裝 psutil 時 CPU 和內存使用率為空"""
+    upload_count, _ = _directory_stats(upload_dir)
+    temp_size = sum(_directory_stats(directory)[1] for directory in temp_dirs)
+    try:
+        disk = shutil.disk_usage(upload_dir if os.path.exists(upload_dir) else ".")
+        disk_usage = round(disk.used / disk.total * 100, 1)
+    except OSError:
+        disk_usage = None
+    return SystemStats(
+        cpu_usage=psutil.cpu_percent(interval=None) if psutil else None,
+        memory_usage=psutil.virtual_memory().percent if psutil else None,
+        disk_usage=disk_usage,
+        active_connections=request_metrics.in_flight,
+        upload_files_count=upload_count,
+        temp_files_size=temp_size,
+    )
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusWriter:
+    """Prometheus 文本格式輸出"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self._declared = set()
+
+    def declare(self, name: str, kind: str, help_text: str):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value, labels: Optional[Dict[str, Any]] = None):
+        if value is None:
+            return
+        label_text = ""
+        if labels:
+            label_text = "{" + ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items()) + "}"
+        self.lines.append(f"{name}{label_text} {float(value):g}" if isinstance(value, float) else f"{name}{label_text} {value}")
+
+    def metric(self, name: str, kind: str, help_text: str, value, labels: Optional[Dict[str, Any]] = None):
+        self.declare(name, kind, help_text)
+        self.sample(name, value, labels)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def write_request_metrics(writer: PrometheusWriter):
+    writer.metric("http_requests_in_flight", "gauge", "正在處理的請求數", request_metrics.in_flight)
+    endpoints = request_metrics.snapshot()
+
+    writer.declare("http_requests_total", "counter", "按端點和狀態碼統計的請求數")
+    for method, route, endpoint in endpoints:
+        for status, count in sorted(endpoint.statuses.items()):
+            writer.sample("http_requests_total", count, {"method": method, "route": route, "status": status})
+
+    writer.declare("http_response_bytes_total", "counter", "按端點統計的響應位元組數")
+    for method, route, endpoint in endpoints:
+        writer.sample("http_response_bytes_total", endpoint.bytes_sent, {"method": method, "route": route})
+
+    writer.declare("http_request_duration_seconds", "histogram", "按端點統計的請求延遲")
+    for method, route, endpoint in endpoints:
+        labels = {"method": method, "route": route}
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, endpoint.buckets):
+            cumulative += count
+            writer.sample("http_request_duration_seconds_bucket", cumulative, {**labels, "le": f"{bound:g}"})
+        writer.sample("http_request_duration_seconds_bucket", endpoint.count, {**labels, "le": "+Inf"})
+        writer.sample("http_request_duration_seconds_sum", round(endpoint.total_seconds, 6), labels)
+        writer.sample("http_request_duration_seconds_count", endpoint.count, labels)
+
+
+def write_component_metrics(
+    writer: PrometheusWriter,
+    executors: Dict[str, Dict[str, Any]],
+    pools: Dict[str, Dict[str, Any]],
+    queries: Dict[str, int],
+    memory: Dict[str, Dict[str, Dict[str, Optional[int]]]],
+    milvus: List[Dict[str, Any]],
+):
+    """執行器、連接池、查詢計數、DuckDB 內存和 Milvus 連接指標；同名指標的樣本需連續輸出"""
+    for name, kind, help_text, field in (
+        ("executor_queued", "gauge", "執行器中排隊的任務數", "queued"),
+        ("executor_running", "gauge", "執行器中正在運行的任務數", "running"),
+        ("executor_completed_total", "counter", "執行器完成的任務數", "completed"),
+        ("executor_rejected_total", "counter", "執行器因隊列已滿拒絕的任務數", "rejected"),
+    ):
+        writer.declare(name, kind, help_text)
+        for executor, stats in executors.items():
+            writer.sample(name, stats[field], {"executor": executor})
+
+    for name, kind, help_text, field in (
+        ("duckdb_pool_size", "gauge", "DuckDB 連接池大小", "pool_size"),
+        ("duckdb_pool_in_use", "gauge", "正在使用的 DuckDB cursor 數", "in_use"),
+        ("duckdb_pool_acquired_total", "counter", "DuckDB cursor 的累計獲取次數", "total_acquired"),
+    ):
+        writer.declare(name, kind, help_text)
+        for path, stats in pools.items():
+            writer.sample(name, stats[field], {"database": path})
+
+    writer.metric("duckdb_queries_total", "counter", "執行的 SQL 查詢數", queries["started"])
+    writer.metric("duckdb_queries_timed_out_total", "counter", "因超時被中斷的查詢數", queries["timed_out"])
+    writer.metric("duckdb_queries_cancelled_total", "counter", "因客戶端斷開或取消被中斷的查詢數", queries["cancelled"])
+
+    for name, help_text, field in (
+        ("duckdb_memory_bytes", "DuckDB 內存使用", "memory_bytes"),
+        ("duckdb_temporary_storage_bytes", "DuckDB 臨時存儲使用", "temporary_bytes"),
+        ("duckdb_memory_limit_bytes", "DuckDB 內存上限", "memory_limit_bytes"),
+    ):
+        writer.declare(name, "gauge", help_text)
+        for path, tags in memory.items():
+            for tag, values in tags.items():
+                writer.sample(name, values.get(field), {"database": path, "tag": tag})
+
+    writer.declare("milvus_connection_up", "gauge", "Milvus 連接最近一次健康檢查是否成功")
+    for conn in milvus:
+        up = None if conn["healthy"] is None else int(conn["healthy"])
+        writer.sample("milvus_connection_up", up, {"connection": conn["name"]})
+    writer.declare("milvus_connection_failures", "gauge", "Milvus 連接連續失敗的次數")
+    for conn in milvus:
+        writer.sample("milvus_connection_failures", conn["failures"], {"connection": conn["name"]})
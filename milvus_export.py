@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Milvus 集合導出
+基於 pymilvus 的 query_iterator 按批次讀取整個集合，
+並逐批輸出為 NDJSON、Arrow IPC 或 Parquet，伺服器內存佔用與集合大小無關
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import db_executor
+from milvus_manager import CollectionEntry, collection_manager
+from result_stream import ChunkSink, dumps_json, pa, pq
+
+logger = logging.getLogger(__name__)
+
+# 集合導出支持的格式
+EXPORT_FORMATS = ("ndjson", "arrow", "parquet")
+
+
+def _arrow_type(field):
+    """Milvus 字段類型對應的 Arrow 類型"""
+    dtype_name = field.dtype.name
+    if dtype_name == "FLOAT_VECTOR":
+        return pa.list_(pa.float32(), field.dim)
+    if dtype_name == "BINARY_VECTOR":
+        return pa.binary(field.dim // 8)
+    return {
+        "BOOL": pa.bool_(),
+        "INT8": pa.int8(),
+        "INT16": pa.int16(),
+        "INT32": pa.int32(),
+        "INT64": pa.int64(),
+        "FLOAT": pa.float32(),
+        "DOUBLE": pa.float64(),
+        "VARCHAR": pa.string(),
+        "JSON": pa.string(),
+    }.get(dtype_name)
+
+
+def arrow_schema(entry: CollectionEntry):
+    """根據集合架構生成 Arrow schema，未知類型的字段由 pyarrow 推斷"""
+    return [(field.name, field, _arrow_type(field)) for field in entry.collection.schema.fields]
+
+
+def rows_to_record_batch(rows: List[Dict[str, Any]], schema) -> "pa.RecordBatch":
+    """將一批 Milvus 查詢結果按列轉換為 Arrow RecordBatch，向量列為定長 float32 列表"""
+    arrays = []
+    names = []
+    for name, field, arrow_type in schema:
+        values = [row.get(name) for row in rows]
+        dtype_name = field.dtype.name
+
+        if dtype_name == "FLOAT_VECTOR":
+            flat = pa.array(
+                [x for vector in values for x in vector],
+                type=pa.float32()
+            )
+            array = pa.FixedSizeListArray.from_arrays(flat, field.dim)
+        elif dtype_name == "JSON":
+            array = pa.array([None if v is None else json.dumps(v, ensure_ascii=False) for v in values])
+        elif arrow_type is not None:
+            array = pa.array(values, type=arrow_type)
+        else:
+            array = pa.array(values)
+
+        arrays.append(array)
+        names.append(name)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+class MilvusExportStream:
+    """持有一個 query_iterator 的集合導出流"""
+
+    def __init__(self, entry: CollectionEntry, batch_size: int, expr: Optional[str] = None):
+        self.entry = entry
+        self.batch_size = batch_size
+        self.expr = expr
+        self.returned_count = 0
+        self._iterator = None
+        self._schema = None
+        self._writer = None
+        self._sink = None
+        self._closed = False
+
+    def _open(self):
+        self._iterator = self.entry.collection.query_iterator(
+            batch_size=self.batch_size,
+            expr=self.expr,
+            output_fields=self.entry.field_names
+        )
+
+    def _encode_batch(self, fmt: str) -> Optional[bytes]:
+        """讀取並編碼下一批實體，沒有更多數據時返回 None"""
+        if fmt != "ndjson" and self._writer is None:
+            self._schema = arrow_schema(self.entry)
+            arrow_fields = [
+                pa.field(name, arrow_type) for name, _, arrow_type in self._schema
+                if arrow_type is not None
+            ]
+            # 所有字段類型已知時預先建立 writer，保證空集合也能輸出完整文件
+            if len(arrow_fields) == len(self._schema):
+                self._open_writer(fmt, pa.schema(arrow_fields))
+
+        rows = self._iterator.next()
+        if not rows:
+            return None
+        self.returned_count += len(rows)
+
+        if fmt == "ndjson":
+            return ("\n".join(dumps_json(row) for row in rows) + "\n").encode("utf-8")
+
+        batch = rows_to_record_batch(rows, self._schema)
+        if self._writer is None:
+            self._open_writer(fmt, batch.schema)
+        self._writer.write_batch(batch)
+        return self._sink.drain()
+
+    def _open_writer(self, fmt: str, schema):
+        self._sink = ChunkSink()
+        if fmt == "arrow":
+            self._writer = pa.ipc.new_stream(self._sink, schema)
+        else:
+            self._writer = pq.ParquetWriter(self._sink, schema)
+
+    def _finish(self) -> bytes:
+        """寫出 Arrow 流結束標記或 Parquet 文件尾"""
+        if self._writer is None:
+            return b""
+        self._writer.close()
+        return self._sink.drain()
+
+    async def iter_bytes(self, fmt: str) -> AsyncIterator[bytes]:
+        """逐批產生編碼後的數據"""
+        try:
+            while True:
+                chunk = await db_executor.run_milvus(self._encode_batch, fmt)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+            if fmt != "ndjson":
+                yield await db_executor.run_milvus(self._finish)
+            logger.info(f"集合 {self.entry.name} 導出完成，共 {self.returned_count} 條記錄")
+        except Exception as e:
+            # 響應頭已發送，只能記錄錯誤並中斷輸出
+            logger.error(f"集合導出中斷: {str(e)}")
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        """關閉服務端迭代器並歸還集合的租約，可重複調用"""
+        if self._closed:
+            return
+        self._closed = True
+        collection_manager.release_lease(self.entry)
+        if self._iterator is not None:
+            try:
+                self._iterator.close()
+            except Exception as e:
+                logger.warning(f"關閉集合迭代器失敗: {str(e)}")
+
+
+async def open_export(
+    collection_name: str,
+    batch_size: int,
+    expr: Optional[str] = None,
+    connection: Optional[str] = None,
+) -> MilvusExportStream:
+    """載入集合並創建導出流，集合不存在等錯誤在開始輸出前拋出
+
+    導出流在關閉前持有集合的租約。
+    """
+    def _open():
+        entry = collection_manager.ensure_loaded(collection_name, connection, lease=True)
+        stream = MilvusExportStream(entry, batch_size, expr)
+        try:
+            stream._open()
+        except BaseException:
+            stream.close()
+            raise
+        return stream
+    return await db_executor.run_milvus(_open)
@@ -0,0 +1,679 @@
+# -*- coding: utf-8 -*-
+"""
+Milvus 連接和集合管理器
+緩存 Collection 句柄和集合架構，記錄哪些集合已載入，
+超出數量或內存預算時釋放最久未使用的集合，重複搜索無需再次 load。
+搜索、導出、快照和基準測試在使用期間持有集合的租約，持有租約的集合不會被釋放。
+租約只在本進程內可見，多個 worker 時不按 LRU 釋放集合。
+
+可以同時保持多個命名連接（不同的服務器或數據庫），未指定時使用 "default"。
+連接參數保存在共享狀態存儲中：任一 worker 調用 /milvus/connect 後，
+其他 worker 在下一次 Milvus 操作前發現參數變化並以相同參數建立自己的連接。
+
+每個命名連接在本進程中有一個通道池（多個 pymilvus 連接別名，各自持有一個 gRPC 通道）。
+重新連接時先建立新的通道池再替換舊的，舊通道池在不再被任何集合句柄引用後才斷開，
+進行中的請求不受影響。後台健康檢查定期探測各連接，失敗後按指數退避重新連接。
+
+導入 pymilvus 需要約一秒，統一通過 load_pymilvus() 導入一次：服務啟動後在後台預先導入，
+不拖慢啟動，也不讓第一個 Milvus 請求承擔導入時間。
+"""
+
+import itertools
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import shared_state
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+# 標量字段的估計字節數（用於估算載入後的內存佔用）
+SCALAR_FIELD_BYTES = 8
+VARCHAR_FIELD_BYTES = 64
+
+DEFAULT_CONNECTION = "default"
+CONNECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# 健康檢查中每個通道探測請求的超時秒數
+PROBE_TIMEOUT = 5.0
+
+
+class CollectionNotFoundError(Exception):
+    """集合不存在"""
+
+
+class ConnectionUnavailableError(Exception):
+    """連接失敗，正在等待重連"""
+
+
+class ConnectionNotFoundError(ConnectionUnavailableError):
+    """命名連接不存在"""
+
+
+_pymilvus = None
+_pymilvus_lock = threading.Lock()
+pymilvus_import_seconds: Optional[float] = None
+
+
+def load_pymilvus():
+    """返回 pymilvus 模塊，第一次調用時導入；並發調用等待同一次導入完成"""
+    global _pymilvus, pymilvus_import_seconds
+    if _pymilvus is not None:
+        return _pymilvus
+    with _pymilvus_lock:
+        if _pymilvus is None:
+            started = time.perf_counter()
+            import pymilvus
+            pymilvus_import_seconds = time.perf_counter() - started
+            _pymilvus = pymilvus
+            logger.info(f"已導入 pymilvus {getattr(pymilvus, '__version__', '')}，耗時 {pymilvus_import_seconds:.3f} 秒")
+    return _pymilvus
+
+
+def validate_connection_name(name: str):
+    if not CONNECTION_NAME_PATTERN.match(name):
+        raise ValueError(f"無效的連接名稱: {name}（只允許字母、數字、下劃線和連字符，最長 64 個字符）")
+
+
+def _disconnect(aliases: List[str]):
+    connections = load_pymilvus().connections
+    for alias in aliases:
+        try:
+            connections.remove_connection(alias)
+        except Exception as e:
+            logger.warning(f"斷開 Milvus 連接 {alias} 失敗: {str(e)}")
+
+
+class ChannelPool:
+    """一個命名連接在本進程中的一組連接別名，每個別名各自持有一個 gRPC 通道
+
+    別名帶有代數編號，重新連接時創建的新通道池不會與仍在使用的舊通道池衝突。
+    """
+
+    _generations = itertools.count(1)
+
+    def __init__(self, name: str, params: Dict[str, Any], size: int):
+        generation = next(self._generations)
+        self.name = name
+        self.params = params
+        self.aliases = [f"{name}@{generation}.{index}" for index in range(max(1, size))]
+        self._cursor = itertools.count()
+
+        kwargs = {"host": params["host"], "port": str(params["port"])}
+        if params.get("db_name"):
+            kwargs["db_name"] = params["db_name"]
+        connections = load_pymilvus().connections
+        try:
+            for alias in self.aliases:
+                connections.connect(alias=alias, **kwargs)
+        except Exception:
+            _disconnect(self.aliases)
+            raise
+        # 最後一個引用（集合句柄、進行中的導出或快照）釋放後斷開
+        self._finalizer = weakref.finalize(self, _disconnect, list(self.aliases))
+
+    @property
+    def primary(self) -> str:
+        return self.aliases[0]
+
+    def next_alias(self) -> str:
+        """輪流返回池中的別名"""
+        return self.aliases[next(self._cursor) % len(self.aliases)]
+
+    def close(self):
+        """立即斷開，可重複調用"""
+        self._finalizer()
+
+
+class NamedConnection:
+    """一個命名連接在本進程中的通道池和健康狀態"""
+
+    def __init__(self, name: str, params: Dict[str, Any]):
+        self.name = name
+        # 共享狀態中的連接參數；與通道池的參數不同時需要重新建立通道池
+        self.params = params
+        self.pool: Optional[ChannelPool] = None
+        self.lock = threading.Lock()
+        self.healthy: Optional[bool] = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self.last_probe: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        self.server_version: Optional[str] = None
+
+    @property
+    def stale(self) -> bool:
+        """尚未建立通道池、參數已變化或健康檢查失敗"""
+        return self.pool is None or self.pool.params != self.params or self.healthy is False
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "name": self.name,
+            "host": self.params["host"],
+            "port": self.params["port"],
+            "db_name": self.params.get("db_name"),
+            "connected_at": self.params.get("connected_at"),
+            "pool_size": len(self.pool.aliases) if self.pool is not None else 0,
+            "healthy": self.healthy,
+            "server_version": self.server_version,
+            "latency_ms": self.latency_ms,
+            "last_probe": self.last_probe,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "retry_in": round(max(0.0, self.retry_at - now), 3) if self.failures else None,
+        }
+
+
+class ConnectionManager:
+    """命名的 Milvus 連接，參數保存在共享狀態中，各 worker 進程各自建立通道池"""
+
+    NAMESPACE = "milvus_connections"
+
+    def __init__(
+        self,
+        store: shared_state.SharedStore,
+        pool_size: int,
+        health_interval: float,
+        backoff: float,
+        backoff_max: float,
+    ):
+        self.store = store
+        self.pool_size = pool_size
+        self.health_interval = health_interval
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._connections: Dict[str, NamedConnection] = {}
+        self._version: Optional[int] = None
+        self._listeners: List[Callable[[str], None]] = []
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """登記回調 listener(連接名)，在連接的通道池被替換或移除後調用"""
+        self._listeners.append(listener)
+
+    def _notify(self, name: str):
+        for listener in self._listeners:
+            try:
+                listener(name)
+            except Exception as e:
+                logger.warning(f"處理 Milvus 連接 {name} 的變化失敗: {str(e)}")
+
+    def sync(self):
+        """按共享狀態更新本進程的連接列表，只有版本號變化時才重新讀取；在 Milvus 執行器的每個任務前調用"""
+        version = self.store.version(self.NAMESPACE)
+        with self._lock:
+            if version == self._version:
+                return
+        stored = self.store.items(self.NAMESPACE)
+        removed = []
+        with self._lock:
+            for name, params in stored.items():
+                conn = self._connections.get(name)
+                if conn is None:
+                    self._connections[name] = NamedConnection(name, params)
+                elif conn.params != params:
+                    # 參數變化後立即按新參數連接，不等待舊參數的重連退避
+                    conn.params = params
+                    conn.failures = 0
+                    conn.retry_at = 0.0
+            for name in list(self._connections):
+                if name not in stored:
+                    removed.append(self._connections.pop(name))
+            self._version = version
+        for conn in removed:
+            conn.pool = None
+            logger.info(f"Milvus 連接 {conn.name} 已被移除")
+            self._notify(conn.name)
+
+    def _install(self, conn: NamedConnection, pool: ChannelPool):
+        conn.pool = pool
+        conn.healthy = True
+        conn.failures = 0
+        conn.retry_at = 0.0
+        conn.last_error = None
+
+    def _record_failure(self, conn: NamedConnection, error: Exception):
+        conn.failures += 1
+        delay = min(self.backoff * 2 ** (conn.failures - 1), self.backoff_max)
+        conn.retry_at = time.time() + delay
+        conn.healthy = False
+        conn.last_error = str(error)
+        logger.warning(f"Milvus 連接 {conn.name} 失敗（第 {conn.failures} 次），{delay:.1f} 秒後重試: {str(error)}")
+
+    def _reconnect(self, conn: NamedConnection) -> ChannelPool:
+        """按當前參數建立新的通道池並替換舊的，需持有 conn.lock"""
+        params = conn.params
+        try:
+            pool = ChannelPool(conn.name, params, self.pool_size)
+        except Exception as e:
+            self._record_failure(conn, e)
+            raise ConnectionUnavailableError(
+                f"無法連接 Milvus '{conn.name}' ({params['host']}:{params['port']}): {str(e)}"
+            ) from e
+        self._install(conn, pool)
+        logger.info(f"已建立 Milvus 連接 {conn.name} ({params['host']}:{params['port']})，{len(pool.aliases)} 個通道")
+        return pool
+
+    def connect(self, name: str, host: str, port: int, db_name: Optional[str] = None) -> List[str]:
+        """建立通道池並測試，成功後把參數寫入共享狀態並替換本進程的通道池，返回集合列表"""
+        validate_connection_name(name)
+        params = {"host": host, "port": port, "db_name": db_name, "connected_at": time.time()}
+        pool = ChannelPool(name, params, self.pool_size)
+        collections = load_pymilvus().utility.list_collections(using=pool.primary)
+
+        self.store.put(self.NAMESPACE, name, params)
+        self.sync()
+        with self._lock:
+            conn = self._connections.setdefault(name, NamedConnection(name, params))
+        with conn.lock:
+            conn.params = params
+            self._install(conn, pool)
+        self._notify(name)
+        return collections
+
+    def remove(self, name: str):
+        """從共享狀態中移除連接，各進程在下一次同步時斷開"""
+        self.sync()
+        with self._lock:
+            if name not in self._connections:
+                raise ConnectionNotFoundError(f"Milvus 連接 '{name}' 不存在")
+        self.store.delete(self.NAMESPACE, name)
+        self.sync()
+
+    def pool(self, name: Optional[str] = None) -> ChannelPool:
+        """返回命名連接的通道池，尚未建立或參數已變化時先建立
+
+        健康檢查失敗但參數未變時仍返回現有通道池（gRPC 通道會自行重連），由健康檢查在退避後重建。
+        """
+        name = name or DEFAULT_CONNECTION
+        self.sync()
+        with self._lock:
+            conn = self._connections.get(name)
+        if conn is None:
+            raise ConnectionNotFoundError(f"Milvus 連接 '{name}' 不存在，請先連接")
+        pool = conn.pool
+        if pool is not None and pool.params == conn.params:
+            return pool
+
+        changed = False
+        with conn.lock:
+            if conn.pool is None or conn.pool.params != conn.params:
+                wait = conn.retry_at - time.time()
+                if wait > 0:
+                    raise ConnectionUnavailableError(
+                        f"Milvus 連接 '{name}' 不可用，{wait:.0f} 秒後重試: {conn.last_error}"
+                    )
+                self._reconnect(conn)
+                changed = True
+            pool = conn.pool
+        if changed:
+            self._notify(name)
+        return pool
+
+    def _probe(self, conn: NamedConnection):
+        """逐個通道查詢服務器版本，需持有 conn.lock"""
+        utility = load_pymilvus().utility
+        started = time.perf_counter()
+        try:
+            for alias in conn.pool.aliases:
+                version = utility.get_server_version(using=alias, timeout=PROBE_TIMEOUT)
+        except Exception as e:
+            self._record_failure(conn, e)
+        else:
+            if conn.healthy is False:
+                logger.info(f"Milvus 連接 {conn.name} 已恢復")
+            conn.healthy = True
+            conn.failures = 0
+            conn.last_error = None
+            conn.server_version = str(version)
+            conn.latency_ms = round((time.perf_counter() - started) / len(conn.pool.aliases) * 1000, 3)
+        conn.last_probe = time.time()
+
+    def check(self):
+        """探測到期的連接；健康檢查失敗、參數已變化或尚未建立的通道池在退避時間過後重建"""
+        self.sync()
+        with self._lock:
+            conns = list(self._connections.values())
+        for conn in conns:
+            changed = False
+            with conn.lock:
+                now = time.time()
+                if conn.stale:
+                    if now >= conn.retry_at:
+                        try:
+                            self._reconnect(conn)
+                            changed = True
+                        except ConnectionUnavailableError:
+                            pass
+                elif self.health_interval and (conn.last_probe is None or now - conn.last_probe >= self.health_interval):
+                    self._probe(conn)
+            if changed:
+                self._notify(conn.name)
+
+    def next_check_in(self) -> Optional[float]:
+        """距離下一次需要探測或重連的秒數，沒有任何連接時返回 None"""
+        now = time.time()
+        with self._lock:
+            conns = list(self._connections.values())
+        due = []
+        for conn in conns:
+            if conn.stale:
+                due.append(conn.retry_at - now)
+            elif self.health_interval:
+                due.append((conn.last_probe or 0.0) + self.health_interval - now)
+        return max(0.0, min(due)) if due else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """所有命名連接的參數和本進程中的健康狀態"""
+        self.sync()
+        with self._lock:
+            conns = sorted(self._connections.values(), key=lambda conn: conn.name)
+        return [conn.to_dict() for conn in conns]
+
+    def close(self):
+        """斷開本進程的所有通道池，共享狀態中的參數保留"""
+        with self._lock:
+            conns = list(self._connections.values())
+        for conn in conns:
+            if conn.pool is not None:
+                conn.pool.close()
+                conn.pool = None
+
+
+def _resolve(future) -> Any:
+    # 不支持異步調用的版本（或測試替身）直接返回結果
+    return future.result() if hasattr(future, "result") else future
+
+
+class CollectionEntry:
+    """一個集合的緩存句柄和架構信息"""
+
+    def __init__(self, name: str, collection, pool: ChannelPool):
+        self.name = name
+        self.collection = collection
+        # 持有通道池的引用：連接被替換後，使用這個句柄的請求繼續使用原來的通道
+        self.pool = pool
+        self.connection = pool.name
+        self.loaded = False
+        # 上一次確認服務端載入狀態的時間；其他客戶端或服務器重啟可能使集合不再處於載入狀態
+        self.verified_at = 0.0
+        self.last_used = time.time()
+        self.estimated_bytes = 0
+        # 正在使用該集合的請求數，由 CollectionManager 的鎖保護；大於 0 時不會被釋放
+        self.leases = 0
+        self.load_lock = threading.Lock()
+        self._handles = {pool.primary: collection}
+        self._handles_lock = threading.Lock()
+
+        schema = collection.schema
+        self.description = collection.description
+        self.fields: List[Dict[str, Any]] = []
+        self.vector_field: Optional[str] = None
+        self.output_fields: List[str] = []
+        self.field_names: List[str] = []
+        self.primary_field: Optional[str] = None
+        self._row_bytes = 0
+
+        for field in schema.fields:
+            field_info = {
+                "name": field.name,
+                "type": str(field.dtype),
+                "is_primary": field.is_primary,
+                "auto_id": field.auto_id,
+            }
+            if hasattr(field, 'dim'):
+                field_info["dimension"] = field.dim
+            self.fields.append(field_info)
+            self.field_names.append(field.name)
+
+            if field.is_primary:
+                self.primary_field = field.name
+
+            dtype_name = field.dtype.name
+            if dtype_name.endswith('_VECTOR'):
+                if self.vector_field is None and dtype_name in ['FLOAT_VECTOR', 'BINARY_VECTOR']:
+                    self.vector_field = field.name
+                dim = getattr(field, 'dim', 0) or 0
+                self._row_bytes += dim // 8 if dtype_name == 'BINARY_VECTOR' else dim * 4
+            else:
+                self.output_fields.append(field.name)
+                self._row_bytes += VARCHAR_FIELD_BYTES if dtype_name == 'VARCHAR' else SCALAR_FIELD_BYTES
+
+    @property
+    def label(self) -> str:
+        """統計中顯示的名稱，非默認連接的集合帶連接名前綴"""
+        return self.name if self.connection == DEFAULT_CONNECTION else f"{self.connection}/{self.name}"
+
+    def estimate_loaded_bytes(self) -> int:
+        """按實體數量和字段寬度估算載入後的內存佔用"""
+        return self.collection.num_entities * self._row_bytes
+
+    def handle(self, alias: Optional[str] = None):
+        """綁定到通道池中指定別名的 Collection 句柄，首次使用時創建"""
+        if alias is None:
+            return self.collection
+        with self._handles_lock:
+            handle = self._handles.get(alias)
+        if handle is None:
+            handle = load_pymilvus().Collection(self.name, using=alias)
+            with self._handles_lock:
+                handle = self._handles.setdefault(alias, handle)
+        return handle
+
+    def search_batches(self, matrix, batch_size: int, parallelism: int, **kwargs) -> List[Tuple[int, Any]]:
+        """按 batch_size 分批搜索，返回按順序排列的 (起始行, 結果)
+
+        各批輪流使用通道池中的通道，以異步調用同時保持最多 parallelism 個批次在途，
+        只佔用一個執行器線程；出錯時取消尚未完成的批次。
+        """
+        pending = deque()
+        results = []
+        try:
+            for start in range(0, len(matrix), batch_size):
+                if len(pending) >= parallelism:
+                    done_start, future = pending.popleft()
+                    results.append((done_start, _resolve(future)))
+                handle = self.handle(self.pool.next_alias())
+                pending.append((start, handle.search(data=matrix[start:start + batch_size], _async=True, **kwargs)))
+            while pending:
+                done_start, future = pending.popleft()
+                results.append((done_start, _resolve(future)))
+        finally:
+            for _, future in pending:
+                if hasattr(future, "cancel"):
+                    future.cancel()
+        return results
+
+
+class CollectionManager:
+    """Collection 句柄緩存和載入狀態管理，按 (連接名, 集合名) 緩存"""
+
+    def __init__(
+        self,
+        connections: ConnectionManager,
+        max_loaded: int,
+        memory_budget: int,
+        load_state_ttl: float,
+        release_on_evict: bool = True,
+    ):
+        self.connections = connections
+        self.max_loaded = max_loaded
+        self.memory_budget = memory_budget
+        self.load_state_ttl = load_state_ttl
+        # 釋放是服務端操作，多個 worker 時會釋放其他 worker 正在使用的集合，因此只在單進程時按 LRU 釋放
+        self.release_on_evict = release_on_evict
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], CollectionEntry]" = OrderedDict()
+        self._counters = {"handle_hits": 0, "handle_misses": 0, "loads": 0, "load_skips": 0, "releases": 0}
+        # 連接被替換或移除後，綁定到舊通道的句柄需要重新創建
+        connections.add_listener(lambda name: self.invalidate(connection=name))
+
+    def get(self, name: str, connection: Optional[str] = None) -> CollectionEntry:
+        """獲取集合句柄，首次訪問時檢查集合是否存在"""
+        pool = self.connections.pool(connection)
+        key = (pool.name, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.pool is pool:
+                self._entries.move_to_end(key)
+                entry.last_used = time.time()
+                self._counters["handle_hits"] += 1
+                return entry
+            self._counters["handle_misses"] += 1
+
+        pymilvus = load_pymilvus()
+        if not pymilvus.utility.has_collection(name, using=pool.primary):
+            raise CollectionNotFoundError(f"集合 '{name}' 不存在")
+        entry = CollectionEntry(name, pymilvus.Collection(name, using=pool.primary), pool)
+
+        with self._lock:
+            # 並發創建時保留先到的句柄
+            existing = self._entries.get(key)
+            if existing is not None and existing.pool is pool:
+                return existing
+            self._entries[key] = entry
+        return entry
+
+    def ensure_loaded(self, name: str, connection: Optional[str] = None, lease: bool = False) -> CollectionEntry:
+        """確保集合已載入，已載入的集合直接返回
+
+        本進程記錄的載入狀態超過 load_state_ttl 秒後向服務器確認一次（get_load_state），
+        集合在服務端被釋放時重新載入。lease 為 True 時在載入前取得租約，使用結束後必須調用 release_lease()。
+        """
+        entry = self.get(name, connection)
+        if lease:
+            with self._lock:
+                entry.leases += 1
+        try:
+            if self._verified(entry):
+                with self._lock:
+                    self._counters["load_skips"] += 1
+                return entry
+
+            with entry.load_lock:
+                if not self._verified(entry):
+                    self._load(entry)
+
+            self._evict(keep=entry)
+            return entry
+        except BaseException:
+            if lease:
+                self.release_lease(entry)
+            raise
+
+    def _verified(self, entry: CollectionEntry) -> bool:
+        return entry.loaded and time.time() - entry.verified_at < self.load_state_ttl
+
+    def _load(self, entry: CollectionEntry):
+        """按服務端的載入狀態載入集合，需持有 entry.load_lock"""
+        state = load_pymilvus().utility.load_state(entry.name, using=entry.pool.primary)
+        if getattr(state, "name", str(state)) == "Loaded":
+            # 其他 worker 或客戶端已經載入
+            with self._lock:
+                self._counters["load_skips"] += 1
+        else:
+            if entry.loaded:
+                logger.warning(f"集合 {entry.label} 已在服務端被釋放，重新載入")
+            entry.collection.load()
+            with self._lock:
+                self._counters["loads"] += 1
+        if not entry.loaded:
+            entry.estimated_bytes = entry.estimate_loaded_bytes()
+            entry.loaded = True
+            logger.info(f"集合 {entry.label} 已載入 (估計 {entry.estimated_bytes} 位元組)")
+        entry.verified_at = time.time()
+
+    def release_lease(self, entry: CollectionEntry):
+        """歸還 ensure_loaded(lease=True) 取得的租約
+
+        不在這裡釋放集合：租約期間超出上限的集合在下一次載入時按 LRU 釋放。
+        """
+        with self._lock:
+            entry.leases = max(entry.leases - 1, 0)
+
+    @contextmanager
+    def lease(self, name: str, connection: Optional[str] = None) -> Iterator[CollectionEntry]:
+        """載入集合並在 with 塊內持有租約"""
+        entry = self.ensure_loaded(name, connection, lease=True)
+        try:
+            yield entry
+        finally:
+            self.release_lease(entry)
+
+    def _evict(self, keep: CollectionEntry):
+        """按 LRU 釋放超出數量或內存預算的已載入集合，跳過持有租約的集合"""
+        if not self.release_on_evict:
+            return
+        to_release = []
+        with self._lock:
+            loaded = [entry for entry in self._entries.values() if entry.loaded]
+            total_bytes = sum(entry.estimated_bytes for entry in loaded)
+            for entry in loaded:
+                over_count = len(loaded) - len(to_release) > self.max_loaded
+                over_memory = self.memory_budget and total_bytes > self.memory_budget
+                if not (over_count or over_memory):
+                    break
+                if entry is keep or entry.leases:
+                    continue
+                entry.loaded = False
+                total_bytes -= entry.estimated_bytes
+                to_release.append(entry)
+
+        for entry in to_release:
+            try:
+                with entry.load_lock:
+                    # 標記後到這裡之間被其他請求重新載入時不釋放
+                    if entry.loaded:
+                        continue
+                    entry.collection.release()
+                with self._lock:
+                    self._counters["releases"] += 1
+                logger.info(f"已釋放最久未使用的集合 {entry.label}")
+            except Exception as e:
+                logger.warning(f"釋放集合 {entry.label} 失敗: {str(e)}")
+
+    def invalidate(self, name: Optional[str] = None, connection: Optional[str] = None):
+        """丟棄緩存的句柄（集合被刪除或重新連接時調用），不會釋放服務端的載入狀態"""
+        with self._lock:
+            for key in list(self._entries):
+                if (connection is None or key[0] == connection) and (name is None or key[1] == name):
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回緩存和載入狀態"""
+        with self._lock:
+            loaded = [entry for entry in self._entries.values() if entry.loaded]
+            return {
+                **self._counters,
+                "cached_handles": len(self._entries),
+                "loaded_collections": [entry.label for entry in loaded],
+                "leased_collections": {entry.label: entry.leases for entry in self._entries.values() if entry.leases},
+                "loaded_bytes": sum(entry.estimated_bytes for entry in loaded),
+                "max_loaded": self.max_loaded,
+                "memory_budget": self.memory_budget,
+                "release_on_evict": self.release_on_evict,
+            }
+
+
+milvus_connections = ConnectionManager(
+    shared_state.store,
+    pool_size=settings.milvus_pool_size,
+    health_interval=settings.milvus_health_interval,
+    backoff=settings.milvus_reconnect_backoff,
+    backoff_max=settings.milvus_reconnect_backoff_max,
+)
+
+collection_manager = CollectionManager(
+    milvus_connections,
+    max_loaded=settings.milvus_max_loaded_collections,
+    memory_budget=settings.milvus_load_memory_budget,
+    load_state_ttl=settings.milvus_load_state_ttl,
+    release_on_evict=settings.workers == 1,
+)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Milvus 集合概覽
+一次返回一個連接中所有集合的架構、實體數、索引類型和載入狀態，前端首頁無需逐個請求集合信息。
+各集合並發讀取，只使用不需要載入集合的調用（describe、get_collection_stats、describe_index、
+get_load_state）。結果按連接緩存 MILVUS_OVERVIEW_TTL 秒；過期後先返回舊結果並在後台刷新，
+連接建立後也會在後台預先生成，首頁始終可以立即顯示。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import db_executor
+from config_py import settings
+from milvus_manager import (
+    DEFAULT_CONNECTION, CollectionManager, ConnectionManager,
+    collection_manager, load_pymilvus, milvus_connections,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def describe_collection(entry) -> Dict[str, Any]:
+    """讀取一個集合的概覽信息，不載入集合（在 Milvus 執行器線程中調用）"""
+    collection = entry.collection
+    indexes = []
+    for index in collection.indexes:
+        params = index.params or {}
+        indexes.append({
+            "field": index.field_name,
+            "index_type": params.get("index_type"),
+            "metric_type": params.get("metric_type"),
+        })
+    load_state = load_pymilvus().utility.load_state(entry.name, using=entry.pool.primary)
+    num_entities = collection.num_entities
+    return {
+        "name": entry.name,
+        "description": entry.description,
+        "fields": entry.fields,
+        "vector_field": entry.vector_field,
+        "num_entities": num_entities,
+        "is_empty": num_entities == 0,
+        "index_type": next((index["index_type"] for index in indexes if index["field"] == entry.vector_field), None),
+        "indexes": indexes,
+        "load_state": getattr(load_state, "name", str(load_state)),
+    }
+
+
+class OverviewCache:
+    """按連接名緩存的集合概覽，過期後返回舊結果並在後台刷新"""
+
+    def __init__(
+        self,
+        connections: ConnectionManager,
+        collections: CollectionManager,
+        ttl: float,
+        concurrency: int,
+    ):
+        self.connections = connections
+        self.collections = collections
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # 每次失效遞增，失效前開始的刷新不寫回緩存
+        self._generations: Dict[str, int] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0}
+        # 連接被替換或移除後，緩存的概覽可能來自另一個服務器
+        connections.add_listener(self.invalidate)
+
+    def invalidate(self, connection: Optional[str] = None):
+        with self._lock:
+            names = list(self._entries) if connection is None else [connection]
+            for name in names:
+                self._entries.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+    def _list_names(self, connection: str) -> List[str]:
+        pool = self.connections.pool(connection)
+        return load_pymilvus().utility.list_collections(using=pool.primary)
+
+    def _describe(self, name: str, connection: str) -> Dict[str, Any]:
+        return describe_collection(self.collections.get(name, connection))
+
+    async def _build(self, connection: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with self._lock:
+            generation = self._generations.get(connection, 0)
+        names = await db_executor.run_milvus(self._list_names, connection)
+        # 限制同時在途的集合數，避免佔滿 Milvus 執行器的隊列
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _one(name: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await db_executor.run_milvus(self._describe, name, connection)
+                except Exception as e:
+                    # 單個集合失敗（例如剛被刪除）不影響其他集合
+                    return {"name": name, "error": str(e)}
+
+        collections = await asyncio.gather(*(_one(name) for name in sorted(names)))
+        overview = {
+            "connection": connection,
+            "collections": collections,
+            "count": len(collections),
+            "refreshed_at": time.time(),
+            "build_seconds": round(time.perf_counter() - started, 3),
+        }
+        with self._lock:
+            if self._generations.get(connection, 0) == generation:
+                self._entries[connection] = overview
+            self._counters["refreshes"] += 1
+        logger.info(f"已生成 Milvus 連接 {connection} 的集合概覽：{len(collections)} 個集合，耗時 {overview['build_seconds']} 秒")
+        return overview
+
+    def _on_refresh_done(self, connection: str, task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(connection) is task:
+                del self._tasks[connection]
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            with self._lock:
+                self._counters["refresh_failures"] += 1
+            logger.warning(f"刷新 Milvus 連接 {connection} 的集合概覽失敗: {str(error)}")
+
+    def refresh(self, connection: Optional[str] = None) -> asyncio.Task:
+        """在後台刷新概覽，已有刷新在進行時返回同一個任務"""
+        connection = connection or DEFAULT_CONNECTION
+        with self._lock:
+            task = self._tasks.get(connection)
+            if task is None:
+                task = asyncio.get_running_loop().create_task(self._build(connection))
+                self._tasks[connection] = task
+                task.add_done_callback(lambda done: self._on_refresh_done(connection, done))
+        return task
+
+    async def get(self, connection: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+        """返回概覽；沒有緩存或要求刷新時等待生成，過期時返回舊結果並在後台刷新"""
+        connection = connection or DEFAULT_CONNECTION
+        with self._lock:
+            cached = self._entries.get(connection)
+        if cached is not None and not refresh:
+            age = time.time() - cached["refreshed_at"]
+            stale = age >= self.ttl
+            with self._lock:
+                self._counters["stale_hits" if stale else "hits"] += 1
+            if stale:
+                self.refresh(connection)
+            return {**cached, "age_seconds": round(age, 3), "stale": stale}
+
+        with self._lock:
+            self._counters["misses"] += 1
+        # shield：客戶端斷開時不取消其他請求也在等待的刷新
+        overview = await asyncio.shield(self.refresh(connection))
+        return {**overview, "age_seconds": round(time.time() - overview["refreshed_at"], 3), "stale": False}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "cached_connections": sorted(self._entries),
+                "refreshing": sorted(self._tasks),
+                "ttl": self.ttl,
+            }
+
+    async def shutdown(self):
+        """取消進行中的刷新"""
+        with self._lock:
+            tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+overview_cache = OverviewCache(
+    milvus_connections,
+    collection_manager,
+    ttl=settings.milvus_overview_ttl,
+    concurrency=settings.milvus_overview_concurrency,
+)
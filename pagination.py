@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+表格分頁
+LIMIT/OFFSET 分頁（不透明 cursor 令牌），並提供按行位置讀取範圍的接口供前端虛擬滾動使用。
+
+DuckDB 0.9.2 不會把 rowid 上的過濾條件下推到掃描，`WHERE rowid > ? ORDER BY rowid` 和
+rowid 範圍查詢無論位置都要掃描整張表；LIMIT/OFFSET 在掃描到足夠的行後即停止，
+首頁和較小的偏移量幾乎沒有開銷，大偏移量也不慢於 rowid 查詢。
+"""
+
+import base64
+import json
+from typing import Any, Dict, Optional
+
+# 附加在查詢結果首列的 rowid 別名（向量搜索使用）
+ROWID_ALIAS = "__viewer_rowid"
+
+
+class InvalidCursorError(ValueError):
+    """分頁令牌無效"""
+
+
+def encode_cursor(table_name: str, rowid: Optional[int] = None, offset: Optional[int] = None) -> str:
+    """生成不透明的分頁令牌"""
+    payload: Dict[str, Any] = {"t": table_name}
+    if rowid is not None:
+        payload["r"] = rowid
+    else:
+        payload["o"] = offset
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, table_name: str) -> Dict[str, int]:
+    """解析分頁令牌，返回 {"rowid": ...} 或 {"offset": ...}"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise InvalidCursorError("分頁令牌格式錯誤")
+
+    if not isinstance(payload, dict) or payload.get("t") != table_name:
+        raise InvalidCursorError("分頁令牌與表格不匹配")
+    if isinstance(payload.get("r"), int):
+        return {"rowid": payload["r"]}
+    if isinstance(payload.get("o"), int) and payload["o"] >= 0:
+        return {"offset": payload["o"]}
+    raise InvalidCursorError("分頁令牌格式錯誤")
+
+
+def supports_rowid(conn, table_name: str) -> bool:
+    """表格是否有 rowid 偽列（視圖和表函數沒有）"""
+    try:
+        conn.execute(f"SELECT rowid FROM {table_name} LIMIT 0").fetchall()
+        return True
+    except Exception:
+        return False
+
+
+def fetch_page(
+    conn,
+    table_name: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: Optional[int] = None,
+) -> Dict[str, Any]:
+    """讀取一頁數據，返回列名、行和下一頁令牌"""
+    position = decode_cursor(cursor, table_name) if cursor else {}
+    if offset is not None and not position:
+        position = {"offset": offset}
+
+    # 舊版本發出的 rowid 令牌按下一行的位置繼續（未刪除過數據的表 rowid 即行位置）
+    start = position["rowid"] + 1 if "rowid" in position else position.get("offset", 0)
+    rows = conn.execute(
+        f"SELECT * FROM {table_name} LIMIT ? OFFSET ?",
+        [limit, start]
+    ).fetchall()
+    columns = [desc[0] for desc in conn.description]
+    next_cursor = encode_cursor(table_name, offset=start + len(rows)) if len(rows) == limit else None
+    return {"columns": columns, "rows": rows, "next_cursor": next_cursor, "offset": start}
+
+
+def fetch_range(conn, table_name: str, start: int, count: int) -> Dict[str, Any]:
+    """按行位置讀取 [start, start + count) 範圍內的數據"""
+    rows = conn.execute(
+        f"SELECT * FROM {table_name} LIMIT ? OFFSET ?",
+        [count, start]
+    ).fetchall()
+    columns = [desc[0] for desc in conn.description]
+    return {"columns": columns, "rows": rows, "positions": list(range(start, start + len(rows)))}
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+查詢結果緩存
+以規範化的 SQL 文本和數據庫文件指紋為鍵緩存只讀查詢的結果，
+內存部分按 LRU 淘汰，超出內存預算的條目溢出到磁碟
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import sql_text
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, Tuple[str, int, int, int, int]]
+
+
+# 每次執行結果可能不同的函數，調用這些函數的查詢不緩存
+NONDETERMINISTIC_FUNCTIONS = {
+    "RANDOM", "SETSEED", "UUID", "GEN_RANDOM_UUID", "NEXTVAL", "CURRVAL",
+    "NOW", "TODAY", "GET_CURRENT_TIME", "GET_CURRENT_TIMESTAMP", "TRANSACTION_TIMESTAMP",
+    "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "CURRENT_LOCALTIME", "CURRENT_LOCALTIMESTAMP",
+    "LOCALTIME", "LOCALTIMESTAMP",
+}
+
+# 直接讀取外部文件的表函數，文件不在數據庫指紋中，結果可能過期
+FILE_READ_FUNCTIONS = {
+    "READ_PARQUET", "PARQUET_SCAN", "PARQUET_METADATA", "PARQUET_SCHEMA",
+    "READ_CSV", "READ_CSV_AUTO", "SNIFF_CSV", "READ_JSON", "READ_JSON_AUTO",
+    "READ_JSON_OBJECTS", "READ_JSON_OBJECTS_AUTO", "READ_NDJSON", "READ_NDJSON_AUTO",
+    "READ_NDJSON_OBJECTS", "READ_TEXT", "READ_BLOB", "GLOB", "ICEBERG_SCAN", "DELTA_SCAN",
+    "SQLITE_SCAN", "POSTGRES_SCAN", "ST_READ",
+}
+
+
+def normalize_sql(sql: str) -> str:
+    """規範化 SQL：合併字符串和標識符之外的空白並去掉結尾的分號"""
+    text = "".join(
+        " " if token.kind == sql_text.SPACE else token.text
+        for token in sql_text.tokenize(sql)
+    )
+    return text.strip().rstrip(";").strip()
+
+
+def is_cacheable(sql: str) -> bool:
+    """查詢結果是否只取決於數據庫內容
+
+    調用隨機數、當前時間、序列等函數，或直接讀取外部文件（表函數、FROM 'data.csv'）的查詢不緩存。
+    """
+    tokens = sql_text.significant_tokens(sql)
+    for index, token in enumerate(tokens):
+        if sql_text.is_keyword(token, *NONDETERMINISTIC_FUNCTIONS, *FILE_READ_FUNCTIONS):
+            return False
+        if index and sql_text.is_keyword(tokens[index - 1], "FROM", "JOIN"):
+            # FROM 後直接跟文件路徑時 DuckDB 會按擴展名讀取文件
+            if token.kind == sql_text.STRING:
+                return False
+            if token.kind == sql_text.IDENTIFIER and ("." in token.value or "/" in token.value):
+                return False
+    return True
+
+
+class QueryResultCache:
+    """帶內存預算和磁碟溢出的 LRU 結果緩存"""
+
+    def __init__(self, memory_budget: int, disk_budget: int, spill_dir: str):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[CacheKey, Tuple[Any, int]]" = OrderedDict()
+        self._disk: "OrderedDict[CacheKey, Tuple[str, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        # 清空或按路徑移除時遞增，寫入中的溢出文件據此丟棄
+        self._generation = 0
+        self._counters = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "spills": 0,
+            "evictions": 0,
+            "rejected": 0,
+        }
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """讀取緩存結果，未命中時返回 None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._counters["hits"] += 1
+                self._counters["memory_hits"] += 1
+                return entry[0]
+
+            spilled = self._disk.pop(key, None)
+            if spilled is None:
+                self._counters["misses"] += 1
+                return None
+            self._disk_bytes -= spilled[1]
+
+        # 從磁碟讀回並提升到內存
+        path, size = spilled
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.remove(path)
+        except (OSError, pickle.UnpicklingError) as e:
+            logger.warning(f"讀取溢出的緩存條目失敗: {str(e)}")
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+
+        with self._lock:
+            self._counters["hits"] += 1
+            self._counters["disk_hits"] += 1
+            spills = self._store_memory(key, value, size)
+        self._finish(spills, [])
+        return value
+
+    def put(self, key: CacheKey, value: Any):
+        """保存查詢結果"""
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            if size > self.memory_budget:
+                self._counters["rejected"] += 1
+                return
+            unlinks = self._remove(key)
+            spills = self._store_memory(key, value, size)
+        self._finish(spills, unlinks)
+
+    def _store_memory(self, key: CacheKey, value: Any, size: int) -> List[Tuple[CacheKey, Any, int]]:
+        """在鎖內保存到內存，返回需要溢出到磁碟的條目"""
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        spills = []
+        while self._memory_bytes > self.memory_budget and self._memory:
+            old_key, (old_value, old_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_size
+            if old_size > self.disk_budget:
+                self._counters["evictions"] += 1
+            else:
+                spills.append((old_key, old_value, old_size))
+        return spills
+
+    def _finish(self, spills: List[Tuple[CacheKey, Any, int]], unlinks: List[str]):
+        """在鎖外寫入溢出文件和刪除舊文件，避免序列化和磁碟 IO 阻塞其他查詢"""
+        for path in unlinks:
+            self._unlink(path)
+        for key, value, size in spills:
+            self._spill(key, value, size)
+
+    def _spill(self, key: CacheKey, value: Any, size: int):
+        with self._lock:
+            generation = self._generation
+
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        path = os.path.join(self.spill_dir, f"{digest}_{uuid.uuid4().hex[:8]}.pkl")
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            logger.warning(f"緩存條目溢出到磁碟失敗: {str(e)}")
+            with self._lock:
+                self._counters["evictions"] += 1
+            self._unlink(path)
+            return
+
+        unlinks = []
+        with self._lock:
+            if generation != self._generation or key in self._memory or key in self._disk:
+                # 寫入期間緩存被清空，或同一條目已重新寫入
+                unlinks.append(path)
+            else:
+                while self._disk_bytes + size > self.disk_budget and self._disk:
+                    _, (old_path, old_size) = self._disk.popitem(last=False)
+                    self._disk_bytes -= old_size
+                    self._counters["evictions"] += 1
+                    unlinks.append(old_path)
+                self._disk[key] = (path, size)
+                self._disk_bytes += size
+                self._counters["spills"] += 1
+        for old_path in unlinks:
+            self._unlink(old_path)
+
+    def _remove(self, key: CacheKey) -> List[str]:
+        """在鎖內移除條目，返回需要刪除的溢出文件"""
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+        spilled = self._disk.pop(key, None)
+        if spilled is None:
+            return []
+        self._disk_bytes -= spilled[1]
+        return [spilled[0]]
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def purge_path(self, db_path: str):
+        """移除指定數據庫文件的所有條目"""
+        unlinks = []
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in list(self._memory) + list(self._disk) if key[1][0] == db_path]
+            for key in keys:
+                unlinks.extend(self._remove(key))
+        for path in unlinks:
+            self._unlink(path)
+
+    def clear(self):
+        """清空緩存並刪除溢出目錄"""
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = 0
+            self._disk_bytes = 0
+            self._generation += 1
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中統計和容量使用情況"""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget": self.memory_budget,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget": self.disk_budget,
+            }
+
+
+# 每個進程使用獨立的溢出目錄
+query_cache = QueryResultCache(
+    memory_budget=settings.query_cache_memory_bytes,
+    disk_budget=settings.query_cache_disk_bytes,
+    spill_dir=os.path.join(settings.temp_dir, f"query_cache_{os.getpid()}"),
+)
+
+
+def make_key(sql: str, fingerprint: Tuple[str, int, int, int, int]) -> CacheKey:
+    """生成緩存鍵"""
+    return (normalize_sql(sql), fingerprint)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+查詢超時和取消
+每個 SQL 查詢對應一個 QueryHandle，執行線程取得 cursor 後登記到句柄上。
+超過時限或客戶端斷開時在事件循環中調用 cursor.interrupt()，DuckDB 隨即停止執行，
+執行線程拋出異常後歸還 cursor，連接池和執行器的名額不會被失控的查詢長期佔用。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import db_executor
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+# 檢查客戶端是否已斷開的間隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+
+class QueryInterruptedError(Exception):
+    """查詢因超時或客戶端斷開被中斷"""
+
+    def __init__(self, reason: str, timeout: Optional[float] = None):
+        if reason == TIMEOUT:
+            message = f"查詢超過 {timeout:g} 秒未完成，已中斷"
+        else:
+            message = "客戶端已斷開，查詢已取消"
+        super().__init__(message)
+        self.reason = reason
+
+
+class QueryStats:
+    """查詢數、超時數和取消數"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    def record(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"started": self.started, "timed_out": self.timed_out, "cancelled": self.cancelled}
+
+
+query_stats = QueryStats()
+
+
+def effective_timeout(requested: Optional[float]) -> Optional[float]:
+    """請求指定的時限不能超過 query_timeout_max；未指定時使用 query_timeout，0 表示不限制"""
+    timeout = settings.query_timeout if requested is None else requested
+    if settings.query_timeout_max:
+        timeout = min(timeout, settings.query_timeout_max) if timeout else settings.query_timeout_max
+    return timeout or None
+
+
+class QueryHandle:
+    """一次查詢的中斷句柄，從創建時開始計時
+
+    流式輸出在兩批之間調用 pause()，等待客戶端讀取的時間不計入時限，時限只約束查詢執行。
+    """
+
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        self.reason: Optional[str] = None
+        self._conn = None
+        self._lock = threading.Lock()
+        # 已計時的秒數，以及當前計時段的開始時間（暫停時為 None）
+        self._elapsed = 0.0
+        self._running_since: Optional[float] = time.monotonic()
+        query_stats.record("started")
+
+    def attach(self, conn):
+        """在執行線程中登記 cursor；查詢在取得 cursor 前已被中斷時直接拋出"""
+        with self._lock:
+            if self.reason is not None:
+                raise QueryInterruptedError(self.reason, self.timeout)
+            self._conn = conn
+
+    def detach(self):
+        with self._lock:
+            self._conn = None
+
+    def pause(self):
+        """停止計時，可重複調用"""
+        with self._lock:
+            if self._running_since is not None:
+                self._elapsed += time.monotonic() - self._running_since
+                self._running_since = None
+
+    @property
+    def paused(self) -> bool:
+        with self._lock:
+            return self._running_since is None
+
+    def resume(self):
+        """恢復計時，可重複調用"""
+        with self._lock:
+            if self._running_since is None:
+                self._running_since = time.monotonic()
+
+    def remaining(self) -> Optional[float]:
+        if not self.timeout:
+            return None
+        with self._lock:
+            elapsed = self._elapsed
+            if self._running_since is not None:
+                elapsed += time.monotonic() - self._running_since
+        return max(self.timeout - elapsed, 0.0)
+
+    def interrupt(self, reason: str):
+        """中斷查詢，可重複調用，只有第一次生效並計數"""
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            conn = self._conn
+        query_stats.record("timed_out" if reason == TIMEOUT else "cancelled")
+        if conn is not None:
+            try:
+                conn.interrupt()
+            except Exception as e:
+                logger.warning(f"中斷查詢失敗: {str(e)}")
+
+
+async def _wait_disconnect(request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def run(handle: QueryHandle, func: Callable, *args, request=None) -> Any:
+    """在 DuckDB 執行器中運行 func，超過時限或 request 的客戶端斷開時中斷查詢
+
+    中斷後等待執行線程結束，確保 cursor 已歸還，然後拋出 QueryInterruptedError。
+    暫停計時的句柄在執行期間恢復計時，結束後重新暫停。
+    """
+    paused = handle.paused
+    if paused:
+        handle.resume()
+    try:
+        return await _run(handle, func, *args, request=request)
+    finally:
+        if paused:
+            handle.pause()
+
+
+async def _run(handle: QueryHandle, func: Callable, *args, request=None) -> Any:
+    task = asyncio.ensure_future(db_executor.run_duckdb(func, *args))
+    watcher = asyncio.ensure_future(_wait_disconnect(request)) if request is not None else None
+    waiting = {task} if watcher is None else {task, watcher}
+    try:
+        done, _ = await asyncio.wait(waiting, timeout=handle.remaining(), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        # 調用方被取消（例如流式響應的客戶端斷開），執行線程會在中斷後自行歸還 cursor
+        handle.interrupt(CANCELLED)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+    if task not in done:
+        handle.interrupt(CANCELLED if watcher in done else TIMEOUT)
+        try:
+            await task
+        except Exception:
+            pass
+        raise QueryInterruptedError(handle.reason, handle.timeout)
+
+    try:
+        return task.result()
+    except Exception:
+        if handle.reason is not None:
+            raise QueryInterruptedError(handle.reason, handle.timeout)
+        raise
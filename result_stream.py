@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+查詢結果流式輸出
+按批次從 DuckDB 讀取結果並即時編碼為 NDJSON、分塊 JSON、Arrow IPC 或 Parquet，
+伺服器內存佔用與結果集大小無關
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, List, Optional
+
+import db_executor
+import duckdb_pool
+import query_control
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 為可選依賴，僅二進制格式需要
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# 支持的流式格式及其 MIME 類型
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# 直接由 DuckDB 的 Arrow 導出生成的二進制格式
+BINARY_FORMATS = ("arrow", "parquet")
+
+# Accept 頭到流式格式的映射（application/json 保持原有的非流式響應）
+ACCEPT_FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+}
+
+
+def arrow_available() -> bool:
+    """pyarrow 是否已安裝"""
+    return pa is not None
+
+
+def negotiate_format(accept: Optional[str]) -> Optional[str]:
+    """根據 Accept 頭選擇流式格式，沒有匹配時返回 None"""
+    if not accept:
+        return None
+    for part in accept.split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in ACCEPT_FORMATS:
+            return ACCEPT_FORMATS[media_type]
+    return None
+
+
+class ChunkSink:
+    """收集 pyarrow 寫出的字節，每批數據寫完後取出發送"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def dumps_json(value: Any) -> str:
+    # 日期、Decimal 等非 JSON 原生類型以字符串輸出
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+class ResultStream:
+    """持有一個連接池 cursor 的查詢結果流"""
+
+    def __init__(self, path: str, batch_size: int, handle=None):
+        self.path = path
+        self.batch_size = batch_size
+        # 查詢的中斷句柄，設置後查詢執行和每批讀取都受其時限約束
+        self.handle = handle
+        self.columns: List[str] = []
+        self.returned_count = 0
+        self._cursor_cm = None
+        self._conn = None
+        self._reader = None
+        self._writer = None
+        self._sink = None
+        self._closed = False
+
+    def _open(self, sql: str):
+        cursor_cm = duckdb_pool.get_pool(self.path).cursor()
+        self._conn = cursor_cm.__enter__()
+        self._cursor_cm = cursor_cm
+        try:
+            if self.handle is not None:
+                self.handle.attach(self._conn)
+            self._conn.execute(sql)
+            description = self._conn.description
+            self.columns = [desc[0] for desc in description] if description else []
+        except BaseException:
+            self.close()
+            raise
+
+    def _next_rows(self) -> List[tuple]:
+        return self._conn.fetchmany(self.batch_size)
+
+    def _encode_binary_batch(self, fmt: str) -> Optional[bytes]:
+        """從 DuckDB 的 Arrow 導出讀取下一批數據並寫入 Arrow IPC 或 Parquet"""
+        if self._writer is None:
+            self._reader = self._conn.fetch_record_batch(self.batch_size)
+            self._sink = ChunkSink()
+            if fmt == "arrow":
+                self._writer = pa.ipc.new_stream(self._sink, self._reader.schema)
+            else:
+                self._writer = pq.ParquetWriter(self._sink, self._reader.schema)
+
+        try:
+            batch = self._reader.read_next_batch()
+        except StopIteration:
+            return None
+
+        self.returned_count += batch.num_rows
+        self._writer.write_batch(batch)
+        return self._sink.drain()
+
+    def _finish_binary(self) -> bytes:
+        """寫出 Arrow 流結束標記或 Parquet 文件尾"""
+        if self._writer is None:
+            return b""
+        self._writer.close()
+        return self._sink.drain()
+
+    def _encode_batch(self, fmt: str, first: bool) -> Optional[bytes]:
+        """讀取並編碼下一批數據，沒有更多數據時返回 None"""
+        if fmt in BINARY_FORMATS:
+            return self._encode_binary_batch(fmt)
+
+        rows = self._next_rows()
+        if not rows:
+            return None
+
+        columns = self.columns
+        lines = [dumps_json(dict(zip(columns, row))) for row in rows]
+        self.returned_count += len(rows)
+
+        if fmt == "ndjson":
+            return ("\n".join(lines) + "\n").encode("utf-8")
+        prefix = "" if first else ","
+        return (prefix + ",".join(lines)).encode("utf-8")
+
+    async def _run(self, func, *args):
+        if self.handle is None:
+            return await db_executor.run_duckdb(func, *args)
+        # query_control.run 只在讀取期間恢復計時，等待客戶端讀取的時間不計入時限
+        return await query_control.run(self.handle, func, *args)
+
+    async def iter_bytes(self, fmt: str) -> AsyncIterator[bytes]:
+        """逐批產生編碼後的數據"""
+        finished = False
+        try:
+            if fmt == "json":
+                yield f'{{"columns":{dumps_json(self.columns)},"data":['.encode("utf-8")
+
+            first = True
+            while True:
+                chunk = await self._run(self._encode_batch, fmt, first)
+                if chunk is None:
+                    break
+                first = False
+                yield chunk
+
+            if fmt == "json":
+                yield f'],"returned_count":{self.returned_count}}}'.encode("utf-8")
+            elif fmt in BINARY_FORMATS:
+                yield await self._run(self._finish_binary)
+            finished = True
+        except Exception as e:
+            # 響應頭已發送，只能記錄錯誤並中斷輸出
+            logger.error(f"流式輸出中斷: {str(e)}")
+            raise
+        finally:
+            if not finished and self.handle is not None:
+                # 客戶端在兩批之間斷開時沒有正在執行的讀取，同樣計為取消
+                self.handle.interrupt(query_control.CANCELLED)
+            self.close()
+
+    def close(self):
+        """歸還 cursor，可重複調用"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.handle is not None:
+            self.handle.detach()
+        if self._cursor_cm is not None:
+            self._cursor_cm.__exit__(None, None, None)
+
+
+async def open_stream(path: str, sql: str, batch_size: int, handle=None, request=None) -> ResultStream:
+    """執行查詢並返回結果流，查詢錯誤在開始輸出前拋出
+
+    指定 handle 時查詢受其時限約束，request 的客戶端在查詢執行期間斷開時中斷查詢。
+    """
+    stream = ResultStream(path, batch_size, handle)
+    if handle is None:
+        await db_executor.run_duckdb(stream._open, sql)
+    else:
+        await query_control.run(handle, stream._open, sql, request=request)
+        # 此後只有讀取批次的時間計入時限
+        handle.pause()
+    return stream
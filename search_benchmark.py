@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Milvus 搜索參數基準測試
+掃描 nprobe、ef 等索引搜索參數，對每組參數測量延遲百分位數（p50/p95/p99）和 QPS，
+並以 NumPy 精確搜索的結果為基準計算 recall@k，結果寫入 JSON 報告文件。
+
+既可以針對 Milvus 集合運行，也可以使用內存中的 IVF 模擬集合離線運行：
+
+    python search_benchmark.py --fake --nprobe 1,4,16,64 --ef 16,64,256
+    python search_benchmark.py --collection my_collection --host localhost --nprobe 8,32
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config_py import settings
+from vector_search import METRIC_TYPES, distance_keys
+
+logger = logging.getLogger(__name__)
+
+# 正式計時前的預熱查詢數
+WARMUP_QUERIES = 5
+
+VectorBlocks = Iterable[Tuple[np.ndarray, np.ndarray]]
+
+
+class FakeHits:
+    """模擬 pymilvus 的 Hits，只提供 ids 和 distances"""
+
+    def __init__(self, ids: List[Any], distances: List[float]):
+        self.ids = ids
+        self.distances = distances
+
+
+class FakeIVFCollection:
+    """內存中的 IVF_FLAT 模擬集合，用於離線基準測試
+
+    nprobe 表示搜索最近的 nprobe 個聚類；ef 近似 HNSW 的候選集大小，
+    按聚類中心由近到遠搜索，直到候選向量數不少於 max(ef, limit)。
+    """
+
+    def __init__(self, vectors: np.ndarray, nlist: int = 128, metric_type: str = "L2", seed: int = 0):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.metric_type = metric_type
+        self.num_entities = len(self.vectors)
+        self.centroids, assignments = self._kmeans(min(nlist, len(self.vectors)), seed)
+        self.lists = [np.flatnonzero(assignments == i) for i in range(len(self.centroids))]
+
+    def _kmeans(self, nlist: int, seed: int, iterations: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(len(self.vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = distance_keys(self.vectors, centroids, "L2").argmin(axis=1)
+            for i in range(nlist):
+                members = self.vectors[assignments == i]
+                if len(members):
+                    centroids[i] = members.mean(axis=0)
+        return centroids, distance_keys(self.vectors, centroids, "L2").argmin(axis=1)
+
+    def search(self, data, anns_field=None, param=None, limit=10, output_fields=None, **kwargs) -> List[FakeHits]:
+        params = (param or {}).get("params", {})
+        queries = np.asarray(data, dtype=np.float32)
+        order = distance_keys(queries, self.centroids, "L2").argsort(axis=1)
+        results = []
+        for query, clusters in zip(queries, order):
+            if "nprobe" in params:
+                probe = clusters[:params["nprobe"]]
+            else:
+                budget = max(params.get("ef", limit), limit)
+                sizes = np.cumsum([len(self.lists[c]) for c in clusters])
+                probe = clusters[:int(np.searchsorted(sizes, budget)) + 1]
+            candidates = np.concatenate([self.lists[c] for c in probe])
+            keys = distance_keys(query[None, :], self.vectors[candidates], self.metric_type)[0]
+            top = np.argsort(keys)[:limit]
+            distances = keys[top] if self.metric_type == "L2" else -keys[top]
+            results.append(FakeHits(candidates[top].tolist(), distances.tolist()))
+        return results
+
+    def vector_blocks(self, block_rows: int) -> VectorBlocks:
+        for start in range(0, self.num_entities, block_rows):
+            end = min(start + block_rows, self.num_entities)
+            yield np.arange(start, end), self.vectors[start:end]
+
+
+def synthetic_vectors(num_vectors: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """生成帶聚類結構的隨機向量，使 IVF 的召回率隨 nprobe 變化"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, size=num_vectors)
+    return centers[assignments] + 0.3 * rng.normal(size=(num_vectors, dim)).astype(np.float32)
+
+
+def milvus_vector_blocks(entry, block_rows: int) -> VectorBlocks:
+    """用 query_iterator 分批讀取集合的主鍵和向量"""
+    iterator = entry.collection.query_iterator(
+        batch_size=block_rows,
+        output_fields=[entry.primary_field, entry.vector_field]
+    )
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            ids = np.asarray([row[entry.primary_field] for row in rows])
+            yield ids, np.asarray([row[entry.vector_field] for row in rows], dtype=np.float32)
+    finally:
+        iterator.close()
+
+
+def sample_queries(blocks: VectorBlocks, num_queries: int, seed: int = 0) -> np.ndarray:
+    """從前幾個塊中取向量並加入少量噪聲作為查詢向量"""
+    rng = np.random.default_rng(seed)
+    seeds = []
+    for _, matrix in blocks:
+        seeds.append(matrix[:num_queries - sum(len(s) for s in seeds)])
+        if sum(len(s) for s in seeds) >= num_queries:
+            break
+    if not seeds:
+        raise ValueError("集合中沒有向量，無法生成查詢")
+    base = np.concatenate(seeds)
+    base = base[rng.integers(0, len(base), size=num_queries)]
+    scale = float(base.std()) or 1.0
+    return base + 0.05 * scale * rng.normal(size=base.shape).astype(np.float32)
+
+
+def exact_ground_truth(blocks: VectorBlocks, queries: np.ndarray, k: int, metric_type: str) -> np.ndarray:
+    """分塊計算精確 top-k 的 id，內存佔用只與塊大小和 k 有關"""
+    best_keys = None
+    best_ids = None
+    for ids, matrix in blocks:
+        keys = distance_keys(queries, matrix, metric_type)
+        block_ids = np.broadcast_to(ids, keys.shape)
+        if best_keys is not None:
+            keys = np.concatenate([best_keys, keys], axis=1)
+            block_ids = np.concatenate([best_ids, block_ids], axis=1)
+        keep = min(k, keys.shape[1])
+        top = np.argpartition(keys, keep - 1, axis=1)[:, :keep]
+        best_keys = np.take_along_axis(keys, top, axis=1)
+        best_ids = np.take_along_axis(block_ids, top, axis=1)
+    if best_ids is None:
+        raise ValueError("集合中沒有向量，無法計算基準結果")
+    return best_ids
+
+
+def recall_at_k(results: List[List[Any]], truth: np.ndarray, k: int) -> float:
+    """返回結果與精確 top-k 的平均重合比例"""
+    total = 0.0
+    for ids, expected in zip(results, truth):
+        total += len(set(ids[:k]) & set(expected.tolist())) / min(k, len(expected))
+    return total / len(results)
+
+
+def run_setting(
+    search: Callable[[np.ndarray, Dict[str, Any]], List[Any]],
+    queries: np.ndarray,
+    params: Dict[str, Any],
+    concurrency: int,
+) -> Tuple[Dict[str, Any], List[List[Any]]]:
+    """以給定參數逐條執行查詢，返回延遲統計和每條查詢的結果 id"""
+    for query in queries[:WARMUP_QUERIES]:
+        search(query[None, :], params)
+
+    def _timed(query):
+        started = time.perf_counter()
+        hits = search(query[None, :], params)[0]
+        return time.perf_counter() - started, list(hits.ids)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(_timed, queries))
+    wall_time = time.perf_counter() - started
+
+    latencies_ms = np.asarray([latency for latency, _ in outcomes]) * 1000
+    stats = {
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "qps": round(len(queries) / wall_time, 1) if wall_time else None,
+    }
+    return stats, [ids for _, ids in outcomes]
+
+
+def sweep_params(nprobe: Iterable[int], ef: Iterable[int]) -> List[Dict[str, int]]:
+    """生成要測試的參數組合"""
+    return [{"nprobe": value} for value in nprobe] + [{"ef": value} for value in ef]
+
+
+def run_benchmark(
+    collection,
+    blocks: Callable[[], VectorBlocks],
+    anns_field: Optional[str],
+    sweep: List[Dict[str, Any]],
+    k: int = 10,
+    num_queries: int = 100,
+    metric_type: str = "L2",
+    concurrency: int = 1,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """對每組搜索參數測量延遲、QPS 和 recall@k
+
+    blocks 每次調用返回一個新的 (id, 向量矩陣) 塊迭代器，用於抽取查詢和計算精確結果。
+    """
+    metric_type = metric_type.upper()
+    if metric_type not in METRIC_TYPES:
+        raise ValueError(f"不支持的度量類型: {metric_type}，可選: {', '.join(METRIC_TYPES)}")
+    if not sweep:
+        raise ValueError("請至少指定一組 nprobe 或 ef 參數")
+
+    queries = sample_queries(blocks(), num_queries, seed)
+
+    started = time.perf_counter()
+    truth = exact_ground_truth(blocks(), queries, k, metric_type)
+    ground_truth_seconds = time.perf_counter() - started
+
+    def _search(vectors, params):
+        return collection.search(
+            data=vectors.tolist(),
+            anns_field=anns_field,
+            param={"metric_type": metric_type, "params": params},
+            limit=k
+        )
+
+    results = []
+    for params in sweep:
+        stats, result_ids = run_setting(_search, queries, params, concurrency)
+        stats = {"params": params, f"recall@{k}": round(recall_at_k(result_ids, truth, k), 4), **stats}
+        results.append(stats)
+        logger.info(f"搜索參數 {params}: {stats}")
+
+    return {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "metric_type": metric_type,
+        "k": k,
+        "num_queries": num_queries,
+        "concurrency": concurrency,
+        "num_entities": collection.num_entities,
+        "ground_truth_seconds": round(ground_truth_seconds, 3),
+        "results": results,
+    }
+
+
+def write_report(report: Dict[str, Any], name: str, output: Optional[str] = None) -> str:
+    """將報告寫入 JSON 文件並返回路徑"""
+    if output is None:
+        os.makedirs(settings.benchmark_report_dir, exist_ok=True)
+        output = os.path.join(
+            settings.benchmark_report_dir, f"benchmark_{name}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        )
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    return output
+
+
+def format_table(report: Dict[str, Any]) -> str:
+    """以文本表格顯示報告"""
+    k = report["k"]
+    lines = [f"{'參數':<16}{'recall@' + str(k):>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'QPS':>10}"]
+    for row in report["results"]:
+        params = ",".join(f"{key}={value}" for key, value in row["params"].items())
+        lines.append(
+            f"{params:<16}{row[f'recall@{k}']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+            f"{row['p99_ms']:>10}{row['qps']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Milvus 搜索參數基準測試")
+    parser.add_argument("--collection", help="Milvus 集合名稱")
+    parser.add_argument("--host", default=settings.milvus_host)
+    parser.add_argument("--port", type=int, default=settings.milvus_port)
+    parser.add_argument("--fake", action="store_true", help="使用內存中的 IVF 模擬集合")
+    parser.add_argument("--fake-vectors", type=int, default=20000)
+    parser.add_argument("--fake-dim", type=int, default=64)
+    parser.add_argument("--fake-nlist", type=int, default=128)
+    parser.add_argument("--nprobe", type=_int_list, default=[1, 4, 16, 64])
+    parser.add_argument("--ef", type=_int_list, default=[])
+    parser.add_argument("--metric", default="L2")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--block-rows", type=int, default=settings.milvus_export_batch_size)
+    parser.add_argument("--output", help="報告文件路徑，默認寫入 benchmark_report_dir")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.fake:
+        collection = FakeIVFCollection(
+            synthetic_vectors(args.fake_vectors, args.fake_dim), args.fake_nlist, args.metric.upper()
+        )
+        anns_field = None
+        blocks = lambda: collection.vector_blocks(args.block_rows)
+        name = "fake"
+    elif args.collection:
+        from milvus_manager import ChannelPool, CollectionEntry, load_pymilvus
+
+        # 獨立的連接，不寫入服務的共享狀態
+        pool = ChannelPool("benchmark", {"host": args.host, "port": args.port}, 1)
+        collection = load_pymilvus().Collection(args.collection, using=pool.primary)
+        collection.load()
+        entry = CollectionEntry(args.collection, collection, pool)
+        if not entry.vector_field:
+            print("❌ 集合中沒有找到向量字段")
+            return 1
+        collection = entry.collection
+        anns_field = entry.vector_field
+        blocks = lambda: milvus_vector_blocks(entry, args.block_rows)
+        name = args.collection
+    else:
+        parser.error("請指定 --collection 或 --fake")
+
+    report = run_benchmark(
+        collection, blocks, anns_field, sweep_params(args.nprobe, args.ef),
+        k=args.k, num_queries=args.queries, metric_type=args.metric, concurrency=args.concurrency
+    )
+    report["collection"] = name
+    path = write_report(report, name, args.output)
+    print(format_table(report))
+    print(f"✅ 報告已寫入 {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
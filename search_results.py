@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Milvus 搜索結果格式化
+rows 為每個命中一個字典（原有格式）；columns 為每個查詢一組平行數組
+（ids、distances 和每個輸出字段一列），直接取自 Hits 的 ids / distances；
+arrow 將所有查詢的命中合併為一個 Arrow 表，以 query_index 和 rank 區分。
+"""
+
+import json
+from typing import Any, Dict, List
+
+import milvus_export
+from result_stream import ChunkSink, pa
+
+SEARCH_LAYOUTS = ("rows", "columns", "arrow")
+
+
+def _field_column(hits, name: str, entry) -> List[Any]:
+    # 主鍵即命中的 id，不依賴服務端是否在字段中返回
+    if name == entry.primary_field:
+        return list(hits.ids)
+    # hit.entity 在新版 pymilvus 中就是 hit 本身，兩種版本都支持 get
+    return [hit.entity.get(name) for hit in hits]
+
+
+def to_rows(results, entry) -> List[List[Dict[str, Any]]]:
+    """每個命中一個字典：{"id", "distance", "entity"}"""
+    formatted = []
+    for hits in results:
+        columns = {name: _field_column(hits, name, entry) for name in entry.output_fields}
+        formatted.append([
+            {
+                "id": hit_id,
+                "distance": distance,
+                "entity": {name: values[i] for name, values in columns.items()},
+            }
+            for i, (hit_id, distance) in enumerate(zip(hits.ids, hits.distances))
+        ])
+    return formatted
+
+
+def to_columns(results, entry) -> List[Dict[str, Any]]:
+    """每個查詢一組平行數組：{"ids", "distances", "fields": {字段: [...]}}"""
+    return [
+        {
+            "ids": list(hits.ids),
+            "distances": list(hits.distances),
+            "fields": {name: _field_column(hits, name, entry) for name in entry.output_fields},
+        }
+        for hits in results
+    ]
+
+
+def to_arrow_table(results, entry, query_offset: int = 0) -> "pa.Table":
+    """將所有查詢的命中轉換為一個 Arrow 表，列為 query_index、rank、id、distance 和輸出字段
+
+    主鍵字段已由 id 列表示，不再重複輸出。
+    """
+    output_fields = [name for name in entry.output_fields if name != entry.primary_field]
+    field_types = {name: (field, arrow_type) for name, field, arrow_type in milvus_export.arrow_schema(entry)}
+    primary_type = field_types.get(entry.primary_field, (None, None))[1]
+
+    query_index: List[int] = []
+    rank: List[int] = []
+    ids: List[Any] = []
+    distances: List[float] = []
+    columns: Dict[str, List[Any]] = {name: [] for name in output_fields}
+    for offset, hits in enumerate(results):
+        hit_ids = list(hits.ids)
+        query_index.extend([query_offset + offset] * len(hit_ids))
+        rank.extend(range(len(hit_ids)))
+        ids.extend(hit_ids)
+        distances.extend(hits.distances)
+        for name in output_fields:
+            columns[name].extend(_field_column(hits, name, entry))
+
+    arrays = {
+        "query_index": pa.array(query_index, type=pa.int32()),
+        "rank": pa.array(rank, type=pa.int32()),
+        "id": pa.array(ids, type=primary_type),
+        "distance": pa.array(distances, type=pa.float32()),
+    }
+    for name, values in columns.items():
+        field, arrow_type = field_types.get(name, (None, None))
+        if field is not None and field.dtype.name == "JSON":
+            arrays[name] = pa.array([None if v is None else json.dumps(v, ensure_ascii=False) for v in values])
+        else:
+            arrays[name] = pa.array(values, type=arrow_type)
+    return pa.table(arrays)
+
+
+def arrow_ipc_bytes(tables: List["pa.Table"]) -> bytes:
+    """將各批次的結果表合併並編碼為 Arrow IPC 流"""
+    table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+    sink = ChunkSink()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.drain()
+
+
+def format_results(results, layout: str, entry, query_offset: int = 0):
+    """按指定佈局格式化一批搜索結果，query_offset 為該批第一個查詢在請求中的序號"""
+    if layout == "columns":
+        return to_columns(results, entry)
+    if layout == "arrow":
+        return to_arrow_table(results, entry, query_offset)
+    return to_rows(results, entry)
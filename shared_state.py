@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+多進程共享狀態
+以多個 worker 進程運行時，每個進程的內存互不可見。數據庫目錄、當前數據庫、
+Milvus 連接參數和 SQL 任務記錄保存在一個本地 SQLite 文件中（WAL 模式），
+任何 worker 收到的請求都看到同一份狀態。
+
+每個命名空間有一個版本號，寫入時遞增；進程只需讀取版本號即可判斷本地副本是否過期。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+# 其他進程持有寫鎖時等待的毫秒數
+BUSY_TIMEOUT_MS = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+class SharedStore:
+    """基於 SQLite 的鍵值存儲，按命名空間分組，值以 JSON 保存"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 連接不能跨線程使用，每個線程各自打開一個
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "path", None) == self.path:
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        with self._init_lock:
+            if self.path not in self._initialized:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.executescript(SCHEMA)
+                self._initialized.add(self.path)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        self._local.conn = conn
+        self._local.path = self.path
+        self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """寫事務，期間其他進程的寫入等待；可以嵌套，只有最外層提交"""
+        conn = self._connection()
+        if self._local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.execute("COMMIT")
+
+    def _bump(self, conn: sqlite3.Connection, namespace: str):
+        conn.execute(
+            "INSERT INTO versions (namespace, version) VALUES (?, 1) "
+            "ON CONFLICT (namespace) DO UPDATE SET version = version + 1",
+            (namespace,)
+        )
+
+    def version(self, namespace: str) -> int:
+        return self.versions(namespace)[0]
+
+    def versions(self, *namespaces: str) -> Tuple[int, ...]:
+        """一次讀取多個命名空間的版本號"""
+        placeholders = ", ".join("?" for _ in namespaces)
+        rows = dict(self._connection().execute(
+            f"SELECT namespace, version FROM versions WHERE namespace IN ({placeholders})", namespaces
+        ).fetchall())
+        return tuple(rows.get(namespace, 0) for namespace in namespaces)
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        rows = self._connection().execute(
+            "SELECT key, value FROM entries WHERE namespace = ?", (namespace,)
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def put(self, namespace: str, key: str, value: Any):
+        with self.transaction():
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO entries (namespace, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (namespace, key, json.dumps(value, ensure_ascii=False, default=str), time.time())
+            )
+            self._bump(conn, namespace)
+
+    def delete(self, namespace: str, key: str):
+        with self.transaction():
+            conn = self._connection()
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self._bump(conn, namespace)
+
+    def close(self):
+        """關閉當前線程的連接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+store = SharedStore(settings.state_db_path)
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Milvus 到 DuckDB 的快照任務
+在後台用 query_iterator 分批讀取整個集合，轉換為 Arrow 列（向量為定長 FLOAT[]）後批量寫入
+當前 DuckDB 文件中的表，之後即可通過 /duckdb/query 進行分析。
+
+每批數據和進度記錄（_milvus_snapshots 表）在同一個 DuckDB 事務中提交，
+任務中斷後再次啟動會從最後提交的主鍵之後繼續。
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import db_executor
+import duckdb_pool
+import milvus_export
+from config_py import settings
+from milvus_manager import CollectionEntry, collection_manager
+from result_stream import pa
+
+logger = logging.getLogger(__name__)
+
+# 記錄快照進度的狀態表，與快照表位於同一個數據庫文件
+STATE_TABLE = "_milvus_snapshots"
+
+TABLE_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# 執行器繁忙時的重試間隔（秒）
+BUSY_RETRY_DELAY = 0.5
+
+
+class SnapshotConflictError(Exception):
+    """目標表已被佔用或已有同一目標的快照任務在運行"""
+
+
+class SnapshotJobNotFoundError(Exception):
+    """快照任務不存在"""
+
+
+def validate_table_name(table_name: str):
+    """目標表名只允許字母、數字和下劃線"""
+    if not TABLE_NAME_PATTERN.match(table_name) or table_name == STATE_TABLE:
+        raise ValueError(f"無效的目標表名: {table_name}")
+
+
+def _ensure_state_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            collection_name VARCHAR,
+            primary_field VARCHAR,
+            last_pk VARCHAR,
+            rows_copied BIGINT,
+            total_rows BIGINT,
+            status VARCHAR,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def saved_snapshots(conn) -> List[Dict[str, Any]]:
+    """讀取數據庫文件中記錄的快照進度，沒有狀態表時返回空列表"""
+    exists = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [STATE_TABLE]
+    ).fetchone()[0]
+    if not exists:
+        return []
+    rows = conn.execute(
+        f"SELECT table_name, collection_name, rows_copied, total_rows, status, updated_at "
+        f"FROM {STATE_TABLE} ORDER BY updated_at DESC"
+    ).fetchall()
+    return [
+        {
+            "table_name": row[0],
+            "collection_name": row[1],
+            "rows_copied": row[2],
+            "total_rows": row[3],
+            "status": row[4],
+            "updated_at": str(row[5]) if row[5] is not None else None,
+        }
+        for row in rows
+    ]
+
+
+class SnapshotJob:
+    """一個集合快照任務"""
+
+    def __init__(
+        self,
+        db_path: str,
+        collection_name: str,
+        table_name: str,
+        batch_size: int,
+        on_commit: Callable[[str], None],
+    ):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.db_path = db_path
+        self.collection_name = collection_name
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.rows_copied = 0
+        self.rows_this_run = 0
+        self.total_rows: Optional[int] = None
+        self.resumed = False
+        self.last_pk: Optional[Any] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._on_commit = on_commit
+        self._cancel_requested = False
+        self._entry: Optional[CollectionEntry] = None
+        self._schema = None
+        self._pk_is_string = False
+        self._view_name = f"__snapshot_batch_{self.job_id}"
+
+    # ---------- 準備階段（在 DuckDB 執行器中運行） ----------
+
+    def _prepare(self, restart: bool):
+        """檢查目標表和已保存的進度，決定續傳或重新開始"""
+        with duckdb_pool.get_pool(self.db_path).cursor() as conn:
+            _ensure_state_table(conn)
+            state = conn.execute(
+                f"SELECT collection_name, last_pk, rows_copied, status FROM {STATE_TABLE} WHERE table_name = ?",
+                [self.table_name]
+            ).fetchone()
+            table_exists = conn.execute(
+                "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [self.table_name]
+            ).fetchone()[0] > 0
+
+            if state is None and table_exists:
+                raise SnapshotConflictError(f"表 '{self.table_name}' 已存在且不是快照表")
+            if state is not None and state[0] != self.collection_name:
+                raise SnapshotConflictError(
+                    f"表 '{self.table_name}' 是集合 '{state[0]}' 的快照，請使用其他表名"
+                )
+
+            if state is not None and state[3] != "completed" and not restart:
+                # 從上次提交的位置續傳
+                self.resumed = True
+                self.rows_copied = state[2] or 0
+                if state[1] is not None:
+                    self.last_pk = state[1] if self._pk_is_string else int(state[1])
+                logger.info(f"快照 {self.table_name} 從第 {self.rows_copied} 行續傳")
+            else:
+                conn.begin()
+                try:
+                    conn.execute(f"DROP TABLE IF EXISTS {self.table_name}")
+                    conn.execute(f"DELETE FROM {STATE_TABLE} WHERE table_name = ?", [self.table_name])
+                    self._save_state(conn, "running")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+            # 字段類型全部已知時預先建表，空集合也會得到結構完整的表
+            arrow_fields = [pa.field(name, arrow_type) for name, _, arrow_type in self._schema if arrow_type is not None]
+            if len(arrow_fields) == len(self._schema):
+                self._create_table(conn, pa.schema(arrow_fields).empty_table())
+
+        self._on_commit(self.db_path)
+
+    def _create_table(self, conn, arrow_table):
+        conn.register(self._view_name, arrow_table)
+        try:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table_name} AS SELECT * FROM {self._view_name} LIMIT 0")
+        finally:
+            conn.unregister(self._view_name)
+
+    def _save_state(self, conn, status: str):
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, current_timestamp)",
+            [
+                self.table_name,
+                self.collection_name,
+                self._entry.primary_field,
+                None if self.last_pk is None else str(self.last_pk),
+                self.rows_copied,
+                self.total_rows,
+                status,
+            ]
+        )
+
+    # ---------- 複製階段 ----------
+
+    def _resume_expr(self) -> Optional[str]:
+        """續傳時只讀取主鍵大於上次提交位置的實體（query_iterator 按主鍵順序返回）"""
+        if self.last_pk is None:
+            return None
+        pk = self._entry.primary_field
+        if self._pk_is_string:
+            escaped = str(self.last_pk).replace("\\", "\\\\").replace('"', '\\"')
+            return f'{pk} > "{escaped}"'
+        return f"{pk} > {int(self.last_pk)}"
+
+    def _open_iterator(self):
+        self.total_rows = self._entry.collection.num_entities
+        return self._entry.collection.query_iterator(
+            batch_size=self.batch_size,
+            expr=self._resume_expr(),
+            output_fields=self._entry.field_names
+        )
+
+    def _read_batch(self, iterator):
+        """讀取下一批實體並轉換為 Arrow，沒有更多數據時返回 None"""
+        rows = iterator.next()
+        if not rows:
+            return None
+        pk = self._entry.primary_field
+        last_pk = max(row[pk] for row in rows)
+        batch = milvus_export.rows_to_record_batch(rows, self._schema)
+        return pa.Table.from_batches([batch]), last_pk
+
+    def _write_batch(self, arrow_table, last_pk):
+        """在一個事務中寫入一批數據並更新進度"""
+        previous = (self.last_pk, self.rows_copied)
+        with duckdb_pool.get_pool(self.db_path).cursor() as conn:
+            conn.begin()
+            try:
+                conn.register(self._view_name, arrow_table)
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table_name} AS SELECT * FROM {self._view_name} LIMIT 0"
+                )
+                conn.execute(f"INSERT INTO {self.table_name} SELECT * FROM {self._view_name}")
+                self.last_pk = last_pk
+                self.rows_copied += arrow_table.num_rows
+                self._save_state(conn, "running")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                self.last_pk, self.rows_copied = previous
+                raise
+            finally:
+                conn.unregister(self._view_name)
+        self.rows_this_run += arrow_table.num_rows
+
+    def _finish(self, status: str):
+        with duckdb_pool.get_pool(self.db_path).cursor() as conn:
+            self._save_state(conn, status)
+
+    async def _run_with_retry(self, run: Callable, *args):
+        """後台任務遇到執行器繁忙時等待重試，而不是直接失敗"""
+        while True:
+            try:
+                return await run(*args)
+            except db_executor.ExecutorSaturatedError:
+                await asyncio.sleep(BUSY_RETRY_DELAY)
+
+    async def run(self):
+        """執行複製直到完成、取消或出錯"""
+        self.status = "running"
+        self.started_at = time.time()
+        iterator = None
+        try:
+            iterator = await self._run_with_retry(db_executor.run_milvus, self._open_iterator)
+            while not self._cancel_requested:
+                result = await self._run_with_retry(db_executor.run_milvus, self._read_batch, iterator)
+                if result is None:
+                    break
+                await self._run_with_retry(db_executor.run_duckdb, self._write_batch, *result)
+                self._on_commit(self.db_path)
+
+            self.status = "cancelled" if self._cancel_requested else "completed"
+            await self._run_with_retry(db_executor.run_duckdb, self._finish, self.status)
+            logger.info(
+                f"集合 {self.collection_name} 快照{'已取消' if self._cancel_requested else '完成'}，"
+                f"表 {self.table_name} 共 {self.rows_copied} 行"
+            )
+        except Exception as e:
+            # 已提交的批次和進度保留在數據庫中，重新啟動任務即可續傳
+            self.status = "failed"
+            self.error = str(e)
+            logger.error(f"集合 {self.collection_name} 快照失敗: {str(e)}")
+            try:
+                await db_executor.run_duckdb(self._finish, "failed")
+            except Exception:
+                pass
+        finally:
+            self.finished_at = time.time()
+            if iterator is not None:
+                try:
+                    await db_executor.run_milvus(iterator.close)
+                except Exception as e:
+                    logger.warning(f"關閉集合迭代器失敗: {str(e)}")
+            self._on_commit(self.db_path)
+
+    def cancel(self):
+        """請求在當前批次提交後停止"""
+        self._cancel_requested = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        progress = None
+        if self.total_rows:
+            progress = round(min(self.rows_copied / self.total_rows, 1.0), 4)
+        elif self.status == "completed":
+            progress = 1.0
+        return {
+            "job_id": self.job_id,
+            "collection_name": self.collection_name,
+            "connection": self._entry.connection if self._entry is not None else None,
+            "table_name": self.table_name,
+            "status": self.status,
+            "error": self.error,
+            "resumed": self.resumed,
+            "rows_copied": self.rows_copied,
+            "total_rows": self.total_rows,
+            "progress": progress,
+            "rows_per_second": round(self.rows_this_run / elapsed, 1) if elapsed else None,
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "created_at": self.created_at,
+        }
+
+
+class SnapshotManager:
+    """管理快照任務，同一數據庫文件中的同一目標表同時只允許一個任務"""
+
+    def __init__(self, max_running: int):
+        self.max_running = max_running
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, SnapshotJob] = {}
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+
+    def _active(self) -> List[SnapshotJob]:
+        return [job for job in self._jobs.values() if job.status in ("pending", "running")]
+
+    async def start(
+        self,
+        db_path: str,
+        collection_name: str,
+        table_name: str,
+        batch_size: int,
+        restart: bool,
+        on_commit: Callable[[str], None],
+        connection: Optional[str] = None,
+    ) -> SnapshotJob:
+        """準備並在後台啟動快照任務，目標衝突或集合不存在時在返回前拋出"""
+        validate_table_name(table_name)
+        job = SnapshotJob(db_path, collection_name, table_name, batch_size, on_commit)
+
+        with self._lock:
+            active = self._active()
+            for other in active:
+                if other.db_path == db_path and other.table_name == table_name:
+                    raise SnapshotConflictError(f"表 '{table_name}' 已有正在運行的快照任務 {other.job_id}")
+            if len(active) >= self.max_running:
+                raise db_executor.ExecutorSaturatedError(f"最多同時運行 {self.max_running} 個快照任務，請稍後重試")
+            self._jobs[job.job_id] = job
+
+        try:
+            # 租約保持到任務結束，複製期間集合不會因其他請求的載入被釋放
+            job._entry = await db_executor.run_milvus(
+                collection_manager.ensure_loaded, collection_name, connection, lease=True
+            )
+            job._schema = milvus_export.arrow_schema(job._entry)
+            job._pk_is_string = any(
+                field.is_primary and field.dtype.name == "VARCHAR" for _, field, _ in job._schema
+            )
+            await db_executor.run_duckdb(job._prepare, restart)
+        except Exception:
+            if job._entry is not None:
+                collection_manager.release_lease(job._entry)
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+            raise
+
+        task = asyncio.create_task(job.run())
+        self._tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.job_id, None))
+        task.add_done_callback(lambda _: collection_manager.release_lease(job._entry))
+        return job
+
+    def get(self, job_id: str) -> SnapshotJob:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise SnapshotJobNotFoundError(f"快照任務 '{job_id}' 不存在")
+        return job
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in sorted(jobs, key=lambda job: job.created_at, reverse=True)]
+
+    async def shutdown(self):
+        """取消所有任務並等待當前批次提交，進度保留在數據庫中供下次續傳"""
+        with self._lock:
+            jobs = self._active()
+        for job in jobs:
+            job.cancel()
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+snapshot_manager = SnapshotManager(max_running=settings.snapshot_max_running_jobs)
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+"""
+異步 SQL 任務
+長時間運行的查詢提交後立即返回任務 id，在後台執行，不受單個 HTTP 請求時限的約束。
+SELECT 類查詢的結果用 COPY 寫入臨時目錄中的 Parquet 文件，之後按頁讀取或整個下載；
+其他語句（SHOW、DESCRIBE、多條語句、寫入語句等）的結果保存在內存和共享狀態中，
+最多 sql_job_max_inline_rows 行，超出時任務失敗而不是把整個結果讀入內存。
+
+同時運行的任務數受 sql_job_max_running 限制，其餘任務排隊等待；
+結束的任務在 sql_job_ttl 秒後連同結果文件一起刪除。
+
+任務記錄同步到共享狀態存儲，多個 worker 進程時任一進程都能查詢狀態、讀取結果和下載；
+取消請求寫入存儲，由運行該任務的進程輪詢後中斷查詢。
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import data_sources
+import db_executor
+import duckdb_pool
+import metadata_cache
+import query_control
+import shared_state
+import sql_text
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+# 可以直接包裝在 COPY (...) TO 中的語句
+COPYABLE_KEYWORDS = {"SELECT", "WITH", "FROM", "VALUES", "TABLE"}
+
+# 執行器繁忙時的重試間隔（秒）
+BUSY_RETRY_DELAY = 0.5
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# 共享狀態中的任務記錄和取消請求
+JOBS_NAMESPACE = "sql_jobs"
+CANCEL_NAMESPACE = "sql_job_cancel"
+
+# 運行任務的進程檢查取消請求的間隔（秒）
+CANCEL_POLL_INTERVAL = 0.5
+
+
+class SQLJobNotFoundError(Exception):
+    """任務不存在或已過期"""
+
+
+class SQLJobNotReadyError(Exception):
+    """任務尚未完成或沒有結果集"""
+
+
+def _in_thread(func, *args):
+    # 共享狀態是 SQLite 文件，其他進程寫入時最多等待 BUSY_TIMEOUT_MS，放到默認線程池不阻塞事件循環
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _copyable(sql: str) -> bool:
+    """單條語句且以 COPYABLE_KEYWORDS 開頭（字符串和註釋中的內容不參與判斷）"""
+    statements = sql_text.split_statements(sql_text.significant_tokens(sql))
+    if len(statements) != 1:
+        return False
+    leading = next((token for token in statements[0] if token.text != "("), None)
+    return leading is not None and sql_text.is_keyword(leading, *COPYABLE_KEYWORDS)
+
+
+class SQLJob:
+    """一個後台 SQL 任務"""
+
+    def __init__(self, db_path: str, sql: str, timeout: Optional[float], on_write: Callable[[str], None]):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.db_path = db_path
+        self.sql = sql.strip().rstrip(";").strip()
+        self.timeout = timeout
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.columns: List[str] = []
+        self.row_count: Optional[int] = None
+        self.affected_rows: Optional[int] = None
+        self.result_path: Optional[str] = None
+        self._rows: Optional[List[tuple]] = None
+        self._on_write = on_write
+        self._handle: Optional[query_control.QueryHandle] = None
+        self._conn = None
+        self.owner = os.getpid()
+        # 由其他 worker 進程運行、從共享狀態讀取的任務
+        self.remote = False
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "SQLJob":
+        """由共享狀態中的記錄重建其他進程運行的任務，只能查詢、讀取結果和請求取消"""
+        job = cls(record["db_path"], record["query"], record.get("timeout"), lambda path: None)
+        for field in (
+            "job_id", "status", "error", "created_at", "started_at", "finished_at",
+            "columns", "row_count", "affected_rows", "result_path", "owner",
+        ):
+            setattr(job, field, record.get(field))
+        if record.get("rows") is not None:
+            job._rows = [tuple(row) for row in record["rows"]]
+        job.remote = True
+        if job.status not in FINISHED_STATUSES and not _process_alive(job.owner):
+            job.status = "failed"
+            job.error = "運行該任務的工作進程已退出"
+            job.finished_at = job.started_at or job.created_at
+        return job
+
+    def publish(self):
+        """把任務狀態寫入共享狀態"""
+        record = {
+            **self.to_dict(),
+            "db_path": self.db_path,
+            "timeout": self.timeout,
+            "started_at": self.started_at,
+            "result_path": self.result_path,
+            "rows": self._rows,
+            "owner": self.owner,
+        }
+        shared_state.store.put(JOBS_NAMESPACE, self.job_id, record)
+
+    def _spill_path(self) -> str:
+        directory = os.path.join(settings.temp_dir, "sql_jobs")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{self.job_id}.parquet")
+
+    def _execute(self):
+        read_only = metadata_cache.is_read_only_statement(self.sql)
+        with duckdb_pool.get_pool(self.db_path).cursor() as conn:
+            self._handle.attach(conn)
+            self._conn = conn
+            try:
+                # 進度條只用於 query_progress()，不輸出到終端
+                conn.execute("SET enable_progress_bar = true")
+                conn.execute("SET enable_progress_bar_print = false")
+
+                if read_only and _copyable(self.sql):
+                    path = self._spill_path()
+                    escaped = path.replace("'", "''")
+                    try:
+                        self.row_count = conn.execute(
+                            f"COPY ({self.sql}) TO '{escaped}' (FORMAT PARQUET)"
+                        ).fetchone()[0]
+                    except BaseException:
+                        if os.path.exists(path):
+                            os.remove(path)
+                        raise
+                    self.result_path = path
+                    return
+
+                try:
+                    result = conn.execute(self.sql)
+                finally:
+                    if not read_only:
+                        self._on_write(self.db_path)
+                if result.description:
+                    limit = settings.sql_job_max_inline_rows
+                    rows = result.fetchmany(limit + 1)
+                    if len(rows) > limit:
+                        raise ValueError(
+                            f"結果超過 {limit} 行；只有以 SELECT、WITH、FROM、VALUES 或 TABLE 開頭的"
+                            f"單條只讀查詢可以寫入 Parquet 文件"
+                        )
+                    self.columns = [desc[0] for desc in result.description]
+                    self._rows = rows
+                    self.row_count = len(self._rows)
+                else:
+                    self.affected_rows = result.rowcount if hasattr(result, "rowcount") else 0
+            finally:
+                self._conn = None
+                self._handle.detach()
+
+    def _describe_result(self):
+        with duckdb_pool.get_pool(":memory:").cursor() as conn:
+            metadata = data_sources.parquet_metadata_cache.get(conn, self.result_path)
+        self.columns = [column["name"] for column in metadata["columns"]]
+
+    async def _watch_cancel(self):
+        # 取消請求可能由其他 worker 進程寫入
+        while True:
+            await asyncio.sleep(CANCEL_POLL_INTERVAL)
+            if await _in_thread(shared_state.store.get, CANCEL_NAMESPACE, self.job_id):
+                await self.cancel()
+                return
+
+    async def run(self, semaphore: asyncio.Semaphore):
+        """等待運行名額後執行，直到完成、超時、取消或出錯"""
+        watcher = asyncio.ensure_future(self._watch_cancel())
+        try:
+            await self._run(semaphore)
+        finally:
+            watcher.cancel()
+
+    async def _run(self, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            if self.status == "cancelled":
+                return
+            self.status = "running"
+            self.started_at = time.time()
+            self._handle = query_control.QueryHandle(self.timeout)
+            await _in_thread(self.publish)
+            try:
+                while True:
+                    try:
+                        await query_control.run(self._handle, self._execute)
+                        break
+                    except db_executor.ExecutorSaturatedError:
+                        await asyncio.sleep(BUSY_RETRY_DELAY)
+                if self.result_path is not None:
+                    await db_executor.run_duckdb(self._describe_result)
+                self.status = "completed"
+                logger.info(f"SQL 任務 {self.job_id} 完成，{self.row_count or 0} 行")
+            except query_control.QueryInterruptedError as e:
+                if e.reason == query_control.CANCELLED:
+                    self.status = "cancelled"
+                    self.error = "任務已取消"
+                else:
+                    self.status = "failed"
+                    self.error = str(e)
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                logger.error(f"SQL 任務 {self.job_id} 失敗: {str(e)}")
+            finally:
+                self.finished_at = time.time()
+                await _in_thread(self.publish)
+
+    async def cancel(self):
+        """取消排隊中的任務，或中斷正在運行的查詢；其他進程的任務寫入取消請求"""
+        if self.remote:
+            await _in_thread(shared_state.store.put, CANCEL_NAMESPACE, self.job_id, True)
+        elif self.status == "pending":
+            self.status = "cancelled"
+            self.finished_at = time.time()
+            await _in_thread(self.publish)
+        elif self.status == "running" and self._handle is not None:
+            self._handle.interrupt(query_control.CANCELLED)
+
+    def progress(self) -> Optional[float]:
+        """運行中的進度（0 到 1）；DuckDB 版本不支持 query_progress() 時返回 None"""
+        if self.status == "completed":
+            return 1.0
+        conn = self._conn
+        query_progress = getattr(conn, "query_progress", None)
+        if self.status != "running" or query_progress is None:
+            return None
+        try:
+            value = query_progress()
+        except Exception:
+            return None
+        return round(value / 100, 4) if value is not None and value >= 0 else None
+
+    def read_page(self, offset: int, limit: int) -> Dict[str, Any]:
+        """按偏移量讀取一頁結果"""
+        if self.status != "completed":
+            raise SQLJobNotReadyError(f"任務 {self.job_id} 尚未完成（狀態: {self.status}）")
+        if self.result_path is not None:
+            escaped = self.result_path.replace("'", "''")
+            with duckdb_pool.get_pool(":memory:").cursor() as conn:
+                rows = conn.execute(
+                    f"SELECT * FROM read_parquet('{escaped}') LIMIT {int(limit)} OFFSET {int(offset)}"
+                ).fetchall()
+        elif self._rows is not None:
+            rows = self._rows[offset:offset + limit]
+        else:
+            raise SQLJobNotReadyError(f"任務 {self.job_id} 的語句沒有返回結果集")
+        return {
+            "job_id": self.job_id,
+            "columns": self.columns,
+            "offset": offset,
+            "limit": limit,
+            "total_rows": self.row_count,
+            "has_more": offset + len(rows) < (self.row_count or 0),
+            "data": [dict(zip(self.columns, row)) for row in rows],
+        }
+
+    def discard(self):
+        """刪除結果文件和共享狀態中的記錄"""
+        if self.result_path is not None:
+            try:
+                os.remove(self.result_path)
+            except FileNotFoundError:
+                pass
+        shared_state.store.delete(JOBS_NAMESPACE, self.job_id)
+        shared_state.store.delete(CANCEL_NAMESPACE, self.job_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "query": self.sql,
+            "status": self.status,
+            "error": self.error,
+            "progress": self.progress(),
+            "columns": self.columns,
+            "row_count": self.row_count,
+            "affected_rows": self.affected_rows,
+            "result_format": "parquet" if self.result_path else ("rows" if self._rows is not None else None),
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SQLJobManager:
+    """管理 SQL 任務的排隊、並發和過期"""
+
+    def __init__(self, max_running: int, max_pending: int, ttl: float):
+        self.max_running = max_running
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, SQLJob] = {}
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _remote_jobs(self) -> List[SQLJob]:
+        """共享狀態中由其他進程運行的任務"""
+        with self._lock:
+            local = set(self._jobs)
+        records = shared_state.store.items(JOBS_NAMESPACE)
+        return [SQLJob.from_record(record) for job_id, record in records.items() if job_id not in local]
+
+    def _expire(self):
+        now = time.time()
+
+        def expired(job: SQLJob) -> bool:
+            return job.status in FINISHED_STATUSES and bool(job.finished_at) and now - job.finished_at > self.ttl
+
+        with self._lock:
+            local = [job for job in self._jobs.values() if expired(job)]
+            for job in local:
+                del self._jobs[job.job_id]
+        for job in local + [job for job in self._remote_jobs() if expired(job)]:
+            job.discard()
+
+    async def submit(self, db_path: str, sql: str, timeout: Optional[float], on_write: Callable[[str], None]) -> SQLJob:
+        """提交任務並在後台運行；排隊的任務過多時拋出 ExecutorSaturatedError"""
+        await _in_thread(self._expire)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_running)
+
+        job = SQLJob(db_path, sql, timeout, on_write)
+        with self._lock:
+            pending = sum(1 for other in self._jobs.values() if other.status == "pending")
+            if pending >= self.max_pending:
+                raise db_executor.ExecutorSaturatedError(f"排隊中的 SQL 任務已達 {self.max_pending} 個，請稍後重試")
+            self._jobs[job.job_id] = job
+        await _in_thread(job.publish)
+
+        task = asyncio.create_task(job.run(self._semaphore))
+        self._tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.job_id, None))
+        return job
+
+    async def get(self, job_id: str) -> SQLJob:
+        return await _in_thread(self._lookup, job_id)
+
+    def _lookup(self, job_id: str) -> SQLJob:
+        self._expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            record = shared_state.store.get(JOBS_NAMESPACE, job_id)
+            if record is not None:
+                job = SQLJob.from_record(record)
+        if job is None:
+            raise SQLJobNotFoundError(f"SQL 任務 '{job_id}' 不存在或已過期")
+        return job
+
+    async def remove(self, job_id: str) -> SQLJob:
+        """取消未結束的任務；已結束的任務連同結果文件一起刪除"""
+        job = await self.get(job_id)
+        if job.status in FINISHED_STATUSES:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            await _in_thread(job.discard)
+        else:
+            await job.cancel()
+        return job
+
+    async def list_jobs(self) -> List[Dict[str, Any]]:
+        return await _in_thread(self._list_jobs)
+
+    def _list_jobs(self) -> List[Dict[str, Any]]:
+        self._expire()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        jobs += self._remote_jobs()
+        return [job.to_dict() for job in sorted(jobs, key=lambda job: job.created_at, reverse=True)]
+
+    def cleanup_orphans(self):
+        """刪除共享狀態中沒有記錄的結果文件（例如進程異常退出後遺留的）"""
+        directory = os.path.join(settings.temp_dir, "sql_jobs")
+        if not os.path.isdir(directory):
+            return
+        known = set(shared_state.store.items(JOBS_NAMESPACE))
+        for name in os.listdir(directory):
+            if os.path.splitext(name)[0] not in known:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    async def shutdown(self):
+        """中斷本進程的所有任務並刪除其結果文件，其他 worker 進程的任務不受影響"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            await job.cancel()
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for job in jobs:
+            await _in_thread(job.discard)
+
+
+sql_job_manager = SQLJobManager(
+    max_running=settings.sql_job_max_running,
+    max_pending=settings.sql_job_max_pending,
+    ttl=settings.sql_job_ttl,
+)
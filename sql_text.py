@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 文本的詞法切分
+把 SQL 切分為關鍵字或標識符、字符串、帶引號的標識符、註釋、空白和符號，
+判斷語句類型或規範化查詢文本時可以跳過字符串和標識符內部的內容。
+"""
+
+import re
+from typing import Iterator, List, NamedTuple
+
+WORD = "word"
+STRING = "string"
+IDENTIFIER = "identifier"
+COMMENT = "comment"
+SPACE = "space"
+SYMBOL = "symbol"
+
+_TOKEN_PATTERN = re.compile(
+    r"(?P<space>\s+)"
+    r"|(?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))"
+    r"|(?P<string>[EeXx]?'(?:[^']|'')*(?:'|\Z))"
+    r"|(?P<dollar>\$(?P<tag>(?:[A-Za-z_][A-Za-z0-9_]*)?)\$.*?(?:\$(?P=tag)\$|\Z))"
+    r'|(?P<identifier>"(?:[^"]|"")*(?:"|\Z))'
+    r"|(?P<word>[A-Za-z_][A-Za-z0-9_$]*)"
+    r"|(?P<symbol>.)",
+    re.DOTALL
+)
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+
+    @property
+    def value(self) -> str:
+        """字符串和帶引號標識符的內容（去掉引號和轉義），其他類型返回原文"""
+        if self.kind == STRING and self.text.startswith("$"):
+            tag_end = self.text.index("$", 1) + 1
+            return self.text[tag_end:len(self.text) - tag_end]
+        if self.kind == STRING:
+            body = self.text[1:] if self.text[0] != "'" else self.text
+            return body[1:-1].replace("''", "'")
+        if self.kind == IDENTIFIER:
+            return self.text[1:-1].replace('""', '"')
+        return self.text
+
+
+def tokenize(sql: str) -> Iterator[Token]:
+    """按順序返回所有詞法單元，拼接後與原文相同"""
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        yield Token(STRING if kind == "dollar" else kind, match.group(0))
+
+
+def significant_tokens(sql: str) -> List[Token]:
+    """去掉空白和註釋後的詞法單元"""
+    return [token for token in tokenize(sql) if token.kind not in (SPACE, COMMENT)]
+
+
+def split_statements(tokens: List[Token]) -> List[List[Token]]:
+    """按字符串和標識符之外的分號切分多條語句，去掉空語句"""
+    statements: List[List[Token]] = [[]]
+    for token in tokens:
+        if token.kind == SYMBOL and token.text == ";":
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    return [statement for statement in statements if statement]
+
+
+def is_keyword(token: Token, *keywords: str) -> bool:
+    """token 是否為不帶引號的指定關鍵字（不區分大小寫）"""
+    return token.kind == WORD and token.text.upper() in keywords
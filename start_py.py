@@ -1,13 +1,31 @@
 #!/usr/bin/env python3
 """
 資料庫檢視器啟動腳本
+
+開發模式（默認）：單進程，代碼修改後自動重載。
+快速啟動（--fast）：依賴檢查結果有效時直接使用緩存，不重建目錄和配置文件。
+生產模式（--production）：多個 worker 進程，不重載。數據庫目錄、當前數據庫和 Milvus 連接參數
+保存在共享狀態存儲（STATE_DB_PATH）中，任何 worker 處理請求都看到同一狀態；
+多個 worker 時 DuckDB 文件以只讀方式打開，各進程才能同時打開同一文件。
 """
+import argparse
+import importlib.util
+import json
 import os
 import sys
 import subprocess
+import time
 import uvicorn
 from pathlib import Path
 
+# 依賴檢查結果的緩存文件，Python 解釋器或 requirements.txt 變化後失效
+DEPENDENCY_CACHE = Path(".dependency_check.json")
+
+# 包名與導入名不同的依賴項
+IMPORT_NAMES = {
+    "python-multipart": "multipart",
+}
+
 def check_python_version():
     """檢查 Python 版本"""
     if sys.version_info < (3, 8):
@@ -41,8 +59,25 @@ def setup_directories():
     
     print("✅ 目錄結構創建完成")
 
+def dependency_signature():
+    """依賴檢查結果依賴的環境：解釋器路徑、版本和 requirements.txt 的修改時間與大小"""
+    signature = {"python": sys.executable, "version": sys.version}
+    requirements = Path("requirements.txt")
+    if requirements.exists():
+        stat = requirements.stat()
+        signature["requirements"] = [stat.st_mtime_ns, stat.st_size]
+    return signature
+
+def cached_dependency_check():
+    """緩存的檢查結果仍然有效時返回 True"""
+    try:
+        cache = json.loads(DEPENDENCY_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return cache.get("ok") is True and cache.get("signature") == dependency_signature()
+
 def check_dependencies():
-    """檢查依賴項是否已安裝"""
+    """檢查依賴項是否已安裝（只查找模塊，不導入，pymilvus 等大型包不會拖慢啟動）"""
     required_packages = [
         "fastapi",
         "uvicorn", 
@@ -54,9 +89,8 @@ def check_dependencies():
     missing_packages = []
     
     for package in required_packages:
-        try:
-            __import__(package.replace("-", "_"))
-        except ImportError:
+        module = IMPORT_NAMES.get(package, package.replace("-", "_"))
+        if importlib.util.find_spec(module) is None:
             missing_packages.append(package)
     
     if missing_packages:
@@ -74,6 +108,13 @@ def check_dependencies():
     else:
         print("✅ 所有依賴項已安裝")
     
+    try:
+        DEPENDENCY_CACHE.write_text(
+            json.dumps({"ok": True, "signature": dependency_signature(), "checked_at": time.time()}),
+            encoding="utf-8"
+        )
+    except OSError:
+        pass
     return True
 
 def create_basic_files():
@@ -103,8 +144,32 @@ TEMP_DIR=./temp
         Path(".env").write_text(env_content)
         print("✅ 創建 .env 配置文件")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="資料庫檢視器啟動腳本")
+    parser.add_argument("--fast", action="store_true", help="快速啟動：使用緩存的依賴檢查結果，跳過目錄和配置文件的創建")
+    parser.add_argument("--production", action="store_true", help="生產模式：多個 worker 進程，不自動重載")
+    parser.add_argument("--workers", type=int, default=None, help="生產模式的 worker 進程數，默認使用 WORKERS 配置，0 表示 CPU 核心數")
+    return parser.parse_args()
+
+def production_workers(requested):
+    """確定 worker 數；多於一個時設置只讀模式，worker 進程從環境變量讀取"""
+    from config_py import settings
+    
+    workers = settings.workers if requested is None else requested
+    workers = workers or os.cpu_count() or 1
+    os.environ["WORKERS"] = str(workers)
+    if workers > 1:
+        if not settings.duckdb_read_only:
+            print("ℹ️  多個 worker 進程共享數據庫文件，DuckDB 將以只讀方式打開（寫入語句和快照需在單進程模式下執行）")
+        os.environ["DUCKDB_READ_ONLY"] = "True"
+    return workers
+
 def main():
     """主啟動函數"""
+    launched = time.perf_counter()
+    # 後端據此計算從執行啟動腳本到可以處理請求的時間
+    os.environ["DB_VIEWER_LAUNCHED_AT"] = str(time.time())
+    args = parse_args()
     print("🚀 啟動資料庫檢視器...")
     print("=" * 50)
     
@@ -112,31 +177,40 @@ def main():
     check_python_version()
     
     # 檢查依賴項
-    if not check_dependencies():
+    if args.fast and cached_dependency_check():
+        print("✅ 依賴項檢查結果有效（緩存）")
+    elif not check_dependencies():
         sys.exit(1)
     
-    # 設置目錄結構
-    setup_directories()
+    if not args.fast:
+        # 設置目錄結構
+        setup_directories()
+        
+        # 創建基本文件
+        create_basic_files()
     
-    # 創建基本文件
-    create_basic_files()
+    workers = production_workers(args.workers) if args.production else 1
     
     print("=" * 50)
     print("🌐 啟動 FastAPI 服務器...")
     print("📍 服務器地址: http://localhost:8000")
     print("📚 API 文檔: http://localhost:8000/docs")
     print("🏥 健康檢查: http://localhost:8000/health")
+    if args.production:
+        print(f"🏭 生產模式: {workers} 個 worker 進程")
+    print(f"⏱️  啟動腳本耗時: {time.perf_counter() - launched:.3f} 秒（服務啟動耗時見 /health 的 startup_timings）")
     print("=" * 50)
     
-    # 啟動服務器
+    # 啟動服務器（生產模式不重載；reload 與多個 worker 不能同時使用）
     try:
         uvicorn.run(
             "main:app",
             host="0.0.0.0",
             port=8000,
-            reload=True,
+            reload=not args.production,
+            workers=workers,
             log_level="info",
-            access_log=True
+            access_log=not args.production
         )
     except KeyboardInterrupt:
         print("\n👋 服務器已停止")
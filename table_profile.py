@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+表格列分析
+以 DuckDB 的 SUMMARIZE 計算每列的類型、最小值、最大值、均值、標準差和空值比例，
+再用一次掃描計算去重數、分位數和直方圖：數值和日期時間列在最小值到最大值之間等寬分箱，
+低基數列（去重數不超過分箱數）按取值計數。
+
+exact 模式掃描整張表，去重數（COUNT DISTINCT）和分位數（quantile_cont）為精確值；
+sampled 模式在 TABLESAMPLE 抽取的 reservoir 樣本上計算，使用 approx_count_distinct 和
+approx_quantile，大表也能很快返回。樣本使用 reservoir 而不是 system 抽樣：system 按數據塊抽取，
+對按時間或 id 順序寫入的表偏差很大。行數不超過樣本大小的表直接分析整張表。
+"""
+
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+PROFILE_MODES = ("sampled", "exact")
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+INTEGER_TYPES = (
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT",
+)
+FLOAT_TYPES = ("FLOAT", "DOUBLE", "DECIMAL")
+TEMPORAL_TYPES = ("DATE", "TIMESTAMP")
+# 採樣的隨機種子，同一文件的重複分析盡量抽取相同的樣本
+SAMPLE_SEED = 42
+
+
+def column_kind(column_type: str) -> str:
+    """integer、numeric、temporal 或 other；DECIMAL(18,2)、TIMESTAMP WITH TIME ZONE 等按前綴判斷"""
+    base = column_type.split("(")[0].strip().upper()
+    if base in INTEGER_TYPES:
+        return "integer"
+    if base in FLOAT_TYPES:
+        return "numeric"
+    if base.startswith(TEMPORAL_TYPES):
+        return "temporal"
+    return "other"
+
+
+def _parse_percentage(text: Optional[str]) -> Optional[float]:
+    if text is None:
+        return None
+    return float(str(text).rstrip("%"))
+
+
+def _parse_number(text: Optional[str]) -> Optional[float]:
+    return None if text is None else float(text)
+
+
+def _bin_plan(conn, column: Dict[str, Any], kind: str, bins: int) -> Optional[Tuple[float, float, int, str]]:
+    """等寬分箱的 (下限, 箱寬, 箱數, 取值表達式)；沒有非空值或只有一個值時返回 None"""
+    if column["min"] is None or column["max"] is None:
+        return None
+    quoted = f'"{column["name"]}"'
+    if kind == "temporal":
+        # 日期時間列按 epoch 秒分箱，邊界由 SUMMARIZE 返回的文本轉換
+        low, high = conn.execute(
+            f"SELECT epoch(CAST(? AS {column['type']})), epoch(CAST(? AS {column['type']}))",
+            [column["min"], column["max"]]
+        ).fetchone()
+        value = f"epoch({quoted})"
+    else:
+        low, high = float(column["min"]), float(column["max"])
+        value = f"CAST({quoted} AS DOUBLE)"
+    if high <= low:
+        return None
+    if kind == "integer" and high - low + 1 <= bins:
+        # 取值範圍小於分箱數的整數列每個整數一箱
+        return low, 1.0, int(high - low) + 1, value
+    return low, (high - low) / bins, bins, value
+
+
+def _histogram(counts: Optional[Dict[str, List[Any]]]) -> List[Tuple[Any, int]]:
+    # DuckDB 的 histogram() 返回 {"key": [...], "value": [...]} 形式的 MAP
+    if not counts:
+        return []
+    return list(zip(counts["key"], counts["value"]))
+
+
+def profile_table(
+    conn,
+    table_name: str,
+    mode: str,
+    bins: int,
+    sample_rows: int,
+    row_count: int,
+    columns: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """分析表中的列（columns 為空時分析所有列），row_count 用於判斷是否需要採樣"""
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"不支持的分析模式: {mode}，可選: {', '.join(PROFILE_MODES)}")
+
+    select_list = "*"
+    if columns:
+        available = [desc[0] for desc in conn.execute(f"SELECT * FROM {table_name} LIMIT 0").description]
+        missing = [name for name in columns if name not in available]
+        if missing:
+            raise ValueError(f"列不存在: {', '.join(missing)}")
+        # 只掃描選中的列，保持表中的列順序
+        select_list = ", ".join(f'"{name}"' for name in available if name in columns)
+
+    sampled = mode == "sampled" and row_count > sample_rows
+    if not sampled:
+        return _profile_source(conn, f"(SELECT {select_list} FROM {table_name})", bins, sampled)
+
+    # 樣本寫入當前連接的臨時表（只讀數據庫也可以創建），兩次掃描只需抽樣一次
+    sample_table = f"profile_sample_{uuid.uuid4().hex}"
+    conn.execute(
+        f"CREATE TEMP TABLE {sample_table} AS SELECT {select_list} FROM {table_name} "
+        f"TABLESAMPLE reservoir({int(sample_rows)} ROWS) REPEATABLE ({SAMPLE_SEED})"
+    )
+    try:
+        return _profile_source(conn, sample_table, bins, sampled)
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {sample_table}")
+
+
+def _profile_source(conn, source: str, bins: int, sampled: bool) -> Dict[str, Any]:
+    """分析 source（表名或子查詢）中的所有列"""
+    summary = conn.execute(f"SUMMARIZE SELECT * FROM {source}")
+    names = [desc[0] for desc in summary.description]
+    stats = [dict(zip(names, row)) for row in summary.fetchall()]
+
+    profiled = []
+    kinds = []
+    for row in stats:
+        kind = column_kind(row["column_type"])
+        kinds.append(kind)
+        profiled.append({
+            "name": row["column_name"],
+            "type": row["column_type"],
+            "kind": "numeric" if kind == "integer" else kind,
+            "count": row["count"],
+            "null_percentage": _parse_percentage(row["null_percentage"]),
+            "min": row["min"],
+            "max": row["max"],
+            "avg": _parse_number(row["avg"]),
+            "std": _parse_number(row["std"]),
+            "approx_unique": int(row["approx_unique"]) if row["approx_unique"] is not None else None,
+        })
+
+    # 第二次掃描：每列的去重數、數值列的分位數和直方圖
+    distinct_func = "approx_count_distinct({})" if sampled else "COUNT(DISTINCT {})"
+    quantile_func = "approx_quantile({}, {})" if sampled else "quantile_cont({}, {})"
+    quantile_list = "[" + ", ".join(str(q) for q in QUANTILES) + "]"
+    expressions = []
+    plans = []
+    for column, kind in zip(profiled, kinds):
+        quoted = f'"{column["name"]}"'
+        expressions.append(distinct_func.format(quoted))
+        if kind in ("integer", "numeric"):
+            expressions.append(quantile_func.format(f"CAST({quoted} AS DOUBLE)", quantile_list))
+
+        plan = _bin_plan(conn, column, kind, bins) if kind in ("integer", "numeric", "temporal") else None
+        plans.append(plan)
+        if plan is not None:
+            low, width, count, value = plan
+            # LEAST 和 GREATEST 忽略 NULL，空值需要先排除，否則會計入最後一箱
+            expressions.append(
+                f"histogram(GREATEST(0, LEAST(CAST(floor(({value} - {low!r}) / {width!r}) AS INTEGER), {count - 1}))) "
+                f"FILTER (WHERE {quoted} IS NOT NULL)"
+            )
+        elif column["approx_unique"] is not None and column["approx_unique"] <= bins:
+            expressions.append(f"histogram({quoted})")
+
+    values = list(conn.execute(f"SELECT {', '.join(expressions)} FROM {source}").fetchone()) if expressions else []
+
+    position = 0
+    for column, kind, plan in zip(profiled, kinds, plans):
+        column["distinct"] = values[position]
+        column["distinct_exact"] = not sampled
+        position += 1
+        if kind in ("integer", "numeric"):
+            quantiles = values[position] or [None] * len(QUANTILES)
+            column["quantiles"] = {f"p{int(q * 100):02d}": value for q, value in zip(QUANTILES, quantiles)}
+            position += 1
+
+        if plan is not None:
+            low, width, count, _ = plan
+            counts = dict(_histogram(values[position]))
+            position += 1
+            column["histogram"] = {
+                "type": "bins",
+                "unit": "epoch_seconds" if kind == "temporal" else None,
+                "bins": [
+                    {"lower": low + width * index, "upper": low + width * (index + 1), "count": counts.get(index, 0)}
+                    for index in range(count)
+                ],
+            }
+        elif column["approx_unique"] is not None and column["approx_unique"] <= bins:
+            counts = _histogram(values[position])
+            position += 1
+            column["histogram"] = {
+                "type": "values",
+                "values": [
+                    {"value": value, "count": count}
+                    for value, count in sorted(counts, key=lambda item: item[1], reverse=True)
+                ],
+            }
+        else:
+            column["histogram"] = None
+
+    return {
+        "sampled": sampled,
+        "profiled_rows": profiled[0]["count"] if profiled else 0,
+        "bins": bins,
+        "columns": profiled,
+    }
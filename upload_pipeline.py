@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+DuckDB 文件上傳管道
+上傳內容按大塊寫入磁碟，寫入的同時計算 SHA-256 並檢查大小上限，超出上限立即中止；
+收到文件頭後立即檢查 DuckDB 標記，無效文件不必等到整個上傳完成才被拒絕。
+單次上傳的 multipart 請求體邊接收邊解析，文件內容直接寫入目標臨時文件，只寫一次磁碟。
+
+大文件可以通過上傳會話分塊上傳：每塊帶上偏移量追加到同一個臨時文件，
+連接中斷後查詢已接收的位元組數即可從斷點繼續。會話信息保存在 JSON 文件中，
+服務重啟後仍可繼續上傳。多個 worker 進程共享會話文件，正在寫入的會話以 .part 文件上的
+flock 排他鎖標記，同一會話同時只有一個請求（無論在哪個進程）可以寫入。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，寫入標記只在本進程內生效
+    fcntl = None
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from config_py import settings
+
+logger = logging.getLogger(__name__)
+
+# DuckDB 文件頭：第 8 到 12 個位元組為 "DUCK"
+DUCKDB_MAGIC = b"DUCK"
+MAGIC_OFFSET = 8
+HEADER_SIZE = MAGIC_OFFSET + len(DUCKDB_MAGIC)
+
+# multipart 請求中除文件內容外的邊界和字段頭所允許的位元組數
+MULTIPART_OVERHEAD = 65536
+
+
+class UploadTooLargeError(Exception):
+    """上傳內容超過大小上限"""
+
+
+class InvalidDatabaseFileError(Exception):
+    """上傳內容不是 DuckDB 數據庫文件"""
+
+
+class InvalidUploadRequestError(Exception):
+    """上傳請求格式錯誤，例如不是 multipart 請求或缺少文件字段"""
+
+
+class UploadSessionNotFoundError(Exception):
+    """上傳會話不存在或已過期"""
+
+
+class UploadConflictError(Exception):
+    """偏移量與已接收的位元組數不一致，或同一會話正在寫入"""
+
+    def __init__(self, message: str, received: int):
+        super().__init__(message)
+        self.received = received
+
+
+def format_size(size: int) -> str:
+    return f"{size / 1048576:.1f}MB"
+
+
+def _in_thread(func, *args):
+    # 文件寫入和哈希計算放到默認線程池，不阻塞事件循環，也不佔用數據庫執行器
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class HashingWriter:
+    """邊寫入邊計算 SHA-256 的文件寫入器
+
+    size 為文件中已有的位元組數（續傳時非零）；hasher 為 None 時不計算哈希，
+    由調用方在完成後重新計算。
+    """
+
+    def __init__(self, path: str, max_size: int, size: int = 0, hasher=None):
+        self.path = path
+        self.max_size = max_size
+        self.size = size
+        self.hasher = hasher
+        self._header = b""
+        if 0 < size < HEADER_SIZE:
+            with open(path, "rb") as f:
+                self._header = f.read(size)
+        self._file = open(path, "ab" if size else "wb", buffering=settings.upload_chunk_size)
+
+    def write(self, data: bytes):
+        if self.size + len(data) > self.max_size:
+            raise UploadTooLargeError(f"文件大小超過上限 {format_size(self.max_size)}")
+        if self.size < HEADER_SIZE:
+            self._header += data[:HEADER_SIZE - self.size]
+            if len(self._header) >= HEADER_SIZE and self._header[MAGIC_OFFSET:HEADER_SIZE] != DUCKDB_MAGIC:
+                raise InvalidDatabaseFileError("文件不是有效的 DuckDB 數據庫")
+        if self.hasher is not None:
+            self.hasher.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self._file.close()
+
+    def check_complete(self):
+        if self.size < HEADER_SIZE:
+            raise InvalidDatabaseFileError("文件不是有效的 DuckDB 數據庫")
+
+
+def file_sha256(path: str) -> str:
+    """按塊讀取文件計算 SHA-256"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(settings.upload_chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class MultipartFileReceiver:
+    """邊接收邊解析 multipart/form-data 請求體，將指定字段的文件內容寫入 HashingWriter
+
+    不經過 Starlette 的表單解析（它先把整個請求體寫入臨時文件），文件只寫一次磁碟；
+    大小上限在接收過程中檢查，沒有 Content-Length 的請求（分塊傳輸編碼）同樣受約束。
+    其他字段被忽略。
+    """
+
+    def __init__(self, content_type: str, field: str = "file"):
+        media_type, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise InvalidUploadRequestError("請求必須是帶 boundary 的 multipart/form-data")
+        self.field = field
+        self.filename: Optional[str] = None
+        self.found = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._in_file = False
+        self._buffer = bytearray()
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    # ---------- 解析器回調（在事件循環中同步調用） ----------
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._in_file = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        # 只接收第一個帶文件名的同名字段
+        if name == self.field and filename is not None and not self.found:
+            self.found = True
+            self._in_file = True
+            self.filename = filename.decode("utf-8", "replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._buffer += data[start:end]
+
+    def _on_part_end(self):
+        self._in_file = False
+
+    async def _flush(self, writer: HashingWriter):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        await _in_thread(writer.write, data)
+
+    async def receive(
+        self,
+        chunks: AsyncIterator[bytes],
+        path: str,
+        max_size: int,
+        check_filename: Callable[[Optional[str]], str],
+    ) -> Tuple[str, int, str]:
+        """接收請求體並寫入 path，返回 (文件名, 大小, SHA-256)；失敗時刪除已寫入的部分
+
+        check_filename 在讀到文件字段的頭後調用，返回保存用的文件名，拋出的異常中止上傳。
+        """
+        writer: Optional[HashingWriter] = None
+        filename = None
+        received = 0
+        try:
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > max_size + MULTIPART_OVERHEAD:
+                    raise UploadTooLargeError(f"文件大小超過上限 {format_size(max_size)}")
+                try:
+                    self._parser.write(chunk)
+                except MultipartParseError as e:
+                    raise InvalidUploadRequestError(f"multipart 請求格式錯誤: {str(e)}")
+
+                if writer is None and self.found:
+                    filename = check_filename(self.filename)
+                    writer = await _in_thread(HashingWriter, path, max_size, 0, hashlib.sha256())
+                if writer is None:
+                    continue
+                # 文件頭一到達就寫入，無效文件在第一塊就被拒絕；之後按 upload_chunk_size 聚合寫入
+                if len(self._buffer) >= settings.upload_chunk_size or (
+                    writer.size < HEADER_SIZE and len(self._buffer) >= HEADER_SIZE
+                ):
+                    await self._flush(writer)
+
+            self._parser.finalize()
+            if writer is None:
+                raise InvalidUploadRequestError(f"請在 {self.field} 字段中提供 DuckDB 文件")
+            if self._buffer:
+                await self._flush(writer)
+            writer.check_complete()
+        except BaseException:
+            if writer is not None:
+                await _in_thread(writer.close)
+                os.remove(path)
+            raise
+        await _in_thread(writer.close)
+        return filename, writer.size, writer.hasher.hexdigest()
+
+
+class UploadSessionManager:
+    """分塊上傳會話，每個會話對應 directory 下的一個 .part 文件和一個 .json 文件"""
+
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        # 本進程寫入後的 (文件大小, 哈希狀態)；其他進程追加過或服務重啟後大小不一致，完成時重新計算
+        self._hashers: Dict[str, Tuple[int, Any]] = {}
+        # 本進程正在寫入的會話及持有 flock 的文件描述符
+        self._writing: Dict[str, Optional[int]] = {}
+
+    def temp_path(self, name: str) -> str:
+        """上傳目錄下的臨時文件路徑，與最終文件位於同一文件系統，可以原子重命名"""
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, name)
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _save(self, session: Dict[str, Any]):
+        meta = {key: value for key, value in session.items() if key != "received"}
+        tmp_path = f"{self._meta_path(session['upload_id'])}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(session["upload_id"]))
+
+    def _acquire(self, upload_id: str) -> bool:
+        """標記會話正在寫入；本進程或其他 worker 進程已在寫入時返回 False"""
+        with self._lock:
+            if upload_id in self._writing:
+                return False
+            fd = None
+            if fcntl is not None:
+                try:
+                    fd = os.open(self._part_path(upload_id), os.O_RDONLY)
+                except OSError:
+                    raise UploadSessionNotFoundError(f"上傳會話 '{upload_id}' 不存在或已過期")
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)
+                    return False
+            self._writing[upload_id] = fd
+            return True
+
+    def _release(self, upload_id: str):
+        with self._lock:
+            fd = self._writing.pop(upload_id, None)
+        if fd is not None:
+            # 關閉文件描述符即釋放 flock
+            os.close(fd)
+
+    def _discard(self, upload_id: str):
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+            self._hashers.pop(upload_id, None)
+        for path in (self._part_path(upload_id), self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cleanup_expired(self):
+        """刪除超過 ttl 秒未更新的會話"""
+        if not os.path.isdir(self.directory):
+            return
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            upload_id = name[:-len(".json")]
+            try:
+                session = self.get(upload_id)
+                if now - session["updated_at"] <= self.ttl or not self._acquire(upload_id):
+                    # 未過期，或正在寫入（可能在其他進程中）
+                    continue
+            except UploadSessionNotFoundError:
+                continue
+            try:
+                logger.info(f"上傳會話 {upload_id} 已過期，刪除臨時文件")
+                self._discard(upload_id)
+            finally:
+                self._release(upload_id)
+
+    def create(self, filename: str, size: int, max_size: int) -> Dict[str, Any]:
+        """創建上傳會話，size 為文件的總位元組數"""
+        if size > max_size:
+            raise UploadTooLargeError(f"文件大小 {format_size(size)} 超過上限 {format_size(max_size)}")
+        self.cleanup_expired()
+
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        session = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "size": size,
+            "created_at": now,
+            "updated_at": now,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        open(self._part_path(upload_id), "wb").close()
+        self._save(session)
+        with self._lock:
+            self._sessions[upload_id] = session
+            self._hashers[upload_id] = (0, hashlib.sha256())
+        return {**session, "received": 0}
+
+    def get(self, upload_id: str) -> Dict[str, Any]:
+        """返回會話信息，received 以 .part 文件的實際大小為準"""
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            try:
+                with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                    session = json.load(f)
+            except (OSError, ValueError):
+                raise UploadSessionNotFoundError(f"上傳會話 '{upload_id}' 不存在或已過期")
+            with self._lock:
+                session = self._sessions.setdefault(upload_id, session)
+        try:
+            received = os.path.getsize(self._part_path(upload_id))
+        except OSError:
+            raise UploadSessionNotFoundError(f"上傳會話 '{upload_id}' 不存在或已過期")
+        return {**session, "received": received}
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """從 offset 開始追加請求體，按 upload_chunk_size 聚合後在線程中寫入
+
+        offset 必須等於已接收的位元組數；寫入失敗或連接中斷時，已寫入的部分保留，
+        客戶端可以查詢會話後從新的偏移量繼續。
+        """
+        session = self.get(upload_id)
+        if not await _in_thread(self._acquire, upload_id):
+            raise UploadConflictError("該上傳會話正在寫入", session["received"])
+        try:
+            # 取得寫入標記後重新讀取，其他進程可能剛追加過
+            session = self.get(upload_id)
+            if offset != session["received"]:
+                raise UploadConflictError(
+                    f"偏移量 {offset} 與已接收的位元組數 {session['received']} 不一致", session["received"]
+                )
+            with self._lock:
+                saved = self._hashers.pop(upload_id, None)
+            hasher = saved[1] if saved is not None and saved[0] == offset else None
+            if offset == 0:
+                hasher = hashlib.sha256()
+            writer = HashingWriter(self._part_path(upload_id), session["size"], offset, hasher)
+            buffer = bytearray()
+            try:
+                async for chunk in chunks:
+                    buffer += chunk
+                    if len(buffer) >= settings.upload_chunk_size:
+                        await _in_thread(writer.write, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await _in_thread(writer.write, bytes(buffer))
+                # 只有成功寫完的請求才保留哈希狀態，否則文件中可能有未計入哈希的內容
+                with self._lock:
+                    if writer.hasher is not None:
+                        self._hashers[upload_id] = (writer.size, writer.hasher)
+            finally:
+                await _in_thread(writer.close)
+        finally:
+            await _in_thread(self._release, upload_id)
+
+        with self._lock:
+            stored = self._sessions.setdefault(upload_id, session)
+            stored["updated_at"] = time.time()
+        await _in_thread(self._save, stored)
+        return self.get(upload_id)
+
+    def complete(self, upload_id: str) -> Tuple[Dict[str, Any], str, str]:
+        """結束會話，返回 (會話信息, .part 文件路徑, SHA-256)；由調用方移動或刪除 .part 文件"""
+        session = self.get(upload_id)
+        if not self._acquire(upload_id):
+            raise UploadConflictError("該上傳會話正在寫入", session["received"])
+        try:
+            session = self.get(upload_id)
+            if session["received"] != session["size"]:
+                raise UploadConflictError(
+                    f"上傳尚未完成：已接收 {session['received']} / {session['size']} 位元組", session["received"]
+                )
+            part_path = self._part_path(upload_id)
+            with self._lock:
+                saved = self._hashers.pop(upload_id, None)
+                self._sessions.pop(upload_id, None)
+            if session["size"] < HEADER_SIZE:
+                raise InvalidDatabaseFileError("文件不是有效的 DuckDB 數據庫")
+            if saved is not None and saved[0] == session["size"]:
+                digest = saved[1].hexdigest()
+            else:
+                digest = file_sha256(part_path)
+            os.remove(self._meta_path(upload_id))
+        finally:
+            self._release(upload_id)
+        return session, part_path, digest
+
+    def abort(self, upload_id: str):
+        """取消會話並刪除臨時文件"""
+        self.get(upload_id)
+        self._discard(upload_id)
+
+
+upload_sessions = UploadSessionManager(
+    os.path.join(settings.upload_dir, "partial"), settings.upload_session_ttl
+)
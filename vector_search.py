@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+DuckDB 向量精確搜索
+按塊讀取 DuckDB 的 Arrow 輸出，在線程池中用 NumPy 計算每塊的 top-k，
+再用堆合併各塊的候選結果。同時在途的塊數不超過線程數，內存佔用與表大小無關。
+"""
+
+import heapq
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config_py import settings
+from pagination import ROWID_ALIAS, supports_rowid
+from result_stream import pa
+
+logger = logging.getLogger(__name__)
+
+METRIC_TYPES = ("L2", "IP", "COSINE")
+
+# NumPy 矩陣運算會釋放 GIL，多個塊可以在不同核心上並行計算
+_search_threads = settings.vector_search_threads or os.cpu_count() or 1
+_search_executor = ThreadPoolExecutor(max_workers=_search_threads, thread_name_prefix="vector-search")
+
+Candidate = Tuple[float, int, Dict[str, Any]]
+
+
+def _block_matrix(column, dim: int) -> np.ndarray:
+    """將 Arrow 列表列轉換為 (行數, dim) 的 float32 矩陣"""
+    if pa.types.is_fixed_size_list(column.type):
+        if column.type.list_size != dim:
+            raise ValueError(f"向量維度不匹配：列維度為 {column.type.list_size}，查詢向量維度為 {dim}")
+    elif pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+        lengths = np.diff(column.offsets.to_numpy())
+        if len(lengths) and (lengths != dim).any():
+            raise ValueError(f"向量維度不匹配：列中存在維度不等於 {dim} 的向量")
+    else:
+        raise ValueError(f"列類型 {column.type} 不是向量（數組）類型")
+    values = column.flatten().to_numpy(zero_copy_only=False)
+    return values.astype(np.float32, copy=False).reshape(-1, dim)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def distance_keys(queries: np.ndarray, matrix: np.ndarray, metric_type: str) -> np.ndarray:
+    """排序鍵矩陣 (查詢數, 行數)，越小越相似：L2 為平方距離，IP 和 COSINE 為相似度取負"""
+    if metric_type == "COSINE":
+        queries = _normalize(queries)
+        matrix = _normalize(matrix)
+    products = queries @ matrix.T
+    if metric_type == "L2":
+        query_norms = (queries ** 2).sum(axis=1)[:, None]
+        return np.maximum(query_norms - 2 * products + (matrix ** 2).sum(axis=1)[None, :], 0)
+    return -products
+
+
+class ExactSearch:
+    """一次精確 top-k 搜索"""
+
+    def __init__(
+        self,
+        queries: List[List[float]],
+        vector_column: str,
+        limit: int,
+        metric_type: str,
+        output_fields: List[str],
+    ):
+        metric_type = metric_type.upper()
+        if metric_type not in METRIC_TYPES:
+            raise ValueError(f"不支持的度量類型: {metric_type}，可選: {', '.join(METRIC_TYPES)}")
+        if not queries:
+            raise ValueError("查詢向量不能為空")
+        dims = {len(vector) for vector in queries}
+        if len(dims) != 1 or 0 in dims:
+            raise ValueError("所有查詢向量的維度必須相同且不為空")
+
+        self.vector_column = vector_column
+        self.limit = limit
+        self.metric_type = metric_type
+        self.output_fields = output_fields
+        self.dim = dims.pop()
+        self.queries = np.asarray(queries, dtype=np.float32)
+        # 每個查詢一個大小為 limit 的堆，堆頂是當前最差的候選（鍵取負值）
+        self._heaps: List[List[Candidate]] = [[] for _ in range(len(queries))]
+        self.scanned_rows = 0
+
+    def _score_block(self, batch, first_position: int) -> List[List[Candidate]]:
+        """計算一個塊中每個查詢的 top-k，返回 (排序鍵, 行號, 行數據) 列表；鍵越小越相似"""
+        matrix = _block_matrix(batch.column(self.vector_column), self.dim)
+        keys = distance_keys(self.queries, matrix, self.metric_type)
+
+        k = min(self.limit, keys.shape[1])
+        if k < keys.shape[1]:
+            top = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(k), (keys.shape[0], k))
+
+        ids = batch.column(ROWID_ALIAS).to_numpy() if ROWID_ALIAS in batch.schema.names else None
+        output = batch.select(self.output_fields)
+        results = []
+        for query_index, indices in enumerate(top):
+            rows = output.take(pa.array(indices)).to_pylist()
+            results.append([
+                (
+                    float(keys[query_index, index]),
+                    int(ids[index]) if ids is not None else first_position + int(index),
+                    row,
+                )
+                for index, row in zip(indices, rows)
+            ])
+        return results
+
+    def _merge(self, block_results: List[List[Candidate]]):
+        for heap, candidates in zip(self._heaps, block_results):
+            for key, row_id, row in candidates:
+                item = (-key, -row_id, row)
+                if len(heap) < self.limit:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+    def run(self, reader):
+        """消費 RecordBatchReader，同時最多有線程數個塊在計算"""
+        pending = set()
+        position = 0
+        try:
+            for batch in reader:
+                if batch.num_rows == 0:
+                    continue
+                if len(pending) >= _search_threads:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._merge(future.result())
+                pending.add(_search_executor.submit(self._score_block, batch, position))
+                position += batch.num_rows
+            for future in pending:
+                self._merge(future.result())
+        finally:
+            for future in pending:
+                future.cancel()
+        self.scanned_rows = position
+
+    def results(self) -> List[List[Dict[str, Any]]]:
+        """按相似度排序的結果；L2 返回距離，IP 和 COSINE 返回相似度（越大越相似）"""
+        formatted = []
+        for heap in self._heaps:
+            hits = []
+            for neg_key, neg_id, row in sorted(heap, reverse=True):
+                key = -neg_key
+                hits.append({
+                    "id": -neg_id,
+                    "distance": key if self.metric_type == "L2" else -key,
+                    "entity": row,
+                })
+            formatted.append(hits)
+        return formatted
+
+
+def search_table(
+    conn,
+    table_name: str,
+    vector_column: str,
+    queries: List[List[float]],
+    limit: int,
+    metric_type: str = "L2",
+    output_fields: Optional[List[str]] = None,
+    filter_expr: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """在表格的數組列上執行精確 top-k 搜索
+
+    columns 為表格的列名列表，output_fields 未指定時返回除向量列以外的所有列。
+    實體表的結果 id 為 rowid，視圖為掃描順序中的行位置。
+    """
+    if columns is not None:
+        if vector_column not in columns:
+            raise ValueError(f"列 '{vector_column}' 不存在")
+        if output_fields is None:
+            output_fields = [name for name in columns if name != vector_column]
+        missing = [name for name in output_fields if name not in columns]
+        if missing:
+            raise ValueError(f"輸出字段不存在: {', '.join(missing)}")
+    output_fields = output_fields or []
+
+    search = ExactSearch(queries, vector_column, limit, metric_type, output_fields)
+
+    select_columns = [f'"{name}"' for name in dict.fromkeys([vector_column] + output_fields)]
+    if supports_rowid(conn, table_name):
+        select_columns.insert(0, f"rowid AS {ROWID_ALIAS}")
+    where = f'"{vector_column}" IS NOT NULL'
+    if filter_expr:
+        where += f" AND ({filter_expr})"
+
+    conn.execute(f"SELECT {', '.join(select_columns)} FROM {table_name} WHERE {where}")
+    reader = conn.fetch_record_batch(settings.vector_search_block_rows)
+    search.run(reader)
+
+    return {
+        "metric_type": search.metric_type,
+        "scanned_rows": search.scanned_rows,
+        "search_results": search.results(),
+    }
+
+
+def shutdown():
+    """停止計算線程池"""
+    _search_executor.shutdown(wait=False, cancel_futures=True)